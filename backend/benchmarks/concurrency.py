@@ -0,0 +1,256 @@
+"""
+Requests per second one server process sustains under concurrent clients, sync WSGI profile vs ASGI profile.
+
+For each profile (see gunicorn.conf.py) a gunicorn server with a single worker is started on the configured
+database, and every scenario of SCENARIOS runs at each concurrency level: `concurrency` clients send requests back
+to back until `requests` have been answered. Reads carry a unique query parameter, so every request misses the page
+cache and reaches the database. The TMDB bound scenario creates movies with only a title, against a local TMDB
+stand-in that answers after `--tmdb-delay` seconds, and deletes them afterwards.
+
+The results are written as JSON, so runs can be compared.
+
+Usage (from backend/): python -m benchmarks.concurrency [--profiles wsgi,asgi] [--concurrency 1,8,32]
+                           [--requests 200] [--tmdb-delay 0.2] [--output concurrency.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import django
+import httpx
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'open_movies_api.settings')
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+from movies.models import Actor, Director, Movie  # noqa: E402
+from benchmarks.endpoints import git_revision  # noqa: E402
+
+TITLE_PREFIX = 'Concurrency benchmark'
+USERNAME = 'concurrency-benchmark'
+
+
+class StubTMDB(ThreadingHTTPServer):
+    """TMDB stand-in answering every search with a movie of the searched title after `delay` seconds"""
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        time.sleep(self.server.delay)
+
+        if url.path == '/genre/movie/list':
+            body = {'genres': [{'id': 18, 'name': 'Drama'}]}
+        else:
+            title = parse_qs(url.query)['query'][0]
+            body = {'results': [{'title': title, 'release_date': '2020-01-01', 'genre_ids': [18],
+                                 'vote_average': 7.5, 'overview': 'Benchmark', 'poster_path': '/poster.jpg'}]}
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def movie_page(ctx, n):
+    return 'GET', f'/api/movies/?page_size=20&bench={n}', None
+
+
+def movie_detail(ctx, n):
+    return 'GET', f'/api/movies/{random.choice(ctx["movie_ids"])}/?bench={n}', None
+
+
+def director_detail(ctx, n):
+    return 'GET', f'/api/directors/{random.choice(ctx["director_ids"])}/?bench={n}', None
+
+
+def create_from_tmdb(ctx, n):
+    data = {'title': f'{TITLE_PREFIX} {ctx["run"]} {n}', 'director': ctx['director_ids'][0],
+            'actors_id': ctx['actor_ids'][:2]}
+    return 'POST', '/api/movies/', data
+
+
+SCENARIOS = {
+    'movies-page': movie_page,
+    'movie-detail': movie_detail,
+    'director-detail': director_detail,
+    # the request waits on TMDB for most of its time
+    'movie-create-tmdb': create_from_tmdb,
+}
+
+
+def start_server(profile, port, tmdb_url, metrics_dir):
+    env = {
+        **os.environ,
+        'SERVER_PROFILE': profile,
+        'TMDB_BASE_URL': tmdb_url,
+        'TMDB_API_KEY': 'benchmark',
+        'DEBUG': 'False',
+        'SERVER_TIMING': 'off',
+        'SLOW_QUERY_MS': '0',
+        # no catalog stats refresh in the middle of a run
+        'CATALOG_STATS_REFRESH_DELAY': '0',
+        'PROMETHEUS_MULTIPROC_DIR': metrics_dir,
+    }
+    process = subprocess.Popen(
+        ['gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', '--workers', '1', '--log-level', 'warning'],
+        env=env,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/metrics/', timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError(f'{profile} server did not start')
+
+
+async def run_scenario(base_url, headers, scenario, ctx, concurrency, total):
+    latencies = []
+    errors = 0
+    sent = iter(range(total))
+
+    async def client(http):
+        nonlocal errors
+        for n in sent:
+            method, path, data = scenario(ctx, n)
+            start = time.perf_counter()
+            response = await http.request(method, path, json=data)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=120) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(http) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def benchmark_profile(profile, port, args, ctx, tmdb_url):
+    headers = {
+        # DEBUG=False redirects plain http, the servers trust X-Forwarded-Proto from localhost
+        'X-Forwarded-Proto': 'https',
+        'Authorization': f'Bearer {ctx["token"]}',
+    }
+    results = []
+
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        process = start_server(profile, port, tmdb_url, metrics_dir)
+        try:
+            for name, scenario in SCENARIOS.items():
+                for concurrency in args.concurrency:
+                    # titles no earlier run created, so every lookup misses the TMDB cache
+                    ctx['run'] = f'{profile}-{concurrency}-{ctx["started"]}'
+                    total = args.requests if name != 'movie-create-tmdb' else min(args.requests, concurrency * 10)
+                    result = asyncio.run(run_scenario(
+                        f'http://127.0.0.1:{port}', headers, scenario, ctx, concurrency, total
+                    ))
+                    result = {'profile': profile, 'scenario': name, 'concurrency': concurrency, **result}
+                    results.append(result)
+                    print(
+                        f'{profile:5} {name:20} c={concurrency:<4} {result["rps"]:>8} req/s  '
+                        f'p50 {result["p50_ms"]:>8}ms  p95 {result["p95_ms"]:>8}ms  errors {result["errors"]}'
+                    )
+        finally:
+            process.terminate()
+            process.wait()
+
+    return results
+
+
+def setup():
+    user, created = User.objects.get_or_create(username=USERNAME)
+    return {
+        'token': str(RefreshToken.for_user(user).access_token),
+        'started': int(time.time()),
+        'movie_ids': list(Movie.objects.order_by('?').values_list('id', flat=True)[:500]),
+        'director_ids': list(Director.objects.order_by('-movie_count').values_list('id', flat=True)[:500]),
+        'actor_ids': list(Actor.objects.order_by('id').values_list('id', flat=True)[:2]),
+    }
+
+
+def cleanup():
+    Movie.objects.filter(title__startswith=TITLE_PREFIX).delete()
+    User.objects.filter(username=USERNAME).delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrency of one server process, WSGI vs ASGI profile')
+    parser.add_argument('--profiles', default='wsgi,asgi', help='Comma separated server profiles')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma separated numbers of concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+    parser.add_argument('--tmdb-delay', type=float, default=0.2, help='Seconds the TMDB stand-in takes to answer')
+    parser.add_argument('--port', type=int, default=8765, help='Port of the benchmarked server')
+    parser.add_argument('--output', default='concurrency.json', help='JSON file with the results')
+    args = parser.parse_args()
+    args.concurrency = [int(n) for n in args.concurrency.split(',')]
+
+    tmdb = StubTMDB(args.tmdb_delay)
+    threading.Thread(target=tmdb.serve_forever, daemon=True).start()
+    ctx = setup()
+    if not ctx['movie_ids'] or not ctx['actor_ids']:
+        raise SystemExit('The database has no movies, load a catalog first (generate_catalog)')
+
+    try:
+        results = [
+            result for profile in args.profiles.split(',')
+            for result in benchmark_profile(profile, args.port, args, ctx, tmdb.url)
+        ]
+    finally:
+        cleanup()
+        tmdb.shutdown()
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'meta': {
+                'revision': git_revision(), 'date': datetime.now(timezone.utc).isoformat(),
+                'concurrency': args.concurrency, 'requests': args.requests, 'tmdb_delay': args.tmdb_delay,
+            },
+            'results': results,
+        }, file, indent=2)
+    print(f'\nResults written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""
+Latency, query count and memory of every API route on seeded catalogs.
+
+For each catalog size a scratch database (bench_<NAME>) is seeded with synthetic movies through the catalog loader,
+then every case of CASES runs `repeat` times with the cache cleared before each request (cold) and, for GETs, with a
+primed cache (warm). A case records the p50/p95 latency of the timed requests, and the queries and peak Python
+memory (tracemalloc) of one more request. Cached pages are stored under their own key prefix, so the cache of the
+dev server is left alone. Every route of movies/urls.py and movies/auth_urls.py must have at least one case.
+
+The results are written as JSON, so runs can be compared. With --budgets the run exits with status 1 when a case
+goes over its budget (see benchmarks/budgets.json and check_budgets).
+
+Usage (from backend/): python -m benchmarks.endpoints [--sizes 1000,10000,100000] [--repeat 15]
+                           [--output benchmark.json] [--budgets benchmarks/budgets.json] [--keepdb]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'open_movies_api.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from django.urls import URLPattern  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+from movies import auth_urls, urls  # noqa: E402
+from movies.loader import CatalogLoader  # noqa: E402
+from movies.models import Movie, Director, Actor  # noqa: E402
+from movies.stats import refresh_catalog_stats  # noqa: E402
+
+WORDS = [
+    'night', 'river', 'shadow', 'king', 'garden', 'storm', 'silent', 'iron', 'summer', 'ghost',
+    'empire', 'winter', 'golden', 'last', 'broken', 'city', 'stranger', 'dream', 'fire', 'ocean',
+]
+GENRES = ['Action', 'Drama', 'Comedy', 'Science Fiction', 'Thriller', 'Animation', 'Crime', 'Romance']
+COUNTRIES = ['US', 'GB', 'FR', 'ES', 'JP', 'KR', 'CO', 'MX']
+PASSWORD = 'bench-password'
+
+
+class Case:
+    """
+    One request to time. `route` is the url name it covers and `request(ctx, n)` returns (path, data, headers) of
+    the n-th request, anything it creates is not timed. Only GETs run warm, `warm=False` skips it for the ones that
+    are never cached. Cases with a `max_size` are skipped on bigger catalogs.
+    """
+    def __init__(self, name, route, method, request, auth=False, warm=True, max_size=None):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.request = request
+        self.auth = auth
+        self.modes = ['cold', 'warm'] if method == 'get' and warm else ['cold']
+        self.max_size = max_size
+
+
+def get(name, route, path, warm=True, max_size=None):
+    return Case(name, route, 'get', lambda ctx, n: (path.format(**ctx), None, {}), warm=warm, max_size=max_size)
+
+
+def movie_data(ctx, n):
+    return {
+        'title': f'Benchmark movie {n}', 'year': 2020, 'genres': ['Drama'], 'rating': 7.5,
+        'description': 'Benchmark', 'poster_url': 'https://example.com/poster.jpg',
+        'director': ctx['director_id'], 'actors_id': ctx['actor_ids'][:3],
+    }
+
+
+def create_movie(ctx, n):
+    movie = Movie.objects.create(title=f'Benchmark deleted {n}', year=2020, director_id=ctx['director_id'])
+    movie.actors.set(ctx['actor_ids'][:3])
+    return movie.pk
+
+
+def not_modified(ctx, n):
+    path = f'/api/movies/{ctx["movie_id"]}/'
+    etag = APIClient().get(path, secure=True)['ETag']
+    return path, None, {'HTTP_IF_NONE_MATCH': etag}
+
+
+CASES = [
+    # the whole catalog in one response, ~4s at 10k movies
+    get('movies-list', 'movies', '/api/movies/', max_size=10000),
+    get('movies-list-page', 'movies', '/api/movies/?page_size=20'),
+    get('movies-list-page-expanded', 'movies', '/api/movies/?page_size=20&expand=director,actors'),
+    get('movies-list-sparse', 'movies', '/api/movies/?page_size=100&fields=id,title,year,rating,poster_url'),
+    get('movies-search', 'movies', '/api/movies/?q=shadow+king&page_size=20'),
+    get('movies-filter-genres', 'movies', '/api/movies/?genres=drama,crime&page_size=20'),
+    get('movie-detail', 'movie-detail', '/api/movies/{movie_id}/'),
+    Case('movie-detail-not-modified', 'movie-detail', 'get', not_modified, warm=False),
+    get('movies-export', 'movies-export', '/api/movies/export/?output=csv', warm=False),
+    get('directors-list', 'directors', '/api/directors/'),
+    get('directors-top', 'directors', '/api/directors/?ordering=-movie_count&min_movies=5'),
+    get('director-detail', 'director-detail', '/api/directors/{director_id}/'),
+    get('actors-list', 'actors', '/api/actors/'),
+    get('actor-detail', 'actor-detail', '/api/actors/{actor_id}/'),
+    get('stats', 'stats', '/api/stats/'),
+    Case('slow-queries', 'slow-queries', 'get', lambda ctx, n: ('/api/slow-queries/', None, {}), auth=True, warm=False),
+    # writes, after the reads since they invalidate the cached pages
+    Case('movie-create', 'movies', 'post', lambda ctx, n: ('/api/movies/', movie_data(ctx, n), {}), auth=True),
+    Case('movie-update', 'movie-detail', 'patch', lambda ctx, n: (
+        f'/api/movies/{ctx["movie_id"]}/', {'rating': n % 9 + 1}, {}), auth=True),
+    Case('movie-delete', 'movie-detail', 'delete', lambda ctx, n: (
+        f'/api/movies/{create_movie(ctx, n)}/', None, {}), auth=True),
+    Case('movies-bulk', 'movies-bulk', 'post', lambda ctx, n: (
+        '/api/movies/bulk/', [movie_data(ctx, f'{n}-{i}') for i in range(50)], {}), auth=True),
+    Case('director-create', 'directors', 'post', lambda ctx, n: (
+        '/api/directors/', {'name': f'Benchmark director {n}', 'country': 'US'}, {}), auth=True),
+    Case('director-update', 'director-detail', 'patch', lambda ctx, n: (
+        f'/api/directors/{ctx["director_id"]}/', {'country': COUNTRIES[n % len(COUNTRIES)]}, {}), auth=True),
+    Case('actor-create', 'actors', 'post', lambda ctx, n: (
+        '/api/actors/', {'name': f'Benchmark actor {n}', 'country': 'US'}, {}), auth=True),
+    Case('actor-update', 'actor-detail', 'patch', lambda ctx, n: (
+        f'/api/actors/{ctx["actor_id"]}/', {'country': COUNTRIES[n % len(COUNTRIES)]}, {}), auth=True),
+    Case('auth-login', 'token_obtain_pair', 'post', lambda ctx, n: (
+        '/api/auth/login/', {'username': 'bench', 'password': PASSWORD}, {})),
+    Case('auth-refresh', 'token_refresh', 'post', lambda ctx, n: (
+        '/api/auth/refresh/', {'refresh': str(RefreshToken.for_user(ctx['user']))}, {})),
+    Case('auth-register', 'register', 'post', lambda ctx, n: (
+        '/api/auth/register/', {'username': f'bench-{n}', 'password': PASSWORD}, {})),
+    Case('auth-logout', 'logout', 'post', lambda ctx, n: (
+        '/api/auth/logout/', {'refresh': str(RefreshToken.for_user(ctx['user']))}, {}), auth=True),
+]
+
+
+def check_coverage():
+    routes = {pattern.name for module in (urls, auth_urls) for pattern in module.urlpatterns
+              if isinstance(pattern, URLPattern)}
+    missing = routes - {case.route for case in CASES}
+    if missing:
+        sys.exit(f'Routes without a benchmark case: {", ".join(sorted(missing))}')
+
+
+def catalog_rows(size, seed):
+    rng = random.Random(seed)
+    directors = max(size // 10, 1)
+    actors = max(size // 3, 1)
+    for i in range(size):
+        yield {
+            'title': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+            'year': rng.randint(1950, 2025),
+            'genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'rating': round(rng.uniform(1, 10), 1),
+            'description': ' '.join(rng.choices(WORDS, k=30)),
+            'poster_url': f'https://image.tmdb.org/t/p/w500/{i:08d}.jpg',
+            'director': f'Director {rng.randrange(directors)}',
+            'director_country': rng.choice(COUNTRIES),
+            'actors': [f'Actor {rng.randrange(actors)}' for _ in range(rng.randint(2, 6))],
+        }
+
+
+def seed_catalog(size, seed):
+    """Empties the scratch database and loads a catalog of `size` movies, returns the ids the cases use"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'TRUNCATE movies_movie_actors, movies_movie, movies_director, movies_actor, auth_user RESTART IDENTITY CASCADE'
+        )
+
+    start = time.perf_counter()
+    CatalogLoader(chunk_size=5000).load(catalog_rows(size, seed))
+    refresh_catalog_stats(concurrently=False)
+    print(f'\nSeeded {size} movies in {time.perf_counter() - start:.1f}s')
+
+    # a typical row of each kind: the median director/actor by number of movies
+    director = Director.objects.order_by('movie_count', 'id')[Director.objects.count() // 2]
+    actor = Actor.objects.order_by('movie_count', 'id')[Actor.objects.count() // 2]
+    return {
+        'movie_id': Movie.objects.filter(director=director).values_list('pk', flat=True).first(),
+        'director_id': director.pk,
+        'actor_id': actor.pk,
+        'actor_ids': list(Actor.objects.order_by('id').values_list('pk', flat=True)[:3]),
+        'user': User.objects.create_user(username='bench', password=PASSWORD, is_staff=True),
+    }
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries, it survives the reconnection of every request (CONN_MAX_AGE=0)"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def clear_cache():
+    # only the keys of the benchmark prefix, clear() would flush the whole Redis DB
+    cache.delete_pattern('*')
+
+
+def send(client, method, path, data, headers):
+    response = getattr(client, method)(path, data, format='json', secure=True, **headers)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def run_case(case, ctx, repeat, mode, clients, counter):
+    client = clients['auth' if case.auth else 'anonymous']
+    if mode == 'warm':
+        clear_cache()
+        send(client, case.method, *case.request(ctx, next(counter)))
+
+    def request():
+        if mode == 'cold':
+            clear_cache()
+        request_args = case.request(ctx, next(counter))
+        start = time.perf_counter()
+        response = send(client, case.method, *request_args)
+        return (time.perf_counter() - start) * 1000, response
+
+    timings = []
+    statuses = set()
+    for _ in range(repeat):
+        elapsed, response = request()
+        timings.append(elapsed)
+        statuses.add(response.status_code)
+
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        request()
+
+    tracemalloc.start()
+    request()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'case': case.name,
+        'route': case.route,
+        'cache': mode,
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(statistics.quantiles(timings, n=20)[18] if len(timings) > 1 else timings[0], 2),
+        'queries': queries.count,
+        'peak_kb': round(peak / 1024),
+        'status': sorted(statuses),
+    }
+
+
+def run_size(size, repeat, seed):
+    ctx = seed_catalog(size, seed)
+    clients = {'anonymous': APIClient(), 'auth': APIClient()}
+    access = RefreshToken.for_user(ctx['user']).access_token
+    clients['auth'].credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    counter = iter(range(10 ** 9))
+
+    results = []
+    print(f'{"case":<28}{"cache":>6}{"p50 (ms)":>11}{"p95 (ms)":>11}{"queries":>9}{"peak (KB)":>11}{"status":>10}')
+    for case in CASES:
+        if case.max_size and size > case.max_size:
+            continue
+        for mode in case.modes:
+            result = {'size': size, **run_case(case, ctx, repeat, mode, clients, counter)}
+            results.append(result)
+            print(f'{case.name:<28}{mode:>6}{result["p50_ms"]:>11.1f}{result["p95_ms"]:>11.1f}{result["queries"]:>9}'
+                  f'{result["peak_kb"]:>11}{",".join(map(str, result["status"])):>10}')
+
+    return results
+
+
+def check_budgets(results, budgets):
+    """
+    Returns a message per result over its budget. `queries` applies to cold requests, the worst case, `p95_ms` to
+    every run and `warm_p95_ms` only to warm ones. Latency budgets are a number or a {size: number} dict.
+    """
+    violations = []
+    for result in results:
+        budget = budgets.get(result['case'])
+        if not budget:
+            continue
+
+        if result['cache'] == 'cold' and 'queries' in budget and result['queries'] > budget['queries']:
+            violations.append(f'{result["case"]} ({result["size"]}): {result["queries"]} queries > {budget["queries"]}')
+
+        for key in ('p95_ms', 'warm_p95_ms') if result['cache'] == 'warm' else ('p95_ms',):
+            limit = budget.get(key)
+            if isinstance(limit, dict):
+                limit = limit.get(str(result['size']))
+            if limit is not None and result['p95_ms'] > limit:
+                violations.append(
+                    f'{result["case"]} {result["cache"]} ({result["size"]}): p95 {result["p95_ms"]}ms > {limit}ms'
+                )
+
+    return violations
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every API route on seeded catalogs')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated catalog sizes')
+    parser.add_argument('--repeat', type=int, default=15, help='Timed requests per case')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic catalog')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file with the results')
+    parser.add_argument('--budgets', help='JSON file with the budgets, exits with 1 when one is exceeded')
+    parser.add_argument('--keepdb', action='store_true', help='Keep the scratch database for the next run')
+    args = parser.parse_args()
+
+    check_coverage()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    setup_test_environment()
+
+    connection.settings_dict['TEST']['NAME'] = f'bench_{connection.settings_dict["NAME"]}'
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=args.keepdb)
+    caches = {'default': {**settings.CACHES['default'], 'KEY_PREFIX': 'bench'}}
+
+    try:
+        # no background stats refresh, the database goes away at the end
+        with override_settings(CACHES=caches, CATALOG_STATS_REFRESH_DELAY=0):
+            results = [result for size in sizes for result in run_size(size, args.repeat, args.seed)]
+            clear_cache()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=args.keepdb)
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'meta': {
+                'revision': git_revision(), 'date': datetime.now(timezone.utc).isoformat(), 'sizes': sizes,
+                'repeat': args.repeat, 'seed': args.seed, 'json_backend': settings.API_JSON_BACKEND,
+            },
+            'results': results,
+        }, file, indent=2)
+    print(f'\nResults written to {args.output}')
+
+    if args.budgets:
+        with open(args.budgets) as file:
+            violations = check_budgets(results, json.load(file))
+
+        for violation in violations:
+            print(f'OVER BUDGET: {violation}')
+        if violations:
+            sys.exit(1)
+        print('All budgets met')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Encode and decode times of the API JSON renderers/parsers on movie list payloads.
+
+Builds payloads shaped exactly like the movie list response (compact director and actors, ReturnList of
+ReturnDicts as the serializers produce them) and times DRF's stdlib JSONRenderer/JSONParser against the orjson ones
+of movies.renderers. No database is needed.
+
+Usage (from backend/): python -m benchmarks.json_renderers [sizes] [repeat]    e.g. 1000,10000 7
+"""
+import gc
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'open_movies_api.settings')
+django.setup()
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList  # noqa: E402
+from movies.renderers import ORJSONParser, ORJSONRenderer  # noqa: E402
+
+GENRES = ['Action', 'Drama', 'Comedy', 'Science Fiction', 'Thriller', 'Animation', 'Crime', 'Romance']
+COUNTRIES = ['US', 'GB', 'FR', 'ES', 'JP', 'KR', 'CO', 'MX']
+
+
+def person(rng, pk):
+    return ReturnDict(id=pk, name=f'Person {pk} Ñúñez', country=rng.choice(COUNTRIES), serializer=None)
+
+
+def movie(rng, pk):
+    return ReturnDict(
+        id=pk,
+        title=f'Movie {pk}: The {rng.choice(GENRES)} Story',
+        year=rng.randint(1950, 2025),
+        genres=rng.sample(GENRES, rng.randint(1, 3)),
+        rating=round(rng.uniform(1, 10), 1),
+        description=' '.join(rng.choice(GENRES).lower() for _ in range(40)),
+        poster_url=f'https://image.tmdb.org/t/p/w500/{pk:08d}.jpg',
+        created_at='2025-10-18T12:34:56.123456Z',
+        updated_at='2025-10-18T12:34:56.123456Z',
+        director_data=person(rng, rng.randint(1, 5000)),
+        actors_data=[person(rng, rng.randint(1, 50000)) for _ in range(rng.randint(2, 8))],
+        serializer=None,
+    )
+
+
+def payload(size):
+    rng = random.Random(size)
+    return ReturnList([movie(rng, pk) for pk in range(1, size + 1)], serializer=None)
+
+
+def timed(function, repeat):
+    # like timeit, so the collector walking millions of decoded objects doesn't dominate the timings
+    gc.collect()
+    gc.disable()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    gc.enable()
+    return statistics.median(timings), result
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1000, 10000]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    pairs = {'stdlib': (JSONRenderer(), JSONParser()), 'orjson': (ORJSONRenderer(), ORJSONParser())}
+
+    print(f'{"movies":>8}{"backend":>9}{"size (KB)":>11}{"encode (ms)":>13}{"decode (ms)":>13}{"encode MB/s":>13}')
+    for size in sizes:
+        data = payload(size)
+        results = {}
+        for name, (renderer, parser) in pairs.items():
+            encode, body = timed(lambda: renderer.render(data, 'application/json'), repeat)
+            decode, parsed = timed(lambda: parser.parse(io.BytesIO(body)), repeat)
+            assert len(parsed) == size
+            results[name] = encode
+            print(f'{size:>8}{name:>9}{len(body) / 1024:>11.0f}{encode:>13.2f}{decode:>13.2f}'
+                  f'{len(body) / 1024 / 1024 / (encode / 1000):>13.0f}')
+
+        print(f'{"":>8}{"speedup":>9}{"":>11}{results["stdlib"] / results["orjson"]:>12.1f}x')
+
+
+if __name__ == '__main__':
+    main()
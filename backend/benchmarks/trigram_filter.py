@@ -0,0 +1,93 @@
+"""
+Substring filter latency on a synthetic table, before and after the pg_trgm index.
+
+Builds a temporary table shaped like movies_movie.title with ROWS synthetic titles, runs the queries that
+MovieFilter.title (icontains) and the duplicate checks (iexact) send to Postgres, creates the same
+GIN (UPPER(title) gin_trgm_ops) index as migration 0004 and runs them again.
+
+Usage (from backend/): python -m benchmarks.trigram_filter [rows] [repeat]
+"""
+import os
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'open_movies_api.settings')
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+WORDS = [
+    'night', 'river', 'shadow', 'king', 'garden', 'storm', 'silent', 'iron', 'summer', 'ghost',
+    'empire', 'winter', 'golden', 'last', 'broken', 'city', 'stranger', 'dream', 'fire', 'ocean',
+]
+
+QUERIES = {
+    # same SQL django generates for title__icontains / title__iexact
+    'icontains (rare)': ("SELECT id FROM bench_movie WHERE UPPER(title::text) LIKE UPPER(%s)", ['%zyxq%']),
+    'icontains (common)': ("SELECT id FROM bench_movie WHERE UPPER(title::text) LIKE UPPER(%s) LIMIT 20",
+                           ['%shadow king%']),
+    'icontains (count)': ("SELECT count(*) FROM bench_movie WHERE UPPER(title::text) LIKE UPPER(%s)",
+                          ['%golden river 77%']),
+    'iexact': ("SELECT 1 FROM bench_movie WHERE UPPER(title::text) = UPPER(%s) LIMIT 1", ['night river 123456']),
+}
+
+
+def build_table(cursor, rows):
+    words = '{' + ','.join(WORDS) + '}'
+    cursor.execute('CREATE TEMP TABLE bench_movie (id serial PRIMARY KEY, title varchar(200) NOT NULL)')
+    cursor.execute(
+        """
+        INSERT INTO bench_movie (title)
+        SELECT (%s::text[])[1 + i %% 20] || ' ' || (%s::text[])[1 + (i / 20) %% 20] || ' ' || i
+        FROM generate_series(1, %s) AS i
+        """,
+        [words, words, rows]
+    )
+    cursor.execute('ANALYZE bench_movie')
+
+
+def run_queries(cursor, repeat):
+    results = {}
+    for label, (sql, params) in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[label] = statistics.median(timings)
+    return results
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        start = time.perf_counter()
+        build_table(cursor, rows)
+        print(f'Built {rows} rows in {time.perf_counter() - start:.1f}s')
+
+        before = run_queries(cursor, repeat)
+
+        start = time.perf_counter()
+        cursor.execute('CREATE INDEX ON bench_movie USING gin ((UPPER(title)) gin_trgm_ops)')
+        cursor.execute('ANALYZE bench_movie')
+        print(f'Built trigram index in {time.perf_counter() - start:.1f}s')
+
+        after = run_queries(cursor, repeat)
+
+        print(f'\n{"query":<22}{"seq scan (ms)":>16}{"trigram (ms)":>16}{"speedup":>10}')
+        for label in QUERIES:
+            print(f'{label:<22}{before[label]:>16.2f}{after[label]:>16.2f}{before[label] / after[label]:>9.1f}x')
+
+        # the temp table goes away with the transaction
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
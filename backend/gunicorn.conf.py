@@ -0,0 +1,25 @@
+import os
+import shutil
+
+# Workers write their Prometheus samples (movies.metrics) to this directory and /metrics adds them up. It has to be
+# set before prometheus_client is imported, which picks its storage at import time, the workers inherit it from here.
+prometheus_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+from prometheus_client import multiprocess  # noqa: E402
+
+# SERVER_PROFILE=asgi runs open_movies_api.asgi on uvicorn workers, with the async read views (movies.async_views):
+# a worker keeps serving other requests while one waits on the database or TMDB. wsgi, the default, runs sync
+# workers that handle one request at a time. See the README and benchmarks/concurrency.py
+if os.environ.get('SERVER_PROFILE', 'wsgi') == 'asgi':
+    wsgi_app = 'open_movies_api.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'open_movies_api.wsgi:application'
+
+def on_starting(server):
+    # samples of a previous run would be counted again
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir)
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
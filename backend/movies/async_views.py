@@ -0,0 +1,169 @@
+import logging
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404
+from django.utils.decorators import method_decorator
+from rest_framework import status
+from rest_framework.response import Response
+from .cache import cache_page_by_generation
+from .conditional import conditional_get
+from .serializers import missing_tmdb_fields
+from .services import afetch_movie_data
+from .views import (
+    ACTOR_LIST_NAMESPACES, DIRECTOR_LIST_NAMESPACES, MOVIE_LIST_NAMESPACES, ActorDetailView, ActorListCreateView,
+    DirectorDetailView, DirectorListCreateView, MovieDetailView, MovieListCreateView, movie_detail_namespaces,
+)
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the read views, served instead of the sync ones when ASYNC_VIEWS is on (the ASGI profile, see
+# movies.urls). They keep the configuration of the sync views (serializers, filters, pagination, page cache, ETags)
+# and only change how the work is run: lists and details are read with the async ORM, the TMDB lookup of a movie
+# creation goes through the async client, and the rest runs in the request's sync thread as under WSGI.
+
+class AsyncAPIViewMixin:
+    """
+    APIView.dispatch() as a coroutine. Authentication, permissions and throttling may query the database, so they
+    run in the request's sync thread. Then the `a<method>` handler is awaited when the view has one, the sync handler
+    runs in that thread otherwise.
+    """
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            method = request.method.lower()
+            handler = None
+            if method in self.http_method_names:
+                handler = getattr(self, f'a{"get" if method == "head" else method}', None)
+
+            if handler is not None:
+                response = await handler(request, *args, **kwargs)
+            else:
+                handler = getattr(self, method, self.http_method_not_allowed)
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+class AsyncListMixin:
+    """ListModelMixin.list() with the rows (and their prefetches) fetched through the async ORM"""
+
+    async def aget(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer([obj async for obj in queryset], many=True)
+        return Response(serializer.data)
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+
+class AsyncRetrieveMixin:
+    """RetrieveModelMixin.retrieve() with the object fetched through the async ORM"""
+
+    async def aget(self, request, *args, **kwargs):
+        return await self.aretrieve(request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(await self.aget_object())
+        return Response(serializer.data)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = await aget_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+class AsyncMovieListCreateView(AsyncListMixin, AsyncAPIViewMixin, MovieListCreateView):
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'movies_list', MOVIE_LIST_NAMESPACES))
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+    async def apost(self, request, *args, **kwargs):
+        """CreateModelMixin.create(), with the TMDB lookup of the missing fields awaited instead of blocking a thread"""
+        serializer = self.get_serializer(data=request.data)
+        # checks the director and actors against the database
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        if missing_tmdb_fields(serializer.validated_data):
+            serializer.context['tmdb_data'] = await afetch_movie_data(serializer.validated_data['title'])
+
+        def create():
+            self.perform_create(serializer)
+            # the representation reads the actors of the new movie
+            return serializer.data
+
+        data = await sync_to_async(create)()
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+class AsyncMovieDetailView(AsyncRetrieveMixin, AsyncAPIViewMixin, MovieDetailView):
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'movie_detail', movie_detail_namespaces))
+    async def aretrieve(self, request, *args, **kwargs):
+        return await super().aretrieve(request, *args, **kwargs)
+
+class AsyncDirectorListCreateView(AsyncListMixin, AsyncAPIViewMixin, DirectorListCreateView):
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'directors_list', DIRECTOR_LIST_NAMESPACES))
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+class AsyncDirectorDetailView(AsyncRetrieveMixin, AsyncAPIViewMixin, DirectorDetailView):
+
+    @conditional_get
+    async def aretrieve(self, request, *args, **kwargs):
+        return await super().aretrieve(request, *args, **kwargs)
+
+class AsyncActorListCreateView(AsyncListMixin, AsyncAPIViewMixin, ActorListCreateView):
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'actors_list', ACTOR_LIST_NAMESPACES))
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+class AsyncActorDetailView(AsyncRetrieveMixin, AsyncAPIViewMixin, ActorDetailView):
+
+    @conditional_get
+    async def aretrieve(self, request, *args, **kwargs):
+        return await super().aretrieve(request, *args, **kwargs)
+
+# sync view -> async version, see movies.urls
+ASYNC_VIEWS = {
+    MovieListCreateView: AsyncMovieListCreateView,
+    MovieDetailView: AsyncMovieDetailView,
+    DirectorListCreateView: AsyncDirectorListCreateView,
+    DirectorDetailView: AsyncDirectorDetailView,
+    ActorListCreateView: AsyncActorListCreateView,
+    ActorDetailView: AsyncActorDetailView,
+}
+
+for view, async_view in ASYNC_VIEWS.items():
+    # the API docs describe the endpoint, not how it is served
+    async_view.__doc__ = view.__doc__
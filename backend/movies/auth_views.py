@@ -7,6 +7,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .metrics import record_auth_failure
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +64,7 @@ class Logout(APIView):
             }, status=status.HTTP_200_OK)
         except Exception:
             logger.warning(f'User [{self.request.user}] provided an invalid token to log out')
+            record_auth_failure('logout_token_not_valid')
             return Response({
                 'success': False,
                 'message': 'Invalid token'
@@ -85,6 +87,7 @@ class LoginView(TokenObtainPairView):
         
         if user is None:
             logger.warning(f'Failed login attempt for username: {username}')
+            record_auth_failure('wrong_credentials')
             return Response({
                 'success': False,
                 'message': 'Wrong credentials'
@@ -0,0 +1,177 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Lower
+from rest_framework.exceptions import APIException
+from .cache import invalidate_on_commit
+from .models import Movie, Director, Actor, normalize_genres
+from .serializers import MovieBulkItemSerializer, missing_tmdb_fields
+from .services import fetch_movie_data
+from .stats import schedule_stats_refresh
+
+logger = logging.getLogger(__name__)
+
+# inserts of a batch that keeps losing races with concurrent writes, before its items are reported as failed
+CREATE_ATTEMPTS = 3
+
+def import_movies(items, max_workers=8):
+    """
+    Creates many movies at once and returns one result per item, in the same order:
+    {'index': 0, 'status': 'created', 'id': 1, 'title': '...'} or {'index': 0, 'status': 'error', 'errors': {...}}
+
+    The batch costs a fixed number of queries: one for the duplicate titles, one per relation to check the ids,
+    the inserts, a single search vector update and one recount per relation. Missing fields are fetched from TMDB
+    concurrently. Signals don't run for bulk inserts, so the counters and the cache are updated here, once.
+    """
+    results = [None] * len(items)
+    pending = []
+
+    for index, item in enumerate(items):
+        serializer = MovieBulkItemSerializer(data=item)
+        if serializer.is_valid():
+            pending.append((index, dict(serializer.validated_data)))
+        else:
+            results[index] = error_result(index, serializer.errors)
+
+    pending = check_duplicates(pending, results)
+    pending = check_relations(pending, results)
+    pending = enrich_from_tmdb(pending, results, max_workers)
+
+    movies = []
+    for attempt in range(CREATE_ATTEMPTS):
+        try:
+            movies = create_movies([data for index, data in pending])
+            break
+        except IntegrityError:
+            # a concurrent request created one of the titles or deleted a director or actor after the checks, and the
+            # batch was rolled back. The constraints make sure the checks see it now
+            logger.warning(f'Bulk import conflicted with a concurrent write (attempt {attempt + 1})')
+            pending = check_relations(check_duplicates(pending, results), results)
+    else:
+        for index, data in pending:
+            results[index] = error_result(index, {'non_field_errors': ['Conflicting concurrent changes, try again']})
+        pending = []
+
+    for (index, data), movie in zip(pending, movies):
+        results[index] = {'index': index, 'status': 'created', 'id': movie.pk, 'title': movie.title}
+
+    return results
+
+def error_result(index, errors):
+    return {'index': index, 'status': 'error', 'errors': errors}
+
+def check_duplicates(pending, results):
+    """Titles that already exist (case insensitive, as the movie_title_unique index) or are repeated in the batch"""
+    titles = {data['title'].lower() for index, data in pending}
+    existing = set(
+        Movie.objects.annotate(lower_title=Lower('title'))
+        .filter(lower_title__in=titles)
+        .values_list('lower_title', flat=True)
+    )
+
+    seen = set()
+    valid = []
+    for index, data in pending:
+        title = data['title'].lower()
+        if title in existing:
+            results[index] = error_result(index, {'non_field_errors': ['Movie already exists']})
+        elif title in seen:
+            results[index] = error_result(index, {'non_field_errors': ['Movie is repeated in the request']})
+        else:
+            seen.add(title)
+            valid.append((index, data))
+
+    return valid
+
+def check_relations(pending, results):
+    director_ids = {data['director'] for index, data in pending}
+    actor_ids = {actor_id for index, data in pending for actor_id in data['actors_id']}
+    directors = set(Director.objects.filter(pk__in=director_ids).values_list('pk', flat=True))
+    actors = set(Actor.objects.filter(pk__in=actor_ids).values_list('pk', flat=True))
+
+    valid = []
+    for index, data in pending:
+        errors = {}
+        if data['director'] not in directors:
+            errors['director'] = [f'Invalid pk "{data["director"]}" - object does not exist.']
+
+        invalid_actors = [actor_id for actor_id in data['actors_id'] if actor_id not in actors]
+        if invalid_actors:
+            errors['actors_id'] = [f'Invalid pk "{actor_id}" - object does not exist.' for actor_id in invalid_actors]
+
+        if errors:
+            results[index] = error_result(index, errors)
+        else:
+            valid.append((index, data))
+
+    return valid
+
+def enrich_from_tmdb(pending, results, max_workers):
+    """Fills the missing fields from TMDB, with at most `max_workers` lookups in flight"""
+    to_enrich = [(index, data) for index, data in pending if missing_tmdb_fields(data)]
+    if not to_enrich:
+        return pending
+
+    failed = set()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(to_enrich))) as executor:
+        lookups = [(index, data, executor.submit(fetch_movie_data, data['title'])) for index, data in to_enrich]
+
+        for index, data, lookup in lookups:
+            try:
+                tmdb_data = lookup.result()
+                for key in missing_tmdb_fields(data):
+                    value = tmdb_data.get(key)
+                    if value not in [None, '', []]:
+                        data[key] = int(value) if key == 'year' else value
+            except APIException as e:
+                results[index] = error_result(index, {'non_field_errors': [str(e.detail)]})
+                failed.add(index)
+            except Exception:
+                # a bug or an unexpected answer fails this item, not the whole batch
+                logger.exception(f"TMDB lookup of '{data['title']}' failed")
+                results[index] = error_result(index, {'non_field_errors': ['Could not get the movie data from TMDB']})
+                failed.add(index)
+
+    return [(index, data) for index, data in pending if index not in failed]
+
+def create_movies(movies_data):
+    """Inserts the movies and their cast with one bulk insert each and returns the created movies"""
+    if not movies_data:
+        return []
+
+    Cast = Movie.actors.through
+    with transaction.atomic():
+        movies = Movie.objects.bulk_create([
+            Movie(
+                title=data['title'],
+                year=data.get('year'),
+                # bulk_create skips Movie.save()
+                genres=normalize_genres(data.get('genres')),
+                rating=data.get('rating'),
+                description=data.get('description'),
+                poster_url=data.get('poster_url'),
+                director_id=data['director'],
+            )
+            for data in movies_data
+        ], batch_size=500)
+
+        Cast.objects.bulk_create([
+            Cast(movie_id=movie.pk, actor_id=actor_id)
+            for movie, data in zip(movies, movies_data)
+            for actor_id in dict.fromkeys(data['actors_id'])
+        ], batch_size=1000)
+
+        # the foreign keys are deferred to the commit, which is not this block's when the caller has a transaction
+        # open. Checked now, a director or actor deleted since check_relations fails here, where import_movies retries
+        connection.check_constraints()
+
+        Movie.objects.filter(pk__in=[movie.pk for movie in movies]).update_search_vector()
+        # bulk_create doesn't send the signals that keep the counters
+        Director.objects.filter(pk__in={data['director'] for data in movies_data}).recount_movies()
+        Actor.objects.filter(pk__in={actor_id for data in movies_data for actor_id in data['actors_id']}).recount_movies()
+        # the director and actor pages embed movie titles and counts
+        invalidate_on_commit('movies', 'directors', 'actors')
+        schedule_stats_refresh()
+
+    logger.info(f'Bulk created {len(movies)} movies')
+    return movies
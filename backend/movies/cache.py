@@ -0,0 +1,112 @@
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.views.decorators.cache import cache_page
+from .metrics import record_page_cache
+from .timing import phase, timed
+
+# Cached responses are keyed by the current generation of every resource they embed. Writing a resource bumps its
+# generation, so the pages built with the old one are never read again and just expire, while the rest of the
+# cache (other resources, other keys in the Redis DB) stays warm.
+# A generation is the time (ns) of the last write to its namespace, so it also serves as Last-Modified (see
+# movies.conditional).
+GENERATION_KEY = 'generation:{}'
+
+
+def movie_namespace(pk):
+    return f'movie:{pk}'
+
+
+def _new_generation():
+    # time based, so a generation key evicted from Redis never comes back with a value that was already used
+    return time.time_ns()
+
+
+def generation_datetime(generation):
+    return datetime.fromtimestamp(generation / 1e9, tz=timezone.utc)
+
+
+def get_generations(*namespaces):
+    keys = [GENERATION_KEY.format(namespace) for namespace in namespaces]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            # add() does not overwrite a generation that another worker has just created
+            cache.add(key, _new_generation(), timeout=None)
+            generations[key] = cache.get(key)
+
+    return [generations[key] for key in keys]
+
+
+def invalidate(*namespaces):
+    """Bumps the generation of the given namespaces to the current time"""
+    cache.set_many({GENERATION_KEY.format(namespace): _new_generation() for namespace in namespaces}, timeout=None)
+
+
+def invalidate_on_commit(*namespaces):
+    """
+    Bumps the generations right away, so the current request never reads a stale page, and again when the open
+    transaction commits, so pages that other requests cached before the commit (with the old data) are discarded too.
+    """
+    invalidate(*namespaces)
+
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: invalidate(*namespaces))
+
+
+def cache_page_by_generation(timeout, key_prefix, namespaces):
+    """
+    Same as django's cache_page, but the cache key includes the generations of `namespaces`. It can be a tuple
+    or a callable that receives the request and the view arguments and returns it. Works on sync and async views; on async ones the
+    Redis round trips stay on the event loop, like django's cache_page does.
+    """
+    def page_key_prefix(request, *args, **kwargs):
+        names = namespaces(request, *args, **kwargs) if callable(namespaces) else namespaces
+        generations = '.'.join(str(generation) for generation in get_generations(*names))
+        return f'{key_prefix}:{generations}'
+
+    def decorator(view_func):
+        # the view runs inside the cache phase, so it is timed on its own
+        timed_view = timed('app')(view_func)
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                ran = []
+
+                async def view(request, *args, **kwargs):
+                    ran.append(True)
+                    return await timed_view(request, *args, **kwargs)
+
+                with phase('cache'):
+                    cached_view = cache_page(timeout, key_prefix=page_key_prefix(request, *args, **kwargs))(view)
+                    response = await cached_view(request, *args, **kwargs)
+
+                record_page_cache(key_prefix, hit=not ran)
+                return response
+
+            return _async_wrapped_view
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            # the view only runs when the page is not in the cache
+            ran = []
+
+            def view(request, *args, **kwargs):
+                ran.append(True)
+                return timed_view(request, *args, **kwargs)
+
+            with phase('cache'):
+                cached_view = cache_page(timeout, key_prefix=page_key_prefix(request, *args, **kwargs))(view)
+                response = cached_view(request, *args, **kwargs)
+
+            record_page_cache(key_prefix, hit=not ran)
+            return response
+
+        return _wrapped_view
+
+    return decorator
@@ -0,0 +1,97 @@
+import hashlib
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .cache import generation_datetime, get_generations
+
+def conditional_get(view_method):
+    """
+    Answers If-None-Match / If-Modified-Since with a 304 before the view method (and the page cache around it) runs,
+    so nothing is serialized. The view provides the validators, see ConditionalGetMixin. The method can be async,
+    then the validators (a query) are computed in the request's sync thread.
+    """
+    if iscoroutinefunction(view_method):
+        @wraps(view_method)
+        async def async_wrapped(self, request, *args, **kwargs):
+            validators = await sync_to_async(self.get_conditional_validators)(request)
+            response = not_modified(request, validators)
+            if response is None:
+                response = await view_method(self, request, *args, **kwargs)
+            return add_validators(response, validators)
+
+        return async_wrapped
+
+    @wraps(view_method)
+    def wrapped(self, request, *args, **kwargs):
+        validators = self.get_conditional_validators(request)
+        response = not_modified(request, validators)
+        if response is None:
+            response = view_method(self, request, *args, **kwargs)
+        return add_validators(response, validators)
+
+    return wrapped
+
+def not_modified(request, validators):
+    """The 304 (or 412) response when the client has the current version, None when the view has to run"""
+    if validators is None:
+        return None
+
+    etag, last_modified = validators
+    return get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+
+def add_validators(response, validators):
+    if validators is not None and response.status_code in (200, 304):
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+
+    return response
+
+class ConditionalGetMixin:
+    """
+    Computes the ETag and Last-Modified of a list or detail response with one aggregate query, max(updated_at) and
+    count of the rows it shows, plus the cache generations of `conditional_namespaces`, which change whenever a
+    resource embedded in the response is written or deleted (see movies.cache). The aggregate keeps the validators
+    right when the generations are lost (Redis flushed) or not bumped (queryset.update(), raw SQL), at the cost of one
+    query per request, 304s included.
+    """
+    # tuple, or a callable that receives the request and the url kwargs, like the namespaces of cache_page_by_generation
+    conditional_namespaces = ()
+
+    def get_conditional_queryset(self):
+        # plain rows of the model, the annotations and prefetches of get_queryset() don't change the validators
+        queryset = self.get_queryset().model._default_manager.all()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+
+        if lookup_url_kwarg in self.kwargs:
+            return queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+        return self.filter_queryset(queryset)
+
+    def get_conditional_validators(self, request):
+        stats = self.get_conditional_queryset().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        if not stats['count'] and (self.lookup_url_kwarg or self.lookup_field) in self.kwargs:
+            # let the view answer the 404
+            return None
+
+        namespaces = self.conditional_namespaces
+        if callable(namespaces):
+            namespaces = namespaces(request, **self.kwargs)
+        generations = get_generations(*namespaces)
+
+        modified = [stats['last_modified']] + [generation_datetime(generation) for generation in generations]
+        last_modified = max(value for value in modified if value is not None)
+
+        renderer = getattr(request, 'accepted_renderer', None)
+        validator = '|'.join([
+            request.get_full_path(),
+            renderer.format if renderer else '',
+            str(stats['count']),
+            stats['last_modified'].isoformat() if stats['last_modified'] else '',
+            *(str(generation) for generation in generations),
+        ])
+        etag = f'"{hashlib.sha1(validator.encode()).hexdigest()}"'
+
+        return etag, last_modified
@@ -1,11 +1,19 @@
 import logging
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
 from rest_framework.views import exception_handler
+from .metrics import record_auth_failure
 
 logger = logging.getLogger('movies.errors')
 
 def movies_exception_handler(exc, context):
     response = exception_handler(exc, context)
 
+    # bad credentials, invalid or expired tokens (InvalidToken is an AuthenticationFailed) and missing ones
+    if isinstance(exc, (AuthenticationFailed, NotAuthenticated)):
+        # token errors have a dict detail, their code is the default one
+        codes = exc.get_codes()
+        record_auth_failure(codes if isinstance(codes, str) else exc.default_code)
+
     if response is not None:
         request = context.get('request')
         view_name = context['view'].__class__.__name__
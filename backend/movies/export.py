@@ -0,0 +1,78 @@
+import csv
+import io
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+# same columns load_catalog reads, so an export can be loaded back
+CSV_COLUMNS = ['id', 'title', 'year', 'genres', 'rating', 'description', 'poster_url', 'director', 'director_country',
+               'actors', 'actor_countries', 'created_at', 'updated_at']
+
+def in_transaction(lines):
+    """
+    Consumes `lines` inside a transaction. Outside of one, Django declares the server side cursor WITH HOLD and
+    PostgreSQL materializes the whole result before returning the first row.
+    """
+    with transaction.atomic():
+        yield from lines
+
+async def async_lines(lines):
+    """
+    `lines` as an async iterator, for ASGI: Django reads a sync iterator there in one go before sending anything. Each
+    chunk is read in the request's sync thread, the one holding the transaction and the cursor.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(lines, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # ends the transaction when the client goes away
+        await sync_to_async(lines.close)()
+
+def batched_lines(rows, render, batch_size):
+    """Joins the rendered rows in batches, so the response is written in a few big chunks instead of one per row"""
+    batch = []
+    for row in rows:
+        batch.append(render(row))
+        if len(batch) >= batch_size:
+            yield ''.join(batch).encode()
+            batch = []
+
+    if batch:
+        yield ''.join(batch).encode()
+
+def ndjson_lines(movies, serializer, batch_size=100):
+    """One JSON object per line, each one as the API returns it"""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    return batched_lines(
+        movies, lambda movie: encoder.encode(serializer.to_representation(movie)) + '\n', batch_size
+    )
+
+def csv_lines(movies, batch_size=100):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def render(movie):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([
+            movie.id, movie.title, movie.year, '|'.join(movie.genres), movie.rating, movie.description,
+            movie.poster_url, movie.director.name, movie.director.country.code,
+            '|'.join(actor.name for actor in movie.actors.all()),
+            '|'.join(actor.country.code for actor in movie.actors.all()),
+            movie.created_at.isoformat(), movie.updated_at.isoformat(),
+        ])
+        return buffer.getvalue()
+
+    writer.writerow(CSV_COLUMNS)
+    header = buffer.getvalue()
+    yield header.encode()
+    yield from batched_lines(movies, render, batch_size)
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'movies.ndjson'),
+    'csv': ('text/csv', 'movies.csv'),
+}
@@ -1,9 +1,16 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
 from django_filters import rest_framework as filters
-from .models import Movie
+from rest_framework.filters import BaseFilterBackend
+from .models import Movie, Director, Actor, SEARCH_CONFIG, normalize_genres
 
 class MovieFilter(filters.FilterSet):
+    # icontains compares UPPER(title), which is covered by the movie_title_trgm index
     title = filters.CharFilter(lookup_expr='icontains')
+    # ?genres=drama,comedy matches movies with all of them, ?genres_mode=any with at least one
     genres = filters.CharFilter(method='filter_genres')
+    genres_mode = filters.ChoiceFilter(choices=[('all', 'all'), ('any', 'any')], method='filter_genres_mode')
     director = filters.NumberFilter(field_name='director__id')
     actor = filters.NumberFilter(field_name='actors__id')
 
@@ -12,4 +19,63 @@ class MovieFilter(filters.FilterSet):
         fields = ['title', 'genres', 'year', 'rating', 'director', 'actor']
 
     def filter_genres(self, queryset, name, value):
-        return queryset.filter(genres__icontains=value)
\ No newline at end of file
+        genres = normalize_genres(value.split(','))
+        if not genres:
+            return queryset
+
+        # @> / && on the genres array, both served by the movie_genres_gin index. The stored genres are normalized the
+        # same way, so any case of a genre matches
+        if self.form.cleaned_data.get('genres_mode') == 'any':
+            return queryset.filter(genres__overlap=genres)
+        return queryset.filter(genres__contains=genres)
+
+    def filter_genres_mode(self, queryset, name, value):
+        # only changes how filter_genres combines the genres
+        return queryset
+
+class DirectorFilter(filters.FilterSet):
+    name = filters.CharFilter(lookup_expr='icontains')
+    # prolificness, on the indexed movie_count column
+    min_movies = filters.NumberFilter(field_name='movie_count', lookup_expr='gte')
+    max_movies = filters.NumberFilter(field_name='movie_count', lookup_expr='lte')
+
+    class Meta:
+        model = Director
+        fields = ['name', 'country']
+
+class ActorFilter(filters.FilterSet):
+    name = filters.CharFilter(lookup_expr='icontains')
+    # prolificness, on the indexed movie_count column
+    min_movies = filters.NumberFilter(field_name='movie_count', lookup_expr='gte')
+    max_movies = filters.NumberFilter(field_name='movie_count', lookup_expr='lte')
+
+    class Meta:
+        model = Actor
+        fields = ['name', 'country']
+
+class MovieFullTextSearchFilter(BaseFilterBackend):
+    """
+    Full-text search over Movie.search_vector (GIN indexed) with the `q` query param. Results are annotated with
+    their `rank` and sorted by it, title matches first, then director/actors and then description.
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return queryset
+
+        query = SearchQuery(terms, config=SEARCH_CONFIG, search_type='websearch')
+        # ts_rank returns a real, cast to double so the rank survives the round trip through a pagination cursor
+        rank = Cast(SearchRank(F('search_vector'), query), FloatField())
+
+        return queryset.filter(search_vector=query).annotate(rank=rank).order_by('-rank', '-id')
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search on title, director, actors and description, ranked by relevance.',
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,158 @@
+import logging
+import random
+import time
+from itertools import accumulate, islice
+from django.db import connection, transaction
+from django.utils import timezone
+from .loader import CatalogLoader, MOVIE_COLUMNS, PERSON_COLUMNS, CAST_COLUMNS
+from .models import Movie, Director, Actor
+
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = [
+    'Ana', 'Bruno', 'Carmen', 'David', 'Elena', 'Felipe', 'Grace', 'Hiro', 'Ines', 'James', 'Kenji', 'Laura',
+    'Marco', 'Nadia', 'Omar', 'Paula', 'Quentin', 'Rosa', 'Samuel', 'Tomas', 'Uma', 'Victor', 'Wen', 'Yara',
+]
+LAST_NAMES = [
+    'Silva', 'Novak', 'Garcia', 'Smith', 'Tanaka', 'Rossi', 'Dubois', 'Kim', 'Muller', 'Lopez', 'Brown', 'Sato',
+    'Martin', 'Costa', 'Ivanov', 'Nielsen', 'Park', 'Moreau', 'Jensen', 'Ortiz', 'Walker', 'Hughes', 'Reyes', 'Chen',
+]
+WORDS = [
+    'night', 'river', 'shadow', 'king', 'garden', 'storm', 'silent', 'iron', 'summer', 'ghost', 'empire', 'winter',
+    'golden', 'last', 'broken', 'city', 'stranger', 'dream', 'fire', 'ocean', 'road', 'blood', 'glass', 'heart',
+    'wolf', 'north', 'machine', 'house', 'secret', 'star', 'mirror', 'war', 'midnight', 'paper', 'island', 'moon',
+]
+# TMDB genres, most frequent first: they are drawn with Zipf weights as well
+GENRES = [
+    'Drama', 'Comedy', 'Thriller', 'Action', 'Romance', 'Horror', 'Crime', 'Documentary', 'Adventure',
+    'Science Fiction', 'Family', 'Mystery', 'Fantasy', 'Animation', 'Music', 'History', 'War', 'Western',
+]
+COUNTRIES = ['US', 'US', 'US', 'GB', 'FR', 'IN', 'JP', 'KR', 'DE', 'ES', 'IT', 'MX', 'CO', 'BR', 'CA', 'AU']
+
+class ZipfSampler:
+    """
+    Draws ids with probability proportional to 1 / rank ** skew. The ranks are a seeded shuffle of the ids, so
+    popularity doesn't follow insertion order.
+    """
+    def __init__(self, rng, ids, skew=1.0):
+        self.rng = rng
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = list(accumulate(1 / rank ** skew for rank in range(1, len(self.ids) + 1)))
+
+    def sample(self, k=1):
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+class CatalogGenerator:
+    """
+    Generates a synthetic catalog with the shape of a real one: a few directors and actors appear in a large share of
+    the movies (Zipf), movies have one to three genres and release years lean towards the recent decades.
+
+    The same seed gives the same catalog on the same database. Names and titles end with their row id, so they are
+    unique and new runs don't collide with earlier ones. Rows are written through CatalogLoader (COPY on PostgreSQL,
+    bulk_create elsewhere) one chunk at a time, then the search documents and movie counters are built once.
+    """
+    def __init__(self, movies, actors, directors, seed=0, skew=1.0, chunk_size=10000, stdout=None):
+        self.movies = movies
+        self.actors = actors
+        self.directors = directors
+        self.skew = skew
+        self.rng = random.Random(seed)
+        self.loader = CatalogLoader(chunk_size=chunk_size)
+        self.stdout = stdout
+        self.counts = {'movies': 0, 'directors': 0, 'actors': 0, 'cast': 0}
+        self.genre_weights = list(accumulate(1 / rank for rank in range(1, len(GENRES) + 1)))
+
+    def generate(self):
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            director_ids = self.create_people(Director, self.directors, 'directors')
+            actor_ids = self.create_people(Actor, self.actors, 'actors')
+            self.director_sampler = ZipfSampler(self.rng, director_ids, self.skew)
+            self.actor_sampler = ZipfSampler(self.rng, actor_ids, self.skew)
+
+            for offset in range(0, self.movies, self.loader.chunk_size):
+                self.create_movies(min(self.loader.chunk_size, self.movies - offset))
+                if self.stdout:
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(f"{self.counts['movies']} movies generated ({self.counts['movies'] / elapsed:.0f}/s)")
+
+            self.loader.finish()
+
+        self.vacuum()
+        self.counts['seconds'] = time.perf_counter() - start
+        logger.info(f"Catalog generated: {self.counts['movies']} movies in {self.counts['seconds']:.1f}s")
+        return self.counts
+
+    def vacuum(self):
+        """
+        The search vector update leaves a dead version of every new movie row behind. VACUUM ANALYZE reclaims it and
+        refreshes the planner statistics, so EXPLAIN on the generated catalog sees tables like the ones in production.
+        It can't run inside a transaction (e.g. in tests), then autovacuum does it later.
+        """
+        if not self.loader.use_copy or connection.in_atomic_block:
+            return
+
+        with connection.cursor() as cursor:
+            for model in (Movie, Movie.actors.through, Director, Actor):
+                cursor.execute(f'VACUUM ANALYZE {model._meta.db_table}')
+
+    def create_people(self, model, count, count_key):
+        now = timezone.now()
+        ids = []
+        for offset in range(0, count, self.loader.chunk_size):
+            chunk_ids = self.loader.allocate_ids(model, min(self.loader.chunk_size, count - offset))
+            self.loader.write(model, PERSON_COLUMNS, [
+                [pk, self.person_name(pk), self.rng.choice(COUNTRIES), now, now, 0] for pk in chunk_ids
+            ])
+            ids.extend(chunk_ids)
+
+        self.counts[count_key] = len(ids)
+        return ids
+
+    def create_movies(self, count):
+        movie_ids = self.loader.allocate_ids(Movie, count)
+        rows, cast = self.movie_rows(movie_ids)
+        self.loader.write(Movie, MOVIE_COLUMNS, rows)
+        self.loader.write(Movie.actors.through, CAST_COLUMNS, cast)
+
+        self.loader.first_movie_id = self.loader.first_movie_id or movie_ids[0]
+        self.loader.last_movie_id = movie_ids[-1]
+        self.counts['movies'] += len(rows)
+        self.counts['cast'] += len(cast)
+
+    def movie_rows(self, movie_ids):
+        """Movie rows (MOVIE_COLUMNS) and cast rows (CAST_COLUMNS) of `movie_ids`"""
+        rng = self.rng
+        now = timezone.now()
+        rows, cast = [], []
+        # drawn for the whole chunk at once, one choices() call per movie is most of the generation time
+        director_ids = self.director_sampler.sample(len(movie_ids))
+        cast_sizes = [rng.randint(2, 8) for _ in movie_ids]
+        actor_ids = iter(self.actor_sampler.sample(sum(cast_sizes)))
+
+        for pk, director_id, cast_size in zip(movie_ids, director_ids, cast_sizes):
+            words = rng.sample(WORDS, rng.randint(1, 3))
+            genres = []
+            for genre in rng.choices(GENRES, cum_weights=self.genre_weights, k=rng.choices((1, 2, 3), (45, 35, 20))[0]):
+                if genre not in genres:
+                    genres.append(genre)
+
+            # most movies are recent, the tail goes back to the silent era
+            year = max(now.year - int(rng.expovariate(1 / 18)), 1900)
+            rating = round(min(max(rng.gauss(6.4, 1.2), 1), 10), 1)
+
+            description = ' '.join(rng.choices(WORDS, k=rng.randint(12, 40)))
+
+            rows.append([
+                pk, f"{' '.join(words).title()} {pk}", year, genres, rating, description,
+                f'https://image.tmdb.org/t/p/w500/{pk:08d}.jpg', now, now, director_id,
+            ])
+            # a popular actor drawn twice is cast once, so big casts are a bit smaller than cast_size
+            cast.extend([pk, actor_id] for actor_id in dict.fromkeys(islice(actor_ids, cast_size)))
+
+        return rows, cast
+
+    def person_name(self, pk):
+        return f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)} {pk}'
@@ -0,0 +1,342 @@
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime
+from itertools import islice
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django_countries import countries
+from .cache import invalidate_on_commit
+from .models import Movie, Director, Actor, normalize_genres
+
+logger = logging.getLogger(__name__)
+
+MOVIE_COLUMNS = ['id', 'title', 'year', 'genres', 'rating', 'description', 'poster_url', 'created_at', 'updated_at', 'director_id']
+PERSON_COLUMNS = ['id', 'name', 'country', 'created_at', 'updated_at', 'movie_count']
+CAST_COLUMNS = ['movie_id', 'actor_id']
+
+TITLE_LENGTH = Movie._meta.get_field('title').max_length
+POSTER_URL_LENGTH = Movie._meta.get_field('poster_url').max_length
+GENRE_LENGTH = Movie._meta.get_field('genres').base_field.max_length
+# Director and Actor names have the same length
+NAME_LENGTH = Director._meta.get_field('name').max_length
+
+def read_csv(file):
+    """
+    CSV with a header: title, year, genres, rating, description, poster_url, director, director_country, actors and
+    optionally actor_countries. genres, actors and actor_countries are separated by '|', actor_countries goes in the
+    order of actors
+    """
+    for row in csv.DictReader(file):
+        names = (row.get('actors') or '').split('|')
+        actor_countries = (row.get('actor_countries') or '').split('|')
+        yield {
+            **row,
+            'genres': [genre for genre in (row.get('genres') or '').split('|') if genre],
+            'actors': [
+                {'name': name, 'country': actor_countries[i] if i < len(actor_countries) else ''}
+                for i, name in enumerate(names) if name
+            ],
+        }
+
+def read_jsonl(file):
+    """
+    One movie object per line, same keys as the CSV. actors items are names or {"name", "country"} objects. A line
+    that isn't valid JSON is logged and given as None, which the loader skips
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            logger.warning(f'Line {number} is not valid JSON, skipped')
+            yield None
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+class CatalogLoader:
+    """
+    Loads a movie catalog with a constant number of statements per chunk. Directors and actors are matched by name
+    (case insensitive) against in-memory name -> id maps that are filled from the database on demand, new ones get
+    their ids from the table sequences before they are inserted, so movies and cast rows can reference them right
+    away. Rows are written with COPY on PostgreSQL and with bulk_create elsewhere.
+
+    Only one chunk of input is held in memory at a time; the name maps grow with the number of distinct people.
+    """
+    def __init__(self, chunk_size=5000, stdout=None):
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.use_copy = connection.vendor == 'postgresql'
+        self.directors = {}
+        self.actors = {}
+        self.counts = {'movies': 0, 'directors': 0, 'actors': 0, 'cast': 0, 'skipped': 0}
+        self.first_movie_id = None
+        self.last_movie_id = None
+
+    def load(self, rows):
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            for chunk in chunked(rows, self.chunk_size):
+                self.load_chunk(chunk)
+                if self.stdout:
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(f"{self.counts['movies']} movies loaded ({self.counts['movies'] / elapsed:.0f}/s)")
+
+            self.finish()
+
+        self.counts['seconds'] = time.perf_counter() - start
+        logger.info(f"Catalog loaded: {self.counts['movies']} movies in {self.counts['seconds']:.1f}s")
+        return self.counts
+
+    def load_chunk(self, rows):
+        rows = self.clean_rows(rows)
+        if not rows:
+            return
+
+        new_directors = self.find_people(Director, self.directors, [(row['director'], row['director_country']) for row in rows])
+        new_actors = self.find_people(Actor, self.actors, [person for row in rows for person in row['actors']])
+
+        # people are only created with a country, the rows that would need one without it are skipped
+        kept = [
+            row for row in rows
+            if self.known(self.directors, new_directors, row['director'])
+            and all(self.known(self.actors, new_actors, name) for name, country in row['actors'])
+        ]
+        self.counts['skipped'] += len(rows) - len(kept)
+        rows = kept
+        if not rows:
+            return
+
+        director_ids = self.create_people(Director, self.directors, 'directors', new_directors, [
+            row['director'] for row in rows
+        ])
+        actor_ids = self.create_people(Actor, self.actors, 'actors', new_actors, [
+            name for row in rows for name, country in row['actors']
+        ])
+
+        now = timezone.now()
+        movie_ids = self.allocate_ids(Movie, len(rows))
+        self.write(Movie, MOVIE_COLUMNS, [
+            [movie_id, row['title'], row['year'], row['genres'], row['rating'], row['description'] or None,
+             row['poster_url'] or None, now, now, director_ids[row['director'].lower()]]
+            for movie_id, row in zip(movie_ids, rows)
+        ])
+
+        cast = {
+            (movie_id, actor_ids[name.lower()])
+            for movie_id, row in zip(movie_ids, rows)
+            for name, country in row['actors']
+        }
+        self.write(Movie.actors.through, CAST_COLUMNS, sorted(cast))
+
+        # sequence values only grow, so the loaded movies are within [first, last]
+        self.first_movie_id = self.first_movie_id or movie_ids[0]
+        self.last_movie_id = movie_ids[-1]
+        self.counts['movies'] += len(rows)
+        self.counts['cast'] += len(cast)
+
+    def finish(self):
+        """
+        Builds the search documents of the loaded movies and recounts the movies of their directors and actors, one
+        statement each, and invalidates the cache. The catalog stats are left to the caller, to refresh once the load
+        is committed (see movies.stats)
+        """
+        if self.first_movie_id is None:
+            return
+
+        if self.use_copy:
+            # the tables grew inside this transaction, without fresh statistics the update plans seq scans per row
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE movies_movie, movies_director, movies_actor, movies_movie_actors')
+
+        loaded = Movie.objects.filter(pk__range=(self.first_movie_id, self.last_movie_id))
+        loaded.update_search_vector()
+        Director.objects.filter(pk__in=loaded.values('director_id')).recount_movies()
+        Actor.objects.filter(pk__in=Movie.actors.through.objects.filter(movie__in=loaded).values('actor_id')).recount_movies()
+        # COPY and bulk_create don't send signals
+        invalidate_on_commit('movies', 'directors', 'actors')
+
+    def clean_rows(self, rows):
+        """
+        Drops the rows the API would reject (no title or director, values of the wrong type or too long for their
+        columns, years and ratings out of range) and titles that already exist, and normalizes the rest. Countries become ISO alpha-2
+        codes, '' when unknown (see load_chunk).
+        """
+        cleaned = {}
+        for row in rows:
+            row = self.clean_row(row)
+            if row is None or row['title'].lower() in cleaned:
+                self.counts['skipped'] += 1
+                continue
+            cleaned[row['title'].lower()] = row
+
+        # titles loaded by a previous run or chunk
+        existing = Movie.objects.annotate(lower_title=Lower('title')).filter(lower_title__in=list(cleaned))
+        for title in existing.values_list('title', flat=True):
+            if cleaned.pop(title.lower(), None):
+                self.counts['skipped'] += 1
+
+        return list(cleaned.values())
+
+    def clean_row(self, row):
+        """The row ready to be written, None when it is invalid"""
+        if not has_valid_types(row):
+            return None
+
+        title = (row.get('title') or '').strip()
+        director = (row.get('director') or '').strip()
+        genres = normalize_genres(row.get('genres'))
+        description = row.get('description') or None
+        poster_url = row.get('poster_url') or None
+        if not title or not director:
+            return None
+
+        try:
+            year = int(row['year']) if row.get('year') not in (None, '') else None
+            rating = float(row['rating']) if row.get('rating') not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+        # same ranges as MovieSerializer
+        if year is not None and not 1888 <= year <= datetime.now().year:
+            return None
+        if rating is not None and not 1 <= rating <= 10:
+            return None
+
+        actors = []
+        for actor in row.get('actors') or []:
+            name, country = (actor.get('name'), actor.get('country')) if isinstance(actor, dict) else (actor, '')
+            if name and name.strip():
+                actors.append((name.strip(), country_code(country)))
+
+        # a value longer than its column would abort the whole load
+        values = [(TITLE_LENGTH, title), (POSTER_URL_LENGTH, poster_url), (NAME_LENGTH, director)]
+        values += [(GENRE_LENGTH, genre) for genre in genres] + [(NAME_LENGTH, name) for name, country in actors]
+        if any(value and len(value) > max_length for max_length, value in values):
+            return None
+
+        return {
+            'title': title, 'year': year, 'rating': rating, 'genres': genres, 'description': description,
+            'poster_url': poster_url, 'director': director,
+            'director_country': country_code(row.get('director_country')), 'actors': actors,
+        }
+
+    def find_people(self, model, ids, people):
+        """
+        Adds the people of `people` ((name, country) pairs) that are in the database to the name map `ids` and
+        returns the ones that are not, name -> (name, country) with the first country given for them. People that
+        would be new without any country are left out.
+        """
+        missing = {name.lower() for name, country in people if name.lower() not in ids}
+        if missing:
+            found = model.objects.annotate(lower_name=Lower('name')).filter(lower_name__in=list(missing))
+            for name, pk in found.values_list('name', 'id'):
+                ids.setdefault(name.lower(), pk)
+
+        new = {}
+        for name, country in people:
+            if name.lower() not in ids and country:
+                new.setdefault(name.lower(), (name, country))
+        return new
+
+    def known(self, ids, new, name):
+        return name.lower() in ids or name.lower() in new
+
+    def create_people(self, model, ids, count_key, new, names):
+        """Inserts the people of `new` referenced by `names` and returns the name map with their ids"""
+        missing = {name.lower(): new[name.lower()] for name in names if name.lower() not in ids}
+        if missing:
+            now = timezone.now()
+            new_ids = self.allocate_ids(model, len(missing))
+            self.write(model, PERSON_COLUMNS, [
+                [pk, name, country, now, now, 0] for pk, (name, country) in zip(new_ids, missing.values())
+            ])
+            ids.update(zip(missing, new_ids))
+            self.counts[count_key] += len(missing)
+
+        return ids
+
+    def allocate_ids(self, model, count):
+        """Reserves `count` ids, so the rows can be referenced before they are inserted"""
+        if not self.use_copy:
+            # no sequence to draw from, the load runs in a transaction so max(id) is stable enough for a seeding tool
+            last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            return list(range(last_id + 1, last_id + count + 1))
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [model._meta.db_table, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def write(self, model, columns, rows):
+        if not rows:
+            return
+
+        if not self.use_copy:
+            model.objects.bulk_create([
+                model(**dict(zip(columns, row))) for row in rows
+            ], batch_size=1000)
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([copy_value(value) for value in row])
+        buffer.seek(0)
+
+        # an unquoted empty field is NULL in CSV COPY, so empty strings of NOT NULL text columns need FORCE_NOT_NULL
+        fields = {field.column: field for field in model._meta.concrete_fields}
+        not_null = [
+            column for column in columns
+            if not fields[column].null and fields[column].get_internal_type() in ('CharField', 'TextField')
+        ]
+        options = f'FORMAT csv, FORCE_NOT_NULL ({", ".join(not_null)})' if not_null else 'FORMAT csv'
+
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(f'COPY {model._meta.db_table} ({", ".join(columns)}) FROM STDIN WITH ({options})', buffer)
+
+# values that have to be strings when they are given. CSV rows only have strings, JSONL ones can have anything
+TEXT_KEYS = ['title', 'director', 'description', 'poster_url']
+
+def has_valid_types(row):
+    """Whether a row is an object with text where clean_row expects text, and lists of them for genres and actors"""
+    if not isinstance(row, dict):
+        return False
+    if any(row.get(key) is not None and not isinstance(row[key], str) for key in TEXT_KEYS):
+        return False
+
+    genres, actors = row.get('genres') or [], row.get('actors') or []
+    if not isinstance(genres, list) or not all(isinstance(genre, str) for genre in genres):
+        return False
+    if not isinstance(actors, list):
+        return False
+    return all(
+        isinstance(actor, str) or isinstance(actor, dict) and isinstance(actor.get('name') or '', str)
+        for actor in actors
+    )
+
+def country_code(value):
+    """ISO alpha-2 code of a country code (alpha-2, alpha-3 or numeric), '' when it is empty or unknown"""
+    return countries.alpha2(str(value).strip()) if value else ''
+
+def copy_value(value):
+    """Value for a CSV COPY row. None becomes an unquoted empty field (NULL) and lists become array literals"""
+    if isinstance(value, list):
+        items = (item.replace('\\', '\\\\').replace('"', '\\"') for item in value)
+        return '{' + ','.join(f'"{item}"' for item in items) + '}'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
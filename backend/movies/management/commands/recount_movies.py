@@ -0,0 +1,30 @@
+from django.db import transaction
+from django.db.models import F
+from django.core.management.base import BaseCommand
+from movies.cache import invalidate
+from movies.models import Director, Actor
+
+class Command(BaseCommand):
+    help = 'Recomputes the movie_count of every director and actor from the movies and reports the drifted ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted counters')
+
+    def handle(self, *args, **options):
+        for model, namespace in ((Director, 'directors'), (Actor, 'actors')):
+            with transaction.atomic():
+                drifted = model.objects.annotate(counted=model.objects.counted_movies()).exclude(movie_count=F('counted'))
+                total = model.objects.count()
+
+                if options['dry_run']:
+                    fixed = drifted.count()
+                else:
+                    fixed = model.objects.filter(pk__in=drifted.values('pk')).recount_movies()
+
+            label = model._meta.verbose_name_plural.capitalize()
+            if options['dry_run']:
+                self.stdout.write(f'{label}: {fixed} of {total} counters drifted')
+            else:
+                if fixed:
+                    invalidate(namespace)
+                self.stdout.write(self.style.SUCCESS(f'{label}: {fixed} of {total} counters fixed'))
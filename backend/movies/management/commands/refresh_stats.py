@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from movies.stats import refresh_catalog_stats
+
+class Command(BaseCommand):
+    help = 'Refreshes the catalog stats materialized view behind /api/stats/ (e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--blocking', action='store_true',
+            help='Refresh without CONCURRENTLY: faster, but /api/stats/ waits for it'
+        )
+
+    def handle(self, *args, **options):
+        seconds = refresh_catalog_stats(concurrently=not options['blocking'])
+        self.stdout.write(self.style.SUCCESS(f'Catalog stats refreshed in {seconds:.2f}s'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from movies import slow_queries
+
+class Command(BaseCommand):
+    help = 'Shows the latest slow queries recorded by the API (SLOW_QUERY_MS), newest first, with their plans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Number of entries (default 20)')
+        parser.add_argument('--no-plans', action='store_true', help='Leave out the EXPLAIN plans')
+        parser.add_argument('--clear', action='store_true', help='Empty the buffer after showing it')
+
+    def handle(self, *args, **options):
+        entries = slow_queries.recent(options['limit'])
+
+        for entry in entries:
+            self.stdout.write(self.style.WARNING(
+                f"[{entry['time']}] {entry['duration_ms']}ms  {entry['method']} {entry['path']}  ({entry['view']})"
+            ))
+            self.stdout.write(entry['sql'])
+            self.stdout.write(f"params: {entry['params']}")
+            if entry['plan'] and not options['no_plans']:
+                self.stdout.write(entry['plan'])
+            self.stdout.write('')
+
+        if options['clear']:
+            slow_queries.clear()
+        self.stdout.write(self.style.SUCCESS(f"{len(entries)} slow queries{', buffer cleared' if options['clear'] else ''}"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from movies.services import TMDBCache
+
+class Command(BaseCommand):
+    help = 'Shows the hit/miss counters of the TMDB response cache, summed over every worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after showing them')
+
+    def handle(self, *args, **options):
+        tmdb_cache = TMDBCache.from_settings()
+        stats = tmdb_cache.get_stats()
+
+        hits = stats['local_hits'] + stats['shared_hits']
+        lookups = hits + stats['misses']
+        hit_ratio = hits / lookups * 100 if lookups else 0
+
+        self.stdout.write(f"Local hits:    {stats['local_hits']}")
+        self.stdout.write(f"Shared hits:   {stats['shared_hits']}")
+        self.stdout.write(f"Misses:        {stats['misses']}")
+        self.stdout.write(f"Negative hits: {stats['negative_hits']} (cached 'no results')")
+        self.stdout.write(self.style.SUCCESS(f'Hit ratio: {hit_ratio:.1f}% ({hits} of {lookups} lookups did not call TMDB)'))
+
+        if options['reset']:
+            tmdb_cache.reset_stats()
+            self.stdout.write('Counters reset')
@@ -0,0 +1,120 @@
+import ipaddress
+import os
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from .timing import current_timer
+
+# With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py), every worker writes its samples to files in that directory
+# and /metrics adds up the files of all of them, so any worker can answer the scrape. Without it (runserver, tests)
+# the metrics live in the process.
+
+REQUEST_LATENCY = Histogram(
+    'movies_http_request_duration_seconds', 'Time to answer a request, by view, method and status',
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'movies_http_request_db_queries', 'Database queries run by a request, by view',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100),
+)
+PAGE_CACHE = Counter(
+    'movies_page_cache_requests_total', 'Cached page lookups of cache_page_by_generation, by page and result',
+    ['page', 'result'],
+)
+TMDB_LATENCY = Histogram(
+    'movies_tmdb_request_duration_seconds', 'Time of a TMDB call including retries, by endpoint',
+    ['endpoint'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+)
+TMDB_ERRORS = Counter(
+    'movies_tmdb_errors_total', 'Failed TMDB attempts, by endpoint and reason', ['endpoint', 'reason'],
+)
+AUTH_FAILURES = Counter(
+    'movies_auth_failures_total', 'Rejected logins and tokens, by reason (e.g. token_not_valid)', ['reason'],
+)
+
+class MetricsMiddleware:
+    """
+    Observes the latency of every request, labeled with its url name, and the number of queries it ran (from
+    movies.timing, so it goes after ServerTimingMiddleware). A few microseconds per request. Sync or async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, elapsed):
+        # the url name keeps the label set small, paths would have one value per id
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(elapsed)
+
+        timer = current_timer()
+        if timer is not None:
+            REQUEST_QUERIES.labels(view).observe(timer.queries)
+
+def record_page_cache(page, hit):
+    PAGE_CACHE.labels(page, 'hit' if hit else 'miss').inc()
+
+def record_auth_failure(reason):
+    AUTH_FAILURES.labels(reason).inc()
+
+def metrics_allowed(request):
+    """
+    With METRICS_TOKEN the scraper has to send `Authorization: Bearer <token>`, with METRICS_ALLOWED_IPS it has to
+    connect from one of them. Without either, /metrics is closed unless DEBUG is on.
+    """
+    token = settings.METRICS_TOKEN
+    networks = settings.METRICS_ALLOWED_IPS
+    if not token and not networks:
+        return settings.DEBUG
+
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return False
+    if networks and not in_networks(request.META.get('REMOTE_ADDR', ''), networks):
+        return False
+    return True
+
+def in_networks(address, networks):
+    try:
+        address = ipaddress.ip_address(address)
+        return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+    except ValueError:
+        return False
+
+def metrics_view(request):
+    """Prometheus text format, see metrics_allowed"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
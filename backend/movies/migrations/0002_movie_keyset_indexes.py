@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:45
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='movie_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(models.OrderBy(django.db.models.functions.comparison.Coalesce(models.F('rating'), models.Value(0.0, output_field=models.FloatField())), descending=True), models.OrderBy(models.F('id'), descending=True), name='movie_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def build_search_vectors(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Director = apps.get_model('movies', 'Director')
+    Actor = apps.get_model('movies', 'Actor')
+
+    director_name = Director.objects.filter(pk=OuterRef('director_id')).values('name')[:1]
+    actor_names = (
+        Actor.objects.filter(movies=OuterRef('pk'))
+        .values('movies')
+        .annotate(names=StringAgg('name', ' '))
+        .values('names')
+    )
+
+    Movie.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector(Subquery(director_name), weight='B', config='english')
+        + SearchVector(Subquery(actor_names), weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_movie_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='movie_search_vector_gin'),
+        ),
+        migrations.RunPython(build_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:57
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+def normalize_genres(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+
+    changed = []
+    for movie in Movie.objects.only('id', 'genres').iterator(chunk_size=2000):
+        genres = []
+        for genre in movie.genres or []:
+            genre = ' '.join(word.capitalize() for word in str(genre).split())
+            if genre and genre not in genres:
+                genres.append(genre)
+
+        if genres != movie.genres:
+            movie.genres = genres
+            changed.append(movie)
+
+    Movie.objects.bulk_update(changed, ['genres'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_genres, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movie',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['genres'], name='movie_genres_gin'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_movies(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    Director = apps.get_model('movies', 'Director')
+    Actor = apps.get_model('movies', 'Actor')
+    Cast = Movie.actors.through
+
+    directors = Movie.objects.filter(director=OuterRef('pk')).order_by().values('director').annotate(count=Count('pk'))
+    Director.objects.update(movie_count=Coalesce(Subquery(directors.values('count')), 0))
+
+    actors = Cast.objects.filter(actor=OuterRef('pk')).order_by().values('actor').annotate(count=Count('pk'))
+    Actor.objects.update(movie_count=Coalesce(Subquery(actors.values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actor',
+            name='movie_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='director',
+            name='movie_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_movies, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='actor',
+            index=models.Index(fields=['movie_count', 'id'], name='actor_movie_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='director',
+            index=models.Index(fields=['movie_count', 'id'], name='director_movie_count_idx'),
+        ),
+    ]
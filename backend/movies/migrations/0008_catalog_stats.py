@@ -0,0 +1,80 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+# One row per (facet, key). Every facet is computed in a single pass over its table, genres are expanded with
+# unnest() and the actor facet goes through the cast table. refreshed_at is the time of the last refresh.
+CREATE_VIEW = """
+CREATE MATERIALIZED VIEW movies_catalog_stats AS
+SELECT facet, key, label, movies, avg_rating, now() AS refreshed_at
+FROM (
+    SELECT 'total' AS facet, 'movies' AS key, 'Movies' AS label, count(*) AS movies, avg(rating) AS avg_rating
+    FROM movies_movie
+    UNION ALL
+    SELECT 'total', 'directors', 'Directors', count(DISTINCT director_id), NULL
+    FROM movies_movie
+    UNION ALL
+    SELECT 'total', 'actors', 'Actors', count(DISTINCT actor_id), NULL
+    FROM movies_movie_actors
+    UNION ALL
+    SELECT 'genre', genre, genre, count(*), avg(rating)
+    FROM movies_movie, unnest(genres) AS genre
+    GROUP BY genre
+    UNION ALL
+    SELECT 'year', year::text, year::text, count(*), avg(rating)
+    FROM movies_movie
+    WHERE year IS NOT NULL
+    GROUP BY year
+    UNION ALL
+    SELECT 'decade', (year / 10 * 10)::text, (year / 10 * 10)::text || 's', count(*), avg(rating)
+    FROM movies_movie
+    WHERE year IS NOT NULL
+    GROUP BY year / 10 * 10
+    UNION ALL
+    SELECT 'director', director.id::text, director.name, count(*), avg(movie.rating)
+    FROM movies_movie movie
+    JOIN movies_director director ON director.id = movie.director_id
+    GROUP BY director.id
+    UNION ALL
+    SELECT 'actor', actor.id::text, actor.name, count(*), avg(movie.rating)
+    FROM movies_movie_actors cast_row
+    JOIN movies_actor actor ON actor.id = cast_row.actor_id
+    JOIN movies_movie movie ON movie.id = cast_row.movie_id
+    GROUP BY actor.id
+) AS stats
+WITH DATA;
+
+-- REFRESH ... CONCURRENTLY needs a unique index
+CREATE UNIQUE INDEX movies_catalog_stats_facet_key ON movies_catalog_stats (facet, key);
+-- top directors/actors
+CREATE INDEX movies_catalog_stats_facet_movies ON movies_catalog_stats (facet, movies DESC, key);
+"""
+
+DROP_VIEW = 'DROP MATERIALIZED VIEW IF EXISTS movies_catalog_stats'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_count'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_VIEW, DROP_VIEW),
+        migrations.CreateModel(
+            name='CatalogStat',
+            fields=[
+                ('pk', models.CompositePrimaryKey('facet', 'key', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('facet', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=200)),
+                ('label', models.CharField(max_length=200)),
+                ('movies', models.IntegerField()),
+                ('avg_rating', models.FloatField(null=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'movies_catalog_stats',
+                'managed': False,
+            },
+        ),
+    ]
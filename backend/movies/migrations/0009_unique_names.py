@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+
+# groups listed in the error, the rest are only counted
+MAX_LISTED = 20
+
+
+def check_case_insensitive_duplicates(apps, schema_editor):
+    """
+    Fails with the rows that differ only in case, instead of the bare IntegrityError of the index build. They have to
+    be merged or renamed by hand, since movies, casts and counters reference them.
+    """
+    problems = []
+    for model_name, field in (('Director', 'name'), ('Actor', 'name'), ('Movie', 'title')):
+        model = apps.get_model('movies', model_name)
+        groups = list(
+            model.objects.annotate(lower=Lower(field)).values('lower').annotate(rows=Count('id'))
+            .filter(rows__gt=1).order_by('lower').values_list('lower', flat=True)
+        )
+        for lower in groups[:MAX_LISTED]:
+            rows = model.objects.annotate(lower=Lower(field)).filter(lower=lower).order_by('id')
+            problems.append(f'  {model_name} {", ".join(f"{pk}: {value!r}" for pk, value in rows.values_list("id", field))}')
+        if len(groups) > MAX_LISTED:
+            problems.append(f'  ... and {len(groups) - MAX_LISTED} more {model_name} groups')
+
+    if problems:
+        raise RuntimeError(
+            'Titles and names must be unique regardless of case. Merge or rename these rows (id: value) and run the '
+            'migration again:\n' + '\n'.join(problems)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_case_insensitive_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='director',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='director_name_unique', violation_error_message='Director already exists'),
+        ),
+        migrations.AddConstraint(
+            model_name='actor',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='actor_name_unique', violation_error_message='Actor already exists'),
+        ),
+        migrations.AddConstraint(
+            model_name='movie',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('title'), name='movie_title_unique', violation_error_message='Movie already exists'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# movies.models.GENRE_SPELLINGS when this migration was written
+GENRE_SPELLINGS = {'tv movie': 'TV Movie'}
+
+
+def normalize_genres(apps, schema_editor):
+    """
+    0005 stored 'TV Movie' as 'Tv Movie', and for a while genres were saved in the case they were sent in ('DRAMA').
+    Rewrites them in the canonical form of movies.models.normalize_genres, so the genre filters match every row
+    """
+    Movie = apps.get_model('movies', 'Movie')
+
+    changed = []
+    for movie in Movie.objects.only('id', 'genres').iterator(chunk_size=2000):
+        genres = []
+        for genre in movie.genres or []:
+            genre = ' '.join(str(genre).split())
+            genre = GENRE_SPELLINGS.get(genre.lower()) or ' '.join(word.capitalize() for word in genre.split())
+            if genre and genre not in genres:
+                genres.append(genre)
+
+        if genres != movie.genres:
+            movie.genres = genres
+            changed.append(movie)
+
+    Movie.objects.bulk_update(changed, ['genres'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_unique_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_genres, migrations.RunPython.noop),
+    ]
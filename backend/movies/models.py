@@ -1,47 +1,157 @@
 from django.db import models
+from django.db.models import Count, F, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Lower, Upper
 from django_countries.fields import CountryField
+from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta
 
-class Director(models.Model):
-    name = models.CharField(max_length=100)
-    country = CountryField()
-
-    def clean(self):
-        if Director.objects.filter(name__iexact=self.name).exclude(id=self.id).exists():
-            raise ValidationError('Director already exists')
+# sort key of the rating ordering. Movies without rating go as 0, so (key, id) is a total order for the keyset pagination
+RATING_SORT_KEY = Coalesce(F('rating'), Value(0.0, output_field=FloatField()))
+
+# text search configuration of Movie.search_vector. Queries must use the same one to match it
+SEARCH_CONFIG = 'english'
+
+# genres that aren't spelled as capitalized words, by their lowercase form
+GENRE_SPELLINGS = {genre.lower(): genre for genre in ['TV Movie']}
+
+def normalize_genres(genres):
+    """
+    Canonical form of a genres list: trimmed, capitalized words ('science  FICTION' -> 'Science Fiction') or the
+    spelling in GENRE_SPELLINGS ('tv movie' -> 'TV Movie'), no duplicates. Every case of a genre gets the same form,
+    so the genre filters match the stored arrays as they are
+    """
+    normalized = []
+    for genre in genres or []:
+        genre = ' '.join(str(genre).split())
+        genre = GENRE_SPELLINGS.get(genre.lower()) or ' '.join(word.capitalize() for word in genre.split())
+        if genre and genre not in normalized:
+            normalized.append(genre)
+    return normalized
+
+class MovieStatsQuerySet(models.QuerySet):
+    def with_movie_stats(self):
+        """Computes movies_name in the same query, instead of an extra query per row. total_movies is a column"""
+        return self.annotate(
+            movie_titles=ArrayAgg('movies__title', filter=Q(movies__isnull=False), order_by='movies__id', default=Value([])),
+        )
+
+    def counted_movies(self):
+        """Expression with the number of movies of each row, counted from the movies table"""
+        relation = self.model._meta.get_field('movies')
+        if relation.many_to_many:
+            # the rows of the through table are enough, joining each one to its movie is most of the cost
+            column = relation.field.m2m_reverse_field_name()
+            movies = relation.through.objects.filter(**{column: OuterRef('pk')})
+        else:
+            column = relation.field.name
+            movies = relation.related_model.objects.filter(**{column: OuterRef('pk')})
+        counts = movies.order_by().values(column).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(counts), 0)
+
+    def recount_movies(self):
+        """
+        Recomputes movie_count. The counters are kept up to date from movies.signals, this is for writes that don't
+        send signals (bulk inserts, COPY, raw SQL) and to repair drift.
+        """
+        return self.update(movie_count=self.counted_movies())
+
+class MovieCountMixin:
+    """
+    movie_count is only written with F() updates (movies.signals) and recount_movies(). A regular save of an existing
+    row leaves it out, so a stale instance can't overwrite a concurrent increment.
+    """
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'movie_count'
+            ]
+        super().save(*args, **kwargs)
 
     @property
     def total_movies(self):
-        return self.movies.count()
+        return self.movie_count
+
+class Director(MovieCountMixin, models.Model):
+    name = models.CharField(max_length=100)
+    country = CountryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # denormalized number of movies, see MovieCountMixin
+    movie_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = MovieStatsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # trigram index over UPPER(name), which is what icontains/iexact compare on Postgres
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='director_name_trgm'),
+            # ordering and filtering by number of movies
+            models.Index(fields=['movie_count', 'id'], name='director_movie_count_idx'),
+        ]
+        constraints = [
+            # unique index on LOWER(name), see movies.serializers.UniqueConstraintErrorsMixin
+            models.UniqueConstraint(Lower('name'), name='director_name_unique', violation_error_message='Director already exists'),
+        ]
 
     @property
     def movies_name(self):
+        if hasattr(self, 'movie_titles'):
+            return self.movie_titles
         return list(self.movies.values_list('title', flat=True))
 
     def __str__(self):
         return self.name
     
-class Actor(models.Model):
+class Actor(MovieCountMixin, models.Model):
     name = models.CharField(max_length=100)
     country = CountryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # denormalized number of movies, see MovieCountMixin
+    movie_count = models.PositiveIntegerField(default=0, editable=False)
 
-    def clean(self):
-        if Actor.objects.filter(name__iexact=self.name).exclude(id=self.id).exists():
-            raise ValidationError('Actor already exists')
+    objects = MovieStatsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='actor_name_trgm'),
+            models.Index(fields=['movie_count', 'id'], name='actor_movie_count_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='actor_name_unique', violation_error_message='Actor already exists'),
+        ]
 
-    @property
-    def total_movies(self):
-        return self.movies.count()
-    
     @property
     def movies_name(self):
+        if hasattr(self, 'movie_titles'):
+            return self.movie_titles
         return list(self.movies.values_list('title', flat=True))
 
     def __str__(self):
         return self.name
 
+class MovieQuerySet(models.QuerySet):
+    def update_search_vector(self):
+        """Rebuilds the full-text document of the movies: title (A) > director and actors (B) > description (C)"""
+        director_name = Director.objects.filter(pk=OuterRef('director_id')).values('name')[:1]
+        actor_names = (
+            Actor.objects.filter(movies=OuterRef('pk'))
+            .values('movies')
+            .annotate(names=StringAgg('name', ' '))
+            .values('names')
+        )
+
+        return self.update(search_vector=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(director_name), weight='B', config=SEARCH_CONFIG)
+            + SearchVector(Subquery(actor_names), weight='B', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+        ))
+
 class Movie(models.Model):
     title = models.CharField(max_length=200, blank=False, null=False)
     year = models.IntegerField(blank=True, null=True)
@@ -50,14 +160,35 @@ class Movie(models.Model):
     description = models.TextField(blank=True, null=True)
     poster_url = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     director = models.ForeignKey(Director, on_delete=models.CASCADE, related_name='movies')
     actors = models.ManyToManyField(Actor, related_name='movies')
+    # maintained by MovieQuerySet.update_search_vector() from movies.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # back the keyset pagination, see movies.pagination
+            models.Index(F('created_at').desc(), F('id').desc(), name='movie_created_at_id_idx'),
+            models.Index(RATING_SORT_KEY.desc(), F('id').desc(), name='movie_rating_id_idx'),
+            GinIndex(fields=['search_vector'], name='movie_search_vector_gin'),
+            # trigram index for the title icontains filter
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='movie_title_trgm'),
+            # array containment (@>) and overlap (&&) of the genres filter
+            GinIndex(fields=['genres'], name='movie_genres_gin'),
+        ]
+        constraints = [
+            models.UniqueConstraint(Lower('title'), name='movie_title_unique', violation_error_message='Movie already exists'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # genres are stored normalized so the filter can match them exactly through the GIN index
+        self.genres = normalize_genres(self.genres)
+        super().save(*args, **kwargs)
 
     def clean(self):
-        if Movie.objects.filter(title__iexact=self.title).exclude(id=self.id).exists():
-            raise ValidationError({'title': 'Movie already exists'})
-
         current_year = datetime.now().year
 
         if self.year is None or not (1880 <= self.year <= current_year):
@@ -69,5 +200,22 @@ class Movie(models.Model):
     def __str__(self):
         return self.title
 
+class CatalogStat(models.Model):
+    """
+    Row of the movies_catalog_stats materialized view (migration 0008): the number of movies and average rating of
+    a facet value (genre, year, decade, director, actor) or a catalog total. Refreshed by movies.stats.
+    """
+    pk = models.CompositePrimaryKey('facet', 'key')
+    facet = models.CharField(max_length=20)
+    key = models.CharField(max_length=200)
+    label = models.CharField(max_length=200)
+    movies = models.IntegerField()
+    avg_rating = models.FloatField(null=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'movies_catalog_stats'
 
-    
\ No newline at end of file
+    def __str__(self):
+        return f'{self.facet}: {self.label}'
@@ -0,0 +1,227 @@
+import base64
+import json
+from datetime import datetime
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .models import RATING_SORT_KEY
+
+# sort keys used by the keyset pagination. They must match the expressions of the indexes declared in Movie.Meta
+KEYSET_EXPRESSIONS = {
+    'created_at': F('created_at'),
+    'rating': RATING_SORT_KEY,
+    # annotated by MovieFullTextSearchFilter
+    'rank': F('rank'),
+}
+
+
+class MovieKeysetPagination(BasePagination):
+    """
+    Opt-in keyset (seek) pagination. It is only used when the request sends a `cursor` or a `page_size`,
+    otherwise the list is returned unpaginated as before.
+
+    Rows are ordered by (key, id) and every page is fetched with a `WHERE (key, id) < (last_key, last_id)` condition
+    instead of an OFFSET, so page N costs the same as page 1. Cursors are opaque base64 tokens.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    page_size = 20
+    max_page_size = 100
+
+    # ordering value -> (key, descending)
+    orderings = {
+        '-created_at': ('created_at', True),
+        'created_at': ('created_at', False),
+        '-rating': ('rating', True),
+        'rating': ('rating', False),
+        '-rank': ('rank', True),
+    }
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the page fetched through the async ORM, see movies.async_views"""
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+
+        return self.set_page([obj async for obj in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """Query of the requested page plus one row (to know if there is a next one), None when not paginating"""
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset)
+        key, descending = self.orderings[self.ordering]
+
+        self.cursor = self.decode_cursor(request, key)
+        reverse = self.cursor['reverse'] if self.cursor else False
+
+        # when going backwards we walk the index in the opposite direction and flip the page afterwards
+        walk_descending = descending != reverse
+        queryset = queryset.annotate(keyset_value=KEYSET_EXPRESSIONS[key])
+        if self.cursor:
+            queryset = queryset.filter(self.get_seek_condition(walk_descending, self.cursor['position']))
+
+        queryset = queryset.order_by(*(('-keyset_value', '-id') if walk_descending else ('keyset_value', 'id')))
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.cursor and self.cursor['reverse']:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque pagination cursor. Enables pagination.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results per page (max {self.max_page_size}). Enables pagination.',
+                'schema': {'type': 'integer'},
+            },
+            {
+                'name': self.ordering_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Ordering of the paginated results.',
+                'schema': {'type': 'string', 'enum': list(self.orderings)},
+            },
+        ]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset):
+        # full-text search results are sorted by relevance unless another ordering is asked for
+        ranked = 'rank' in queryset.query.annotations
+        ordering = request.query_params.get(self.ordering_query_param)
+
+        if ordering in self.orderings and (ranked or self.orderings[ordering][0] != 'rank'):
+            return ordering
+
+        return '-rank' if ranked else self.default_ordering
+
+    def get_seek_condition(self, descending, position):
+        """Rows strictly after `position` in the walk direction, as a row comparison `(key, id) < (value, pk)`"""
+        value, pk = position
+        row = Func(F('keyset_value'), F('id'), function='ROW', output_field=Field())
+        bound = Func(Value(value), Value(pk), function='ROW', output_field=Field())
+
+        return LessThan(row, bound) if descending else GreaterThan(row, bound)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+
+        return self.build_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+
+        return self.build_link(self.page[0], reverse=True)
+
+    def build_link(self, obj, reverse):
+        value = obj.keyset_value
+        if isinstance(value, datetime):
+            value = value.isoformat()
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        url = remove_query_param(url, self.ordering_query_param)
+        if self.ordering != self.default_ordering:
+            url = replace_query_param(url, self.ordering_query_param, self.ordering)
+
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor([value, obj.pk], reverse))
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': reverse, 'o': self.ordering}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, key):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(encoded + padding))
+            value, pk = payload['p']
+            reverse = bool(payload['r'])
+            ordering = payload['o']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        # a cursor only makes sense for the ordering it was built with. JSON true/false are ints to isinstance
+        if ordering != self.ordering or not isinstance(pk, int) or isinstance(pk, bool):
+            raise NotFound(self.invalid_cursor_message)
+
+        if key == 'created_at':
+            value = parse_datetime(value) if isinstance(value, str) else None
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            value = None
+
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return {'position': (value, pk), 'reverse': reverse}
@@ -0,0 +1,41 @@
+import orjson
+from django_countries.fields import Country
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from .timing import timed
+
+_encoder = JSONEncoder()
+
+def default(obj):
+    """Types orjson doesn't serialize natively, encoded the same way DRF's JSONEncoder does"""
+    if isinstance(obj, Country):
+        return obj.code
+    return _encoder.default(obj)
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer on top of orjson, several times faster on big lists. Decimals, lazy strings, querysets, etc.
+    fall back to DRF's encoder and countries are rendered as their code. Selected with API_JSON_BACKEND=orjson.
+    """
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+        # orjson only knows 2 spaces, any indent requested with the Accept header gets that
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(data, default=default, option=option)
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -1,10 +1,58 @@
+from contextlib import contextmanager
 from datetime import datetime
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from drf_spectacular.utils import extend_schema_serializer, OpenApiExample
 from .models import Movie, Director, Actor
 from .services import fetch_movie_data
+from .timing import phase
 
-class DirectorSerializer(serializers.ModelSerializer):
+# fields filled from TMDB when a movie is created without them
+TMDB_FIELDS = ["year", "genres", "description", "poster_url", "rating"]
+
+def missing_tmdb_fields(data):
+    return [key for key in TMDB_FIELDS if key not in data or data.get(key) in [None, '', []]]
+
+class TimedRepresentationMixin:
+    """Reports the time spent building the response data as the serialize phase of the request (movies.timing)"""
+
+    def to_representation(self, instance):
+        with phase('serialize'):
+            return super().to_representation(instance)
+
+class UniqueConstraintErrorsMixin:
+    """
+    Returns a violation of the unique constraints of the model (duplicate names and titles, safe under concurrent
+    requests) as the usual validation error, with the violation_error_message of the constraint. Serializers that
+    override create/update wrap their own saves in unique_constraint_errors.
+    """
+
+    def create(self, validated_data):
+        with self.unique_constraint_errors():
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with self.unique_constraint_errors():
+            return super().update(instance, validated_data)
+
+    @contextmanager
+    def unique_constraint_errors(self):
+        try:
+            # the savepoint keeps the failed INSERT from breaking an outer transaction
+            with transaction.atomic():
+                yield
+        except IntegrityError as e:
+            name = getattr(getattr(e.__cause__, 'diag', None), 'constraint_name', None)
+            constraint = next((c for c in self.Meta.model._meta.constraints if c.name == name), None)
+            if constraint is None:
+                raise
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [constraint.get_violation_error_message()]
+            })
+
+class DirectorSerializer(UniqueConstraintErrorsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     total_movies = serializers.SerializerMethodField()
     movies_name = serializers.SerializerMethodField()
 
@@ -19,20 +67,6 @@ class DirectorSerializer(serializers.ModelSerializer):
     
     def get_movies_name(self, obj):
         return obj.movies_name
-    
-    def validate(self, data):
-        """Validates duplicate name"""
-        name = data.get('name')
-
-        if not self.instance and name:
-            existing_director = Director.objects.filter(name=name).exclude(id=data.get('id')).exists()
-
-            if existing_director:
-                raise serializers.ValidationError(
-                    f"Director already exists"
-                )
-        
-        return data
 
 
 @extend_schema_serializer(
@@ -46,7 +80,7 @@ class DirectorSerializer(serializers.ModelSerializer):
         )
     ]
 )
-class ActorSerializer(serializers.ModelSerializer):
+class ActorSerializer(UniqueConstraintErrorsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
     total_movies = serializers.SerializerMethodField()
     movies_name = serializers.SerializerMethodField()
 
@@ -61,29 +95,31 @@ class ActorSerializer(serializers.ModelSerializer):
     
     def get_movies_name(self, obj):
         return obj.movies_name
-    
-    def validate(self, data):
-        """Validates duplicate name"""
-        name = data.get('name')
 
-        if not self.instance and name:
-            existing_actor = Actor.objects.filter(name=name).exclude(id=data.get('id')).exists()
+class DirectorSummarySerializer(serializers.ModelSerializer):
+    """Compact director embedded in movie payloads"""
 
-            if existing_actor:
-                raise serializers.ValidationError(
-                    f"Actor already exists"
-                )
-        
-        return data
+    class Meta:
+        model = Director
+        fields = ['id', 'name', 'country']
+        read_only_fields = fields
+
+class ActorSummarySerializer(serializers.ModelSerializer):
+    """Compact actor embedded in movie payloads"""
+
+    class Meta:
+        model = Actor
+        fields = ['id', 'name', 'country']
+        read_only_fields = fields
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(UniqueConstraintErrorsMixin, TimedRepresentationMixin, serializers.ModelSerializer):
 
-    actors_data = ActorSerializer(source='actors', many=True, read_only=True)
+    actors_data = ActorSummarySerializer(source='actors', many=True, read_only=True)
     actors_id = serializers.PrimaryKeyRelatedField(
         many=True, queryset=Actor.objects.all(), write_only=True
     )
 
-    director_data = DirectorSerializer(source='director', read_only=True)
+    director_data = DirectorSummarySerializer(source='director', read_only=True)
     director = serializers.PrimaryKeyRelatedField(
         queryset=Director.objects.all(), write_only=True
     )
@@ -94,22 +130,46 @@ class MovieSerializer(serializers.ModelSerializer):
 
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def get_fields(self):
+        """
+        Swaps the compact nested director/actors for the full ones when they are in the `expand` context and drops
+        the readable fields that are not in the `fields` context
+        """
+        fields = super().get_fields()
+        expand = self.context.get('expand', ())
+
+        if 'director' in expand:
+            fields['director_data'] = DirectorSerializer(source='director', read_only=True)
+
+        if 'actors' in expand:
+            fields['actors_data'] = ActorSerializer(source='actors', many=True, read_only=True)
+
+        requested = self.context.get('fields')
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested or field.write_only}
+
+        return fields
+
     def create(self, validated_data):
         # actors_ids is not a model field, it's just for serialization. If it is not removed from validated_data, Movie.objects.create() will fail
         actor_ids = validated_data.pop('actors_id', [])
 
         #  if only the title is sent (or some key info is missing), we fill the rest from TMDB
-        required_keys = ["year", "genres", "description", "poster_url", "rating"]
-        missing = [key for key in required_keys if key not in validated_data or validated_data.get(key) in [None, '', []]]
+        missing = missing_tmdb_fields(validated_data)
 
         if "title" in validated_data and missing:
-            tmdb_data = fetch_movie_data(validated_data["title"])
+            # the async view looks it up beforehand, without holding a thread (movies.async_views)
+            tmdb_data = self.context.get('tmdb_data')
+            if tmdb_data is None:
+                tmdb_data = fetch_movie_data(validated_data["title"])
             validated_data.update({k: v for k, v in tmdb_data.items() if v is not None})
         
-        movie = Movie.objects.create(**validated_data)
-        
-        if actor_ids:
-            movie.actors.set(actor_ids)
+        # after the TMDB lookup, so the transaction isn't held open during it
+        with self.unique_constraint_errors():
+            movie = Movie.objects.create(**validated_data)
+
+            if actor_ids:
+                movie.actors.set(actor_ids)
             
         return movie
     
@@ -119,27 +179,14 @@ class MovieSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         
-        instance.save()
+        with self.unique_constraint_errors():
+            instance.save()
 
-        if actors_ids is not None:
-            instance.actors.set(actors_ids)
+            if actors_ids is not None:
+                instance.actors.set(actors_ids)
 
         return instance
     
-    def validate(self, data):
-        """Validates duplicate title"""
-        title = data.get('title')
-
-        if not self.instance and title:
-            existing_movie = Movie.objects.filter(title=title).exclude(id=data.get('id')).exists()
-
-            if existing_movie:
-                raise serializers.ValidationError(
-                    f"Movie already exists"
-                )
-        
-        return data
-    
     def validate_year(self, value):
         current_year = datetime.now().year
         if value < 1888 or value > current_year:
@@ -157,4 +204,61 @@ class MovieSerializer(serializers.ModelSerializer):
         if not self.instance and value:
             raise serializers.ValidationError({'created_at': 'Field is read only'})
         
-        return value
\ No newline at end of file
+        return value
+
+    def validate(self, attrs):
+        # a new movie filled from TMDB is checked before the lookup, so a duplicate doesn't cost one. Every other save
+        # relies on the unique constraint alone (unique_constraint_errors)
+        title = attrs.get('title')
+        if title is not None and self.instance is None and missing_tmdb_fields(attrs):
+            if Movie.objects.annotate(lower_title=Lower('title')).filter(lower_title=title.lower()).exists():
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Movie already exists']})
+
+        return attrs
+
+class MovieBulkItemSerializer(MovieSerializer):
+    """
+    One movie of a bulk import. Only the fields are validated here, the duplicate titles and the director/actor ids
+    are checked for the whole batch at once in movies.bulk.
+    """
+    director = serializers.IntegerField(write_only=True)
+    actors_id = serializers.ListField(child=serializers.IntegerField(), write_only=True)
+
+    class Meta(MovieSerializer.Meta):
+        fields = ['title', 'year', 'genres', 'rating', 'description', 'poster_url', 'director', 'actors_id']
+
+    def validate(self, attrs):
+        return attrs
+
+class SlowQuerySerializer(serializers.Serializer):
+    """A query slower than SLOW_QUERY_MS, with the request that ran it. plan is only set for the sampled SELECTs"""
+    time = serializers.DateTimeField()
+    duration_ms = serializers.FloatField()
+    view = serializers.CharField(allow_null=True)
+    method = serializers.CharField()
+    path = serializers.CharField()
+    sql = serializers.CharField()
+    params = serializers.CharField()
+    plan = serializers.CharField(allow_null=True)
+
+class StatsFacetSerializer(serializers.Serializer):
+    """Number of movies and average rating of a genre, year, decade ('1990'), director or actor (key is the id)"""
+    key = serializers.CharField()
+    label = serializers.CharField()
+    movies = serializers.IntegerField()
+    avg_rating = serializers.FloatField(allow_null=True)
+
+class StatsTotalsSerializer(serializers.Serializer):
+    movies = serializers.IntegerField()
+    directors = serializers.IntegerField()
+    actors = serializers.IntegerField()
+    avg_rating = serializers.FloatField(allow_null=True)
+
+class CatalogStatsSerializer(TimedRepresentationMixin, serializers.Serializer):
+    refreshed_at = serializers.DateTimeField()
+    totals = StatsTotalsSerializer()
+    genres = StatsFacetSerializer(many=True)
+    years = StatsFacetSerializer(many=True)
+    decades = StatsFacetSerializer(many=True)
+    top_directors = StatsFacetSerializer(many=True)
+    top_actors = StatsFacetSerializer(many=True)
@@ -1,40 +1,417 @@
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django.core.cache import cache as shared_cache
+from rest_framework.exceptions import APIException
+from .metrics import TMDB_ERRORS, TMDB_LATENCY
+from .timing import phase, timed
 
-TMDB_BASE = 'https://api.themoviedb.org/3'
-TMDB_KEY = settings.TMDB_API_KEY
+logger = logging.getLogger(__name__)
 
-# simple cache for genres. Avoids to call every time to TMDB
-GENRE_CACHE = {}
+# responses worth retrying: TMDB rate limit and server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-def get_genre_map():
-    if GENRE_CACHE:
-        return GENRE_CACHE
-    
-    url = f"{TMDB_BASE}/genre/movie/list"
-    params = {"api_key": TMDB_KEY, 'language': 'en-EN'}
+class TMDBUnavailable(APIException):
+    status_code = 503
+    default_detail = 'TMDB is unavailable, try again later.'
+    default_code = 'tmdb_unavailable'
 
-    resp= requests.get(url, params=params)
-    resp.raise_for_status()
-    data = resp.json().get('genres', [])
+class TMDBRejected(APIException):
+    """TMDB answered but refused the request (4xx). It is reachable, so the circuit breaker counts it as a success"""
+    status_code = 502
+    default_detail = 'TMDB rejected the request.'
+    default_code = 'tmdb_rejected'
 
-    GENRE_CACHE.update({g['id']: g['name'] for g in data})
-    return GENRE_CACHE
+def retry_after(headers):
+    """Seconds to wait asked by the Retry-After header of a response (seconds or an HTTP date), None without one"""
+    value = (headers.get('Retry-After') or '').strip()
+    if not value:
+        return None
 
-def fetch_movie_data(title):
-    url = f'{TMDB_BASE}/search/movie'
-    params = {"api_key": TMDB_KEY, 'query':title, 'language': 'en-EN'}
-
-    resp = requests.get(url, params=params)
-    resp.raise_for_status()
-    results = resp.json().get('results')
-
-    if not results:
-        return {}
-    
-    movie = results[0]
-    
-    genre_map = get_genre_map()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+class CircuitBreaker:
+    """
+    Fails fast while TMDB is unhealthy. After `failure_threshold` consecutive failed calls the circuit opens and
+    every call is refused for `reset_timeout` seconds. Then a single trial call is let through: if it succeeds the
+    circuit closes, otherwise it opens again.
+    """
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+
+            if not self.trial and self.clock() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self.trial = False
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Runs concurrent calls with the same key only once, the other callers wait and get the same result"""
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+class TMDBCache:
+    """
+    Two tier cache for TMDB responses: a small per-process LRU with a short TTL in front of the shared Redis cache,
+    so workers share what any of them fetched and hot keys don't even cost a Redis round trip.
+
+    Empty responses ("no results") are cached too, for `negative_ttl`. Errors are never cached.
+    Hit/miss counters are kept per process and added to Redis every `stats_flush_interval` seconds.
+    """
+    key_prefix = 'tmdb:'
+    stats_key = 'tmdb:stats:{}'
+    stats = ('local_hits', 'shared_hits', 'misses', 'negative_hits')
+
+    def __init__(self, negative_ttl=600, local_ttl=60, local_size=256, stats_flush_interval=10,
+                 backend=shared_cache, clock=time.monotonic):
+        self.negative_ttl = negative_ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.stats_flush_interval = stats_flush_interval
+        self.backend = backend
+        self.clock = clock
+        self._local = OrderedDict()
+        self._pending = Counter()
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            negative_ttl=settings.TMDB_NEGATIVE_CACHE_TTL,
+            local_ttl=settings.TMDB_LOCAL_CACHE_TTL,
+            local_size=settings.TMDB_LOCAL_CACHE_SIZE,
+        )
+
+    def get_or_fetch(self, key, fetch, ttl):
+        """Returns the cached value of `key`, or calls `fetch()` and caches what it returns for `ttl` seconds"""
+        key = self.key_prefix + key
+        value = self._lookup(key)
+        if value is None:
+            value = fetch()
+            self._store(key, value, ttl)
+        return value
+
+    async def aget_or_fetch(self, key, fetch, ttl):
+        """get_or_fetch() with a coroutine function `fetch`. The Redis round trips stay on the event loop"""
+        key = self.key_prefix + key
+        value = self._lookup(key)
+        if value is None:
+            value = await fetch()
+            self._store(key, value, ttl)
+        return value
+
+    def _lookup(self, key):
+        value = self._get_local(key)
+        if value is not None:
+            self._count('local_hits', value)
+            return value
+
+        value = self.backend.get(key)
+        if value is not None:
+            self._set_local(key, value)
+            self._count('shared_hits', value)
+        return value
+
+    def _store(self, key, value, ttl):
+        self.backend.set(key, value, timeout=ttl if value else self.negative_ttl)
+        self._set_local(key, value)
+        self._count('misses', value)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._local[key]
+                return None
+
+            self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        ttl = min(self.local_ttl, self.negative_ttl) if not value else self.local_ttl
+        with self._lock:
+            self._local[key] = (self.clock() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _count(self, stat, value):
+        with self._lock:
+            self._pending[stat] += 1
+            if not value and stat != 'misses':
+                self._pending['negative_hits'] += 1
+
+            if self.clock() - self._last_flush < self.stats_flush_interval:
+                return
+
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = self.clock()
+
+        self._flush(pending)
+
+    def flush_stats(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = self.clock()
+
+        self._flush(pending)
+
+    def _flush(self, pending):
+        for stat, count in pending.items():
+            key = self.stats_key.format(stat)
+            self.backend.add(key, 0, timeout=None)
+            self.backend.incr(key, count)
+
+    def get_stats(self):
+        """Counters of every worker, as flushed to Redis so far"""
+        values = self.backend.get_many([self.stats_key.format(stat) for stat in self.stats])
+        return {stat: values.get(self.stats_key.format(stat), 0) for stat in self.stats}
+
+    def reset_stats(self):
+        self.backend.delete_many([self.stats_key.format(stat) for stat in self.stats])
+
+class TMDBClient:
+    """
+    TMDB API client. It keeps a pooled keep-alive session, bounds every request with connect/read timeouts, retries
+    connection errors and 429/5xx responses with jittered exponential backoff (or after the Retry-After of a 429, up
+    to `max_retry_after` seconds) and stops calling TMDB while the circuit breaker is open. Identical concurrent
+    requests are coalesced into one.
+    Search results and the genre map are cached in `cache` (a TMDBCache) when given.
+    """
+    def __init__(self, api_key, base_url='https://api.themoviedb.org/3', connect_timeout=3.05, read_timeout=5.0,
+                 max_retries=2, retry_backoff=0.3, max_retry_after=5.0, circuit_failures=5, circuit_reset=30.0,
+                 pool_size=10, cache=None, search_ttl=86400, genres_ttl=86400):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_retry_after = max_retry_after
+        self.breaker = CircuitBreaker(circuit_failures, circuit_reset)
+        self.single_flight = SingleFlight()
+        self.cache = cache
+        self.search_ttl = search_ttl
+        self.genres_ttl = genres_ttl
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.TMDB_API_KEY,
+            base_url=settings.TMDB_BASE_URL,
+            connect_timeout=settings.TMDB_CONNECT_TIMEOUT,
+            read_timeout=settings.TMDB_READ_TIMEOUT,
+            max_retries=settings.TMDB_MAX_RETRIES,
+            retry_backoff=settings.TMDB_RETRY_BACKOFF,
+            max_retry_after=settings.TMDB_MAX_RETRY_AFTER,
+            circuit_failures=settings.TMDB_CIRCUIT_FAILURES,
+            circuit_reset=settings.TMDB_CIRCUIT_RESET,
+            cache=TMDBCache.from_settings(),
+            search_ttl=settings.TMDB_SEARCH_CACHE_TTL,
+            genres_ttl=settings.TMDB_GENRES_CACHE_TTL,
+        )
+
+    @timed('tmdb')
+    def get(self, path, **params):
+        """GET a TMDB endpoint and return its JSON body. Raises TMDBUnavailable (unreachable) or TMDBRejected (4xx)"""
+        key = (path, tuple(sorted(params.items())))
+        return self.single_flight.do(key, lambda: self._request(path, params))
+
+    def _request(self, path, params):
+        if not self.breaker.allow():
+            TMDB_ERRORS.labels(path, 'circuit_open').inc()
+            raise TMDBUnavailable()
+
+        start = time.perf_counter()
+        healthy = False
+        try:
+            result = self._send(path, params)
+            healthy = True
+            return result
+        except TMDBRejected:
+            healthy = True
+            raise
+        finally:
+            TMDB_LATENCY.labels(path).observe(time.perf_counter() - start)
+            # every call is settled, whatever it raised, so a trial call can't leave the circuit half open for good
+            if healthy:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def _send(self, path, params):
+        url = f'{self.base_url}{path}'
+        params = {'api_key': self.api_key, **params}
+
+        wait = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay(attempt, wait))
+
+            try:
+                resp = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                # connection errors, timeouts, bodies cut short
+                error = e.__class__.__name__
+                TMDB_ERRORS.labels(path, error).inc()
+                wait = None
+                continue
+
+            if resp.status_code in RETRY_STATUSES:
+                error = f'status {resp.status_code}'
+                TMDB_ERRORS.labels(path, f'status_{resp.status_code}').inc()
+                wait = retry_after(resp.headers) if resp.status_code == 429 else None
+                if wait is not None and wait > self.max_retry_after:
+                    break
+                continue
+
+            if not resp.ok:
+                TMDB_ERRORS.labels(path, f'status_{resp.status_code}').inc()
+                logger.error(f'TMDB rejected {path} with status {resp.status_code}')
+                raise TMDBRejected(f'TMDB rejected the request (status {resp.status_code}).')
+
+            try:
+                return resp.json()
+            except ValueError:
+                # a malformed body, retried like a broken connection
+                error = 'invalid JSON'
+                TMDB_ERRORS.labels(path, 'invalid_json').inc()
+                wait = None
+
+        logger.warning(f'TMDB {path} failed after {attempt + 1} attempts ({error})')
+        raise TMDBUnavailable()
+
+    def retry_delay(self, attempt, wait):
+        """Seconds before retry `attempt`: the Retry-After `wait` TMDB asked for, or the backoff without one"""
+        if wait is not None:
+            return wait
+        # full jitter, so retrying workers don't hit TMDB in lockstep
+        return random.uniform(0, self.retry_backoff * 2 ** (attempt - 1))
+
+    def cached(self, key, fetch, ttl):
+        if self.cache is None:
+            return fetch()
+        # a miss runs fetch() inside, which is timed as tmdb
+        with phase('cache'):
+            return self.cache.get_or_fetch(key, fetch, ttl)
+
+    def get_genre_map(self):
+        return self.cached('genres', self._fetch_genre_map, self.genres_ttl)
+
+    def _fetch_genre_map(self):
+        data = self.get('/genre/movie/list', language='en-EN').get('genres', [])
+        return {g['id']: g['name'] for g in data}
+
+    def fetch_movie_data(self, title):
+        return self.cached(search_key(title), lambda: self._fetch_movie_data(title), self.search_ttl)
+
+    def _fetch_movie_data(self, title):
+        results = self.get('/search/movie', query=title, language='en-EN').get('results')
+
+        if not results:
+            return {}
+
+        return movie_data(results[0], self.get_genre_map())
+
+def search_key(title):
+    # same entry for titles that only differ in case or spacing
+    normalized = ' '.join(title.lower().split())
+    return f'search:{hashlib.sha1(normalized.encode()).hexdigest()}'
+
+def movie_data(movie, genre_map):
+    """Movie fields of a TMDB search result"""
     genres = [genre_map[g] for g in movie.get('genre_ids', []) if g in genre_map]
 
     return {
@@ -44,4 +421,168 @@ def fetch_movie_data(title):
         "description": movie.get('overview'),
         "poster_url": f"https://image.tmdb.org/t/p/w500{movie.get('poster_path')}" if movie.get("poster_path") else None,
         "rating": movie.get('vote_average')
-    }
\ No newline at end of file
+    }
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent calls with the same key await the same task"""
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._calls.pop(key, None))
+
+        # a caller that goes away (client disconnect) doesn't cancel the call of the others
+        return await asyncio.shield(task)
+
+class AsyncTMDBClient:
+    """
+    Runs the lookups of `client` (a TMDBClient) with asyncio, for the async views (movies.async_views): same
+    settings, retries, circuit breaker and caches, over a pooled httpx.AsyncClient. A request waiting on TMDB holds
+    no thread, so a slow TMDB only slows down the requests that need it.
+    """
+    def __init__(self, client, pool_size=10):
+        self.client = client
+        self.pool_size = pool_size
+        self.single_flight = AsyncSingleFlight()
+        self._http = None
+        self._loop = None
+
+    def http(self):
+        # an httpx client belongs to the event loop it was created in. Workers run a single loop, tests and
+        # async_to_sync() start new ones
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            connect_timeout, read_timeout = self.client.timeout
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._loop = loop
+        return self._http
+
+    @timed('tmdb')
+    async def get(self, path, **params):
+        """GET a TMDB endpoint and return its JSON body. Raises TMDBUnavailable (unreachable) or TMDBRejected (4xx)"""
+        key = (path, tuple(sorted(params.items())))
+        return await self.single_flight.do(key, lambda: self._request(path, params))
+
+    async def _request(self, path, params):
+        if not self.client.breaker.allow():
+            TMDB_ERRORS.labels(path, 'circuit_open').inc()
+            raise TMDBUnavailable()
+
+        start = time.perf_counter()
+        healthy = False
+        try:
+            result = await self._send(path, params)
+            healthy = True
+            return result
+        except TMDBRejected:
+            healthy = True
+            raise
+        finally:
+            TMDB_LATENCY.labels(path).observe(time.perf_counter() - start)
+            # settled like TMDBClient._request, a cancelled trial call included
+            if healthy:
+                self.client.breaker.record_success()
+            else:
+                self.client.breaker.record_failure()
+
+    async def _send(self, path, params):
+        client = self.client
+        url = f'{client.base_url}{path}'
+        params = {'api_key': client.api_key, **params}
+
+        wait = None
+        for attempt in range(client.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(client.retry_delay(attempt, wait))
+
+            try:
+                resp = await self.http().get(url, params=params)
+            except httpx.HTTPError as e:
+                # connection errors, timeouts, bodies cut short or that can't be decoded, redirect loops
+                error = e.__class__.__name__
+                TMDB_ERRORS.labels(path, error).inc()
+                wait = None
+                continue
+
+            if resp.status_code in RETRY_STATUSES:
+                error = f'status {resp.status_code}'
+                TMDB_ERRORS.labels(path, f'status_{resp.status_code}').inc()
+                wait = retry_after(resp.headers) if resp.status_code == 429 else None
+                if wait is not None and wait > client.max_retry_after:
+                    break
+                continue
+
+            if not resp.is_success:
+                TMDB_ERRORS.labels(path, f'status_{resp.status_code}').inc()
+                logger.error(f'TMDB rejected {path} with status {resp.status_code}')
+                raise TMDBRejected(f'TMDB rejected the request (status {resp.status_code}).')
+
+            try:
+                return resp.json()
+            except ValueError:
+                error = 'invalid JSON'
+                TMDB_ERRORS.labels(path, 'invalid_json').inc()
+                wait = None
+
+        logger.warning(f'TMDB {path} failed after {attempt + 1} attempts ({error})')
+        raise TMDBUnavailable()
+
+    async def cached(self, key, fetch, ttl):
+        if self.client.cache is None:
+            return await fetch()
+        with phase('cache'):
+            return await self.client.cache.aget_or_fetch(key, fetch, ttl)
+
+    async def get_genre_map(self):
+        return await self.cached('genres', self._fetch_genre_map, self.client.genres_ttl)
+
+    async def _fetch_genre_map(self):
+        data = (await self.get('/genre/movie/list', language='en-EN')).get('genres', [])
+        return {g['id']: g['name'] for g in data}
+
+    async def fetch_movie_data(self, title):
+        return await self.cached(search_key(title), lambda: self._fetch_movie_data(title), self.client.search_ttl)
+
+    async def _fetch_movie_data(self, title):
+        results = (await self.get('/search/movie', query=title, language='en-EN')).get('results')
+
+        if not results:
+            return {}
+
+        return movie_data(results[0], await self.get_genre_map())
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+def get_tmdb_client():
+    """Process wide client, so every request reuses the same connection pool and circuit breaker"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TMDBClient.from_settings()
+    return _client
+
+def get_async_tmdb_client():
+    """Process wide async client, sharing the circuit breaker and caches of get_tmdb_client()"""
+    global _async_client
+    client = get_tmdb_client()
+    with _client_lock:
+        if _async_client is None or _async_client.client is not client:
+            _async_client = AsyncTMDBClient(client)
+    return _async_client
+
+def get_genre_map():
+    return get_tmdb_client().get_genre_map()
+
+def fetch_movie_data(title):
+    return get_tmdb_client().fetch_movie_data(title)
+
+async def afetch_movie_data(title):
+    return await get_async_tmdb_client().fetch_movie_data(title)
@@ -0,0 +1,164 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import invalidate_on_commit, movie_namespace
+from .models import Movie, Director, Actor
+from .stats import schedule_stats_refresh
+
+# Every cached page depends on some of these namespaces (see the views), so invalidating from the model signals
+# covers the API, the admin and any other code path that writes through the ORM.
+
+@receiver([post_save, post_delete], sender=Movie)
+def invalidate_movie_pages(sender, instance, **kwargs):
+    # the director and actor lists depend on 'movies' too, since they embed the movie titles and counts
+    invalidate_on_commit('movies', movie_namespace(instance.pk))
+
+@receiver([post_save, post_delete], sender=Director)
+def invalidate_director_pages(sender, instance, **kwargs):
+    invalidate_on_commit('directors')
+
+@receiver([post_save, post_delete], sender=Actor)
+def invalidate_actor_pages(sender, instance, **kwargs):
+    invalidate_on_commit('actors')
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def invalidate_cast_pages(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # actor.movies was changed, so any movie can be affected
+        invalidate_on_commit('movies', 'actors')
+    else:
+        invalidate_on_commit('movies', movie_namespace(instance.pk))
+
+# Full-text search documents. A movie document includes its director and actor names, so it is rebuilt whenever
+# any of them changes.
+
+@receiver(post_save, sender=Movie)
+def update_movie_search_vector(sender, instance, **kwargs):
+    Movie.objects.filter(pk=instance.pk).update_search_vector()
+
+@receiver(post_save, sender=Director)
+def update_director_movies_search_vector(sender, instance, created, **kwargs):
+    if not created:
+        Movie.objects.filter(director=instance).update_search_vector()
+
+@receiver(post_save, sender=Actor)
+def update_actor_movies_search_vector(sender, instance, created, **kwargs):
+    if not created:
+        Movie.objects.filter(actors=instance).update_search_vector()
+
+@receiver(pre_delete, sender=Actor)
+def remember_actor_movies(sender, instance, **kwargs):
+    # the cast rows are gone by post_delete
+    instance._movie_ids = list(instance.movies.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Actor)
+def update_deleted_actor_movies_search_vector(sender, instance, **kwargs):
+    Movie.objects.filter(pk__in=getattr(instance, '_movie_ids', [])).update_search_vector()
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def update_cast_search_vector(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._movie_ids = list(instance.movies.values_list('id', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        Movie.objects.filter(pk=instance.pk).update_search_vector()
+    elif action == 'post_clear':
+        Movie.objects.filter(pk__in=getattr(instance, '_movie_ids', [])).update_search_vector()
+    else:
+        Movie.objects.filter(pk__in=pk_set).update_search_vector()
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def touch_cast_movies(sender, instance, action, reverse, pk_set, **kwargs):
+    # the cast is part of the movie, so changing it is a modification of the movie (see movies.conditional)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        movies = Movie.objects.filter(pk=instance.pk)
+    elif action == 'post_clear':
+        movies = Movie.objects.filter(pk__in=getattr(instance, '_movie_ids', []))
+    else:
+        movies = Movie.objects.filter(pk__in=pk_set)
+
+    movies.update(updated_at=timezone.now())
+
+# Denormalized Director.movie_count / Actor.movie_count, updated with F() expressions so concurrent writes don't lose
+# increments. Bulk inserts and the catalog loader recount instead (see MovieStatsQuerySet.recount_movies).
+
+def add_movie_count(model, pks, delta):
+    if pks and delta:
+        model.objects.filter(pk__in=pks).update(movie_count=F('movie_count') + delta)
+
+@receiver(pre_save, sender=Movie)
+def remember_movie_director(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._old_director_id = Movie.objects.filter(pk=instance.pk).values_list('director_id', flat=True).first()
+
+@receiver(post_save, sender=Movie)
+def count_director_movies(sender, instance, created, **kwargs):
+    old_director_id = None if created else getattr(instance, '_old_director_id', instance.director_id)
+    if old_director_id == instance.director_id:
+        return
+
+    add_movie_count(Director, [instance.director_id], 1)
+    if old_director_id is not None:
+        add_movie_count(Director, [old_director_id], -1)
+
+    # keep the director that was saved with the movie in sync, it's often used right after (movie.director.total_movies)
+    if Movie.director.is_cached(instance):
+        instance.director.movie_count += 1
+
+@receiver(pre_delete, sender=Movie)
+def remember_movie_cast(sender, instance, **kwargs):
+    # the cast rows are deleted by the cascade, without m2m_changed
+    instance._actor_ids = list(instance.actors.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Movie)
+def count_deleted_movie(sender, instance, **kwargs):
+    add_movie_count(Director, [instance.director_id], -1)
+    add_movie_count(Actor, getattr(instance, '_actor_ids', []), -1)
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def count_cast_movies(sender, instance, action, reverse, pk_set, **kwargs):
+    # the pk_set of a remove can include rows that don't exist, so the removed rows are read before they go
+    if action in ('pre_remove', 'pre_clear'):
+        own_column, other_column = ('actor_id', 'movie_id') if reverse else ('movie_id', 'actor_id')
+        rows = sender.objects.filter(**{own_column: instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{f'{other_column}__in': pk_set})
+        instance._removed_cast = list(rows.values_list(other_column, flat=True))
+        return
+
+    if action == 'post_add':
+        # add() only sends the pks that were not in the cast yet
+        pks, delta = pk_set, 1
+    elif action in ('post_remove', 'post_clear'):
+        pks, delta = getattr(instance, '_removed_cast', []), -1
+    else:
+        return
+
+    if reverse:
+        add_movie_count(Actor, [instance.pk], delta * len(pks or []))
+    else:
+        add_movie_count(Actor, pks, delta)
+
+# Catalog stats (materialized view), refreshed a while after the writes, see movies.stats
+
+@receiver([post_save, post_delete], sender=Movie)
+@receiver([post_save, post_delete], sender=Director)
+@receiver([post_save, post_delete], sender=Actor)
+def schedule_catalog_stats_refresh(sender, **kwargs):
+    schedule_stats_refresh()
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def refresh_cast_stats(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        schedule_stats_refresh()
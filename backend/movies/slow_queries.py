@@ -0,0 +1,132 @@
+import json
+import logging
+import random
+import time
+from contextlib import nullcontext
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+from .timing import async_execute_wrapper
+
+logger = logging.getLogger(__name__)
+
+# Redis list with the newest entries first, trimmed to SLOW_QUERY_BUFFER_SIZE. Shared by every worker
+BUFFER_KEY = 'slow-queries'
+MAX_SQL_LENGTH = 10000
+MAX_PARAMS_LENGTH = 1000
+
+def _buffer_key():
+    # the cache key prefix keeps apart deployments (and the benchmark) sharing a Redis DB
+    return cache.make_key(BUFFER_KEY)
+
+def record(entry):
+    """Pushes an entry to the ring buffer, one round trip"""
+    pipeline = get_redis_connection('default').pipeline()
+    pipeline.lpush(_buffer_key(), json.dumps(entry, default=str))
+    pipeline.ltrim(_buffer_key(), 0, settings.SLOW_QUERY_BUFFER_SIZE - 1)
+    pipeline.execute()
+
+def recent(limit=None):
+    """Newest entries first"""
+    end = (limit or settings.SLOW_QUERY_BUFFER_SIZE) - 1
+    return [json.loads(entry) for entry in get_redis_connection('default').lrange(_buffer_key(), 0, end)]
+
+def clear():
+    get_redis_connection('default').delete(_buffer_key())
+
+def explain(db, sql, params):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) text plan of a SELECT. It runs the query again, hence the sampling. The raw cursor
+    skips the execute wrappers, and inside a transaction a savepoint keeps a failed EXPLAIN from breaking it.
+    """
+    try:
+        with transaction.atomic(using=db.alias) if db.in_atomic_block else nullcontext():
+            with db.connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+                return '\n'.join(row[0] for row in cursor.fetchall())
+    except DatabaseError as e:
+        logger.warning(f'Could not explain a slow query: {e}')
+        return None
+
+class SlowQueryRecorder:
+    """Execute wrapper recording the queries of a request that take longer than threshold_ms"""
+    def __init__(self, request, threshold_ms, explain_rate):
+        self.request = request
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+
+        if duration >= self.threshold:
+            self.record(sql, params, many, duration, context['connection'])
+        return result
+
+    def record(self, sql, params, many, duration, db):
+        plan = None
+        if (not many and db.vendor == 'postgresql' and sql.lstrip()[:6].upper() == 'SELECT'
+                and random.random() < self.explain_rate):
+            plan = explain(db, sql, params)
+
+        match = getattr(self.request, 'resolver_match', None)
+        entry = {
+            'time': timezone.now().isoformat(),
+            'duration_ms': round(duration * 1000, 1),
+            'view': match.view_name if match else None,
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'sql': sql[:MAX_SQL_LENGTH],
+            'params': repr(params)[:MAX_PARAMS_LENGTH],
+            'plan': plan,
+        }
+        logger.warning(f"Slow query ({entry['duration_ms']}ms) in {entry['method']} {entry['path']}")
+
+        try:
+            record(entry)
+        except Exception:
+            # losing an entry is fine, failing the request because Redis is down is not
+            logger.exception('Could not record a slow query')
+
+class SlowQueryMiddleware:
+    """
+    Records the queries slower than SLOW_QUERY_MS (0 turns it off) with their request, view and parameters, and for
+    a SLOW_QUERY_EXPLAIN_RATE fraction of the SELECTs the EXPLAIN (ANALYZE, BUFFERS) plan. The last
+    SLOW_QUERY_BUFFER_SIZE entries are kept in Redis, see /api/slow-queries/ and `manage.py slow_queries`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = self.get_recorder(request)
+        if recorder is None:
+            return self.get_response(request)
+
+        with connection.execute_wrapper(recorder):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        recorder = self.get_recorder(request)
+        if recorder is None:
+            return await self.get_response(request)
+
+        async with async_execute_wrapper(recorder):
+            return await self.get_response(request)
+
+    def get_recorder(self, request):
+        threshold = settings.SLOW_QUERY_MS
+        if not threshold:
+            return None
+        return SlowQueryRecorder(request, threshold, settings.SLOW_QUERY_EXPLAIN_RATE)
@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from .models import CatalogStat
+
+logger = logging.getLogger(__name__)
+
+STATS_VIEW = CatalogStat._meta.db_table
+# set while a refresh is pending, shared by every worker through Redis
+REFRESH_SCHEDULED_KEY = 'catalog-stats:refresh-scheduled'
+
+# facets read whole, the director and actor ones are only read up to the top N
+FACETS = ('total', 'genre', 'year', 'decade')
+
+def refresh_catalog_stats(concurrently=True):
+    """
+    Recomputes the materialized view. CONCURRENTLY keeps it readable during the refresh (it diffs the new result
+    against the old one through the unique index), without it the refresh is faster but blocks the readers.
+    """
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW {"CONCURRENTLY " if concurrently else ""}{STATS_VIEW}')
+
+    seconds = time.perf_counter() - start
+    logger.info(f'Catalog stats refreshed in {seconds:.2f}s')
+    return seconds
+
+def _refresh_in_background():
+    try:
+        refresh_catalog_stats()
+    except DatabaseError:
+        logger.exception('Catalog stats refresh failed')
+    finally:
+        # the timer thread has its own connection
+        connection.close()
+
+def schedule_stats_refresh():
+    """
+    Debounced refresh after a write: the first write of a CATALOG_STATS_REFRESH_DELAY window schedules a refresh at
+    the end of it and the rest of the window's writes (in any worker) ride on that one. 0 disables it, for
+    deployments that refresh on a schedule with `manage.py refresh_stats`.
+
+    For the request paths only: the timer is a daemon thread, so a process that exits sooner (a management command, a
+    script) never runs it. Those call refresh_catalog_stats themselves once their writes are committed.
+    """
+    delay = settings.CATALOG_STATS_REFRESH_DELAY
+    if not delay:
+        return
+
+    def schedule():
+        # the key expires when the refresh starts, so writes after that schedule the next one
+        if cache.add(REFRESH_SCHEDULED_KEY, 1, timeout=delay):
+            timer = threading.Timer(delay, _refresh_in_background)
+            timer.daemon = True
+            timer.start()
+
+    # only once the write is visible to the refresh
+    transaction.on_commit(schedule)
+
+def _by_movies(facet):
+    return -facet['movies'], facet['key']
+
+def _by_year(facet):
+    return int(facet['key'])
+
+def catalog_stats(top=10):
+    """All the facets with one indexed read of the materialized view"""
+    rows = CatalogStat.objects.filter(facet__in=FACETS).union(
+        CatalogStat.objects.filter(facet='director').order_by('-movies', 'key')[:top],
+        CatalogStat.objects.filter(facet='actor').order_by('-movies', 'key')[:top],
+        all=True,
+    )
+
+    facets = {'total': {}, 'genre': [], 'year': [], 'decade': [], 'director': [], 'actor': []}
+    refreshed_at = None
+    for row in rows:
+        refreshed_at = row.refreshed_at
+        if row.facet == 'total':
+            facets['total'][row.key] = row.movies
+            if row.key == 'movies':
+                facets['total']['avg_rating'] = row.avg_rating
+        else:
+            facets[row.facet].append({'key': row.key, 'label': row.label, 'movies': row.movies, 'avg_rating': row.avg_rating})
+
+    return {
+        'refreshed_at': refreshed_at,
+        'totals': facets['total'],
+        'genres': sorted(facets['genre'], key=_by_movies),
+        'years': sorted(facets['year'], key=_by_year),
+        'decades': sorted(facets['decade'], key=_by_year),
+        'top_directors': sorted(facets['director'], key=_by_movies),
+        'top_actors': sorted(facets['actor'], key=_by_movies),
+    }
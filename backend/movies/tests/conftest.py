@@ -1,9 +1,15 @@
 import pytest
 from rest_framework.test import APIClient
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from movies.models import Movie, Director, Actor
 from movies.serializers import DirectorSerializer, ActorSerializer, MovieSerializer
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # cached responses live in Redis and would leak between tests
+    cache.clear()
+
 @pytest.fixture
 def user():
     return User.objects.create_user(username='test', email='test@gmail.com', password='test123')
@@ -0,0 +1,123 @@
+import json
+import pytest
+from unittest import mock
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from movies.async_views import (
+    AsyncActorListCreateView, AsyncDirectorDetailView, AsyncMovieDetailView, AsyncMovieListCreateView,
+)
+from movies.models import Movie
+from movies.staticfiles import StaticFilesMiddleware
+
+factory = APIRequestFactory()
+
+def call(view, request, **kwargs):
+    response = async_to_sync(view.as_view())(request, **kwargs)
+    return response.render() if hasattr(response, 'render') else response
+
+@pytest.mark.django_db
+def test_async_list_movies(movie):
+    response = call(AsyncMovieListCreateView, factory.get('/api/movies/'))
+
+    assert response.status_code==200
+    assert response.data[0]['title']=='Movie test'
+    assert response.data[0]['actors_data'][0]['name']=='Actor Test'
+
+@pytest.mark.django_db
+def test_async_list_movies_paginated(director):
+    for i in range(3):
+        Movie.objects.create(title=f'Movie {i}', year=2020, rating=7, director=director)
+
+    response = call(AsyncMovieListCreateView, factory.get('/api/movies/?page_size=2'))
+
+    assert [m['title'] for m in response.data['results']]==['Movie 2', 'Movie 1']
+    response = call(AsyncMovieListCreateView, factory.get(response.data['next']))
+    assert [m['title'] for m in response.data['results']]==['Movie 0']
+
+@pytest.mark.django_db
+def test_async_list_is_cached(movie):
+    call(AsyncMovieListCreateView, factory.get('/api/movies/'))
+
+    with CaptureQueriesContext(connection) as queries:
+        response = call(AsyncMovieListCreateView, factory.get('/api/movies/'))
+
+    assert response.status_code==200
+    # the validators aggregate, the page comes from the cache
+    assert len(queries)==1
+
+@pytest.mark.django_db
+def test_async_movie_detail(movie):
+    response = call(AsyncMovieDetailView, factory.get(f'/api/movies/{movie.id}/'), pk=movie.id)
+
+    assert response.status_code==200
+    assert response.data['director_data']['name']=='Director Test'
+
+    response = call(AsyncMovieDetailView, factory.get('/api/movies/0/'), pk=0)
+    assert response.status_code==404
+
+@pytest.mark.django_db
+def test_async_detail_not_modified(director):
+    etag = call(AsyncDirectorDetailView, factory.get(f'/api/directors/{director.id}/'), pk=director.id)['ETag']
+
+    request = factory.get(f'/api/directors/{director.id}/', HTTP_IF_NONE_MATCH=etag)
+    response = call(AsyncDirectorDetailView, request, pk=director.id)
+
+    assert response.status_code==304
+
+@pytest.mark.django_db
+def test_async_writes_stay_authenticated(actor):
+    response = call(AsyncActorListCreateView, factory.post('/api/actors/', {'name': 'New', 'country': 'US'}, format='json'))
+
+    assert response.status_code==401
+
+@pytest.mark.django_db
+def test_async_create_movie_from_tmdb(user, director, actor):
+    tmdb_data = {'title': 'Heat', 'year': 1995, 'genres': ['Crime'], 'rating': 7.9, 'description': 'LA heist',
+                 'poster_url': 'http://example.com/heat.jpg'}
+    request = factory.post('/api/movies/', {'title': 'Heat', 'director': director.id, 'actors_id': [actor.id]}, format='json')
+    force_authenticate(request, user=user)
+
+    with mock.patch('movies.async_views.afetch_movie_data', return_value=tmdb_data) as fetch:
+        response = call(AsyncMovieListCreateView, request)
+
+    assert response.status_code==201
+    assert response.data['year']==1995
+    assert response.data['actors_data'][0]['name']=='Actor Test'
+    fetch.assert_awaited_once_with('Heat')
+
+@pytest.mark.django_db
+def test_async_middleware_timings(settings, movie):
+    settings.SERVER_TIMING = 'all'
+
+    with CaptureQueriesContext(connection) as queries:
+        response = async_to_sync(AsyncClient().get)('/api/movies/')
+
+    assert response.status_code==200
+    # the queries run in the request's thread are counted by the execute wrapper
+    assert f'desc="{len(queries)} queries"' in response['Server-Timing']
+
+@pytest.mark.django_db
+def test_export_streams_under_asgi(movie):
+    async def export():
+        response = await AsyncClient().get('/api/movies/export/')
+        return response, [chunk async for chunk in response.streaming_content]
+
+    response, chunks = async_to_sync(export)()
+
+    assert response.is_async
+    assert json.loads(b''.join(chunks))['title']=='Movie test'
+
+def test_static_files_middleware_runs_async():
+    async def get_response(request):
+        return HttpResponse('api')
+
+    middleware = StaticFilesMiddleware(get_response)
+    response = async_to_sync(middleware)(RequestFactory().get('/api/movies/'))
+
+    # Django can call it without a sync/async adapter
+    assert iscoroutinefunction(middleware)
+    assert response.content==b'api'
@@ -0,0 +1,227 @@
+import json
+import pytest
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from movies.generator import CatalogGenerator, ZipfSampler
+from movies.loader import CatalogLoader, read_csv
+from movies.models import Movie, Director, Actor, CatalogStat
+
+CSV_CATALOG = '''title,year,genres,rating,description,poster_url,director,director_country,actors,actor_countries
+Heat,1995,crime|drama,8.3,"Cops, robbers and ""a heist""",,Michael Mann,US,Al Pacino|Robert De Niro,US|USA
+Collateral,2004,crime,7.5,,,michael mann,US,tom cruise|Al Pacino|Al Pacino,US||
+Movie test,2025,drama,5,,,Someone,US,,
+No director,2001,drama,5,,,,,Al Pacino,US
+heat,1995,crime,8.3,,,Michael Mann,US,,
+Old,1950,drama,6,,,Director Test,,Actor Test,US
+'''
+
+@pytest.fixture
+def catalog_file(tmp_path):
+    path = tmp_path / 'catalog.csv'
+    path.write_text(CSV_CATALOG)
+    return path
+
+@pytest.mark.django_db
+def test_load_catalog_csv(catalog_file, movie, director, actor):
+    out = StringIO()
+    call_command('load_catalog', str(catalog_file), stdout=out)
+
+    assert 'Loaded 3 movies, 1 directors, 3 actors and 5 cast rows, skipped 3' in out.getvalue()
+    heat = Movie.objects.get(title='Heat')
+    collateral = Movie.objects.get(title='Collateral')
+    assert heat.genres==['Crime', 'Drama']
+    assert heat.description=='Cops, robbers and "a heist"'
+    assert heat.director==collateral.director
+    assert sorted(a.name for a in collateral.actors.all())==['Al Pacino', 'tom cruise']
+    # existing people are matched by name
+    assert Movie.objects.get(title='Old').director==director
+    assert list(Movie.objects.get(title='Old').actors.all())==[actor]
+    assert Director.objects.count()==2
+    assert Actor.objects.get(name='Al Pacino').country=='US'
+    assert Actor.objects.get(name='Robert De Niro').country=='US'
+
+@pytest.mark.django_db
+def test_load_catalog_updates_search_and_cache(client, catalog_file, movie):
+    client.get('/api/movies/')
+    call_command('load_catalog', str(catalog_file), stdout=StringIO())
+
+    assert [m['title'] for m in client.get('/api/movies/?q=heist').data]==['Heat']
+    assert len(client.get('/api/movies/').data)==4
+
+@pytest.mark.django_db
+def test_load_catalog_jsonl_in_chunks(tmp_path):
+    path = tmp_path / 'catalog.jsonl'
+    path.write_text('\n'.join(json.dumps(row) for row in [
+        {'title': 'One', 'year': 2000, 'director': 'Ann', 'director_country': 'GB',
+         'actors': [{'name': 'Bo', 'country': 'SE'}, {'name': 'Cy', 'country': 'swe'}]},
+        {'title': 'Two', 'year': 2001, 'director': 'ann', 'actors': ['bo']},
+        {'title': 'ONE', 'year': 2000, 'director': 'Ann', 'actors': []},
+    ]))
+
+    call_command('load_catalog', str(path), '--chunk-size', '1', stdout=StringIO())
+
+    assert Movie.objects.count()==2
+    assert Director.objects.count()==1
+    assert Actor.objects.get(name='Bo').country=='SE'
+    assert Movie.objects.get(title='Two').actors.get().name=='Bo'
+    assert Actor.objects.get(name='Cy').country=='SE'
+
+@pytest.mark.django_db
+def test_load_catalog_skips_rows_the_api_would_reject(tmp_path, director):
+    path = tmp_path / 'catalog.jsonl'
+    path.write_text('\n'.join(json.dumps(row) for row in [
+        {'title': 'Valid', 'year': 2000, 'rating': 7, 'director': 'Ann', 'director_country': 'GB'},
+        {'title': 'Country name', 'year': 2000, 'director': 'Bea', 'director_country': 'United States'},
+        {'title': 'Unknown country', 'year': 2000, 'director': 'Cal', 'director_country': 'XX'},
+        {'title': 'No actor country', 'year': 2000, 'director': 'Ann', 'actors': ['Dee']},
+        {'title': 'T' * 201, 'year': 2000, 'director': 'Ann'},
+        {'title': 'Long name', 'year': 2000, 'director': 'N' * 101, 'director_country': 'GB'},
+        {'title': 'Bad rating', 'year': 2000, 'rating': 42, 'director': 'Ann'},
+        {'title': 'Too old', 'year': 1700, 'director': 'Ann'},
+        # existing people don't need a country
+        {'title': 'Existing director', 'year': 2001, 'director': 'director test'},
+    ]))
+    out = StringIO()
+
+    call_command('load_catalog', str(path), stdout=out)
+
+    assert 'Loaded 2 movies, 1 directors, 0 actors and 0 cast rows, skipped 7' in out.getvalue()
+    assert sorted(Movie.objects.values_list('title', flat=True))==['Existing director', 'Valid']
+    assert sorted(Director.objects.values_list('country', flat=True))==['GB', 'US']
+
+@pytest.mark.django_db
+def test_load_catalog_skips_malformed_jsonl_lines(tmp_path):
+    path = tmp_path / 'catalog.jsonl'
+    path.write_text('\n'.join([
+        json.dumps({'title': 'Valid', 'year': 2000, 'director': 'Ann', 'director_country': 'GB', 'genres': ['Drama']}),
+        '{"title": "Cut short", "director": "Ann"',
+        json.dumps(['Not', 'an', 'object']),
+        json.dumps({'title': 'Genres string', 'director': 'Ann', 'genres': 'Drama'}),
+        json.dumps({'title': 42, 'director': 'Ann'}),
+        json.dumps({'title': 'Director object', 'director': {'name': 'Ann'}}),
+        json.dumps({'title': 'Actors string', 'director': 'Ann', 'actors': 'Bo'}),
+        json.dumps({'title': 'Actor number', 'director': 'Ann', 'actors': [7]}),
+    ]))
+    out = StringIO()
+
+    call_command('load_catalog', str(path), stdout=out)
+
+    assert 'Loaded 1 movies, 1 directors, 0 actors and 0 cast rows, skipped 7' in out.getvalue()
+    assert Movie.objects.get().genres==['Drama']
+
+@pytest.mark.django_db
+def test_load_catalog_from_stdin(monkeypatch):
+    stdin = StringIO('title,year,director,director_country\nHeat,1995,Michael Mann,USA\n')
+    monkeypatch.setattr('sys.stdin', stdin)
+
+    call_command('load_catalog', '-', '--format', 'csv', stdout=StringIO())
+
+    assert Movie.objects.get().director.country=='US'
+    assert not stdin.closed
+
+@pytest.mark.django_db
+def test_catalog_loader_without_copy(catalog_file, director):
+    loader = CatalogLoader(chunk_size=2)
+    loader.use_copy = False
+
+    with open(catalog_file) as file:
+        counts = loader.load(read_csv(file))
+
+    assert counts['movies']==4
+    assert Movie.objects.get(title='Collateral').actors.count()==2
+
+@pytest.mark.django_db
+def test_load_catalog_counts_movies(catalog_file, movie, director, actor):
+    call_command('load_catalog', str(catalog_file), stdout=StringIO())
+
+    assert Director.objects.get(name='Michael Mann').movie_count==2
+    assert Director.objects.get(pk=director.pk).movie_count==2
+    assert Actor.objects.get(name='Al Pacino').movie_count==2
+    assert Actor.objects.get(pk=actor.pk).movie_count==2
+
+@pytest.mark.django_db
+def test_recount_movies_command(movie, director, actor):
+    Director.objects.update(movie_count=5)
+    out = StringIO()
+
+    call_command('recount_movies', '--dry-run', stdout=out)
+    assert 'Directors: 1 of 1 counters drifted' in out.getvalue()
+    assert Director.objects.get().movie_count==5
+
+    call_command('recount_movies', stdout=out)
+    assert 'Directors: 1 of 1 counters fixed' in out.getvalue()
+    assert 'Actors: 0 of 1 counters fixed' in out.getvalue()
+    assert Director.objects.get().movie_count==1
+
+@pytest.mark.django_db
+def test_refresh_stats_command(movie):
+    out = StringIO()
+    call_command('refresh_stats', stdout=out)
+
+    assert 'Catalog stats refreshed' in out.getvalue()
+    assert CatalogStat.objects.get(facet='total', key='movies').movies==1
+
+@pytest.mark.django_db
+def test_load_catalog_refreshes_stats_before_exiting(settings, django_capture_on_commit_callbacks, catalog_file):
+    settings.CATALOG_STATS_REFRESH_DELAY = 30
+    out = StringIO()
+
+    with mock.patch('movies.stats.threading.Timer') as timer:
+        with django_capture_on_commit_callbacks(execute=True):
+            call_command('load_catalog', str(catalog_file), stdout=out)
+
+    timer.assert_not_called()
+    assert 'Catalog stats refreshed' in out.getvalue()
+    assert CatalogStat.objects.get(facet='total', key='movies').movies==Movie.objects.count()
+
+def test_load_catalog_unknown_format(tmp_path):
+    path = tmp_path / 'catalog.xml'
+    path.write_text('')
+
+    with pytest.raises(CommandError):
+        call_command('load_catalog', str(path))
+
+@pytest.mark.django_db
+def test_generate_catalog(client):
+    client.get('/api/movies/')
+    out = StringIO()
+    call_command('generate_catalog', '--movies', '300', '--actors', '100', '--directors', '20', '--chunk-size', '120', stdout=out)
+
+    assert 'Generated 300 movies, 20 directors, 100 actors' in out.getvalue()
+    assert Movie.objects.count()==300
+    assert Movie.objects.filter(search_vector__isnull=True).count()==0
+    assert all(1 <= len(genres) <= 3 for genres in Movie.objects.values_list('genres', flat=True))
+    # the counters are recounted and the cached list invalidated
+    assert sum(Director.objects.values_list('movie_count', flat=True))==300
+    assert len(client.get('/api/movies/').data)==300
+    assert CatalogStat.objects.get(facet='total', key='movies').movies==300
+    # Zipf: the most cast actor is in far more movies than the median one
+    counts = sorted(Actor.objects.values_list('movie_count', flat=True))
+    assert counts[-1] > 10 * max(counts[len(counts) // 2], 1)
+
+def test_generated_rows_depend_only_on_the_seed():
+    def rows(seed):
+        generator = CatalogGenerator(10, 50, 5, seed=seed)
+        generator.director_sampler = ZipfSampler(generator.rng, range(1, 6))
+        generator.actor_sampler = ZipfSampler(generator.rng, range(1, 51))
+        movies, cast = generator.movie_rows(list(range(1, 11)))
+        return [row[1:7] + row[9:] for row in movies], cast
+
+    assert rows(1)==rows(1)
+    assert rows(1)!=rows(2)
+
+@pytest.mark.django_db
+def test_slow_queries_command(settings, client, movie):
+    settings.SLOW_QUERY_MS = 0.001
+    settings.SLOW_QUERY_EXPLAIN_RATE = 1
+    client.get(f'/api/movies/{movie.id}/')
+    out = StringIO()
+
+    call_command('slow_queries', '--limit', '1', '--clear', stdout=out)
+
+    assert 'GET /api/movies/' in out.getvalue()
+    assert '1 slow queries, buffer cleared' in out.getvalue()
+    call_command('slow_queries', stdout=out)
+    assert '0 slow queries' in out.getvalue()
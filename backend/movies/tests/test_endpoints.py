@@ -1,7 +1,20 @@
+import base64
+import csv
+import json
 import pytest
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
+from movies.bulk import check_duplicates, check_relations
 from movies.models import Movie, Director, Actor
+from movies.pagination import MovieKeysetPagination
+from movies.services import TMDBUnavailable
+from movies.stats import refresh_catalog_stats
+from movies import slow_queries
 
 @pytest.mark.django_db
 def test_register(client):
@@ -56,6 +69,86 @@ def test_list_movies_with_results(client, movie):
     assert len(response.data)==1
     assert len(response.data[0]['actors_data'])==1
 
+@pytest.mark.django_db
+def test_list_movies_compact_nested_data(client, movie):
+    response = client.get('/api/movies/')
+
+    assert response.data[0]['director_data']=={'id': movie.director.id, 'name': 'Director Test', 'country': 'US'}
+    assert set(response.data[0]['actors_data'][0])=={'id', 'name', 'country'}
+
+@pytest.mark.django_db
+def test_list_movies_expanded_nested_data(client, movie, director):
+    with CaptureQueriesContext(connection) as one_row:
+        response = client.get('/api/movies/?expand=director,actors')
+
+    assert response.data[0]['director_data']['total_movies']==1
+    assert response.data[0]['actors_data'][0]['movies_name']==['Movie test']
+
+    for i in range(5):
+        actor = Actor.objects.create(name=f'Expanded actor {i}', country='US')
+        Movie.objects.create(title=f'Expanded {i}', year=2020, director=director).actors.add(actor)
+
+    with CaptureQueriesContext(connection) as many_rows:
+        response = client.get('/api/movies/?expand=director,actors')
+
+    assert len(response.data)==6
+    assert all(m['director_data']['total_movies']==6 for m in response.data)
+    assert len(many_rows)==len(one_row)
+
+@pytest.mark.django_db
+def test_list_movies_sparse_fields(client, movie):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get('/api/movies/?fields=title,year,rating,poster_url')
+
+    assert response.status_code==200
+    assert set(response.data[0])=={'id', 'title', 'year', 'rating', 'poster_url'}
+    sql = ' '.join(query['sql'] for query in queries)
+    # unrequested columns and relations are not fetched
+    assert '"movies_movie"."description"' not in sql
+    assert 'movies_director' not in sql
+    assert 'movies_actor' not in sql
+
+@pytest.mark.django_db
+def test_list_movies_sparse_fields_with_relations(client, movie):
+    response = client.get('/api/movies/?fields=title,director_data&expand=actors')
+
+    assert set(response.data[0])=={'id', 'title', 'director_data', 'actors_data'}
+    assert response.data[0]['director_data']['name']=='Director Test'
+    assert response.data[0]['actors_data'][0]['total_movies']==1
+
+@pytest.mark.django_db
+def test_movie_detail_sparse_fields(client, movie):
+    response = client.get(f'/api/movies/{movie.id}/?fields=title')
+
+    assert response.data=={'id': movie.id, 'title': 'Movie test'}
+
+@pytest.mark.django_db
+def test_list_movies_sparse_fields_paginated(client, director):
+    for i in range(3):
+        Movie.objects.create(title=f'Sparse {i}', year=2020, rating=i + 5, director=director)
+
+    response = client.get('/api/movies/?fields=title&ordering=-rating&page_size=2')
+    titles = [m['title'] for m in response.data['results']]
+    titles += [m['title'] for m in client.get(response.data['next']).data['results']]
+
+    assert titles==['Sparse 2', 'Sparse 1', 'Sparse 0']
+
+@pytest.mark.django_db
+def test_list_movies_unknown_sparse_field(client, movie):
+    response = client.get('/api/movies/?fields=title,secret')
+
+    assert response.status_code==400
+    assert 'secret' in str(response.data['fields'])
+
+@pytest.mark.django_db
+def test_update_movie_ignores_sparse_fields(authenticated_client, movie):
+    response = authenticated_client.patch(f'/api/movies/{movie.id}/?fields=title', {'rating': 9}, format='json')
+    movie.refresh_from_db()
+
+    assert response.status_code==200
+    assert response.data['description']==movie.description
+    assert movie.rating==9
+
 @pytest.mark.django_db
 def test_create_movie_full_data(authenticated_client, director, actor):
     data = {
@@ -74,6 +167,33 @@ def test_create_movie_full_data(authenticated_client, director, actor):
     assert response.status_code==201
     assert response.data['title']=='Movie Test'
 
+@pytest.mark.django_db
+def test_create_duplicate_movie(authenticated_client, movie, director, actor):
+    data = {
+        'title': 'MOVIE TEST',
+        'year': 2020,
+        'genres': ['Drama'],
+        'rating': 7.5,
+        'description': 'Same title, other case',
+        'poster_url': 'https://ejemplo.com',
+        'director': director.id,
+        'actors_id': [actor.id]
+    }
+
+    response = authenticated_client.post('/api/movies/', data, format='json')
+
+    assert response.status_code==400
+    assert response.data=={'non_field_errors': ['Movie already exists']}
+    assert Movie.objects.count()==1
+
+@pytest.mark.django_db
+def test_rename_movie_to_existing_title(authenticated_client, movie, director):
+    other = Movie.objects.create(title='Other movie', year=2020, genres=['Drama'], rating=7, director=director)
+    response = authenticated_client.patch(f'/api/movies/{other.id}/', {'title': 'movie test'}, format='json')
+
+    assert response.status_code==400
+    assert response.data=={'non_field_errors': ['Movie already exists']}
+
 @pytest.mark.django_db
 def test_create_movie_from_tmdb(authenticated_client, director, actor):
     data = {
@@ -105,6 +225,37 @@ def test_filter_movie(authenticated_client, movie, director, actor):
     assert response.data[0]['title']=='Oppenheimer'
     assert len(response.data)==1
 
+@pytest.mark.django_db
+def test_filter_movies_by_genres(client, movie, director):
+    Movie.objects.create(title='Action Drama', year=2020, genres=['Action', 'Drama'], rating=7, director=director)
+    Movie.objects.create(title='Live Action', year=2020, genres=['Live Action'], rating=7, director=director)
+
+    all_of = client.get('/api/movies/?genres=drama,action')
+    any_of = client.get('/api/movies/?genres=action,drama&genres_mode=any')
+    exact = client.get('/api/movies/?genres=action')
+
+    assert [m['title'] for m in all_of.data]==['Action Drama']
+    assert sorted(m['title'] for m in any_of.data)==['Action Drama', 'Movie test']
+    assert [m['title'] for m in exact.data]==['Action Drama']
+
+@pytest.mark.django_db
+def test_filter_movies_by_genres_ignores_case(client, movie, director):
+    Movie.objects.create(title='Made for TV', year=2020, genres=['TV MOVIE', 'DRAMA'], rating=7, director=director)
+
+    all_of = client.get('/api/movies/?genres=tv movie,drama')
+    any_of = client.get('/api/movies/?genres=Tv Movie&genres_mode=any')
+    drama = client.get('/api/movies/?genres=DRAMA')
+
+    assert [m['title'] for m in all_of.data]==['Made for TV']
+    assert [m['title'] for m in any_of.data]==['Made for TV']
+    assert sorted(m['title'] for m in drama.data)==['Made for TV', 'Movie test']
+
+@pytest.mark.django_db
+def test_filter_movies_invalid_genres_mode(client, movie):
+    response = client.get('/api/movies/?genres=drama&genres_mode=some')
+
+    assert response.status_code==400
+
 @pytest.mark.django_db
 def test_movie_details(client, movie):
     response = client.get(f'/api/movies/{movie.id}/')
@@ -154,6 +305,283 @@ def test_delete_movie(authenticated_client, movie):
     response = authenticated_client.get(f'/api/movies/{movie_id}/')
     assert response.status_code==404
 
+# BULK IMPORT TESTS
+def bulk_movie(title, director, actors, **extra):
+    return {'title': title, 'year': 2020, 'genres': ['drama'], 'rating': 7.5, 'description': f'{title} plot',
+            'poster_url': 'https://example.com/p.jpg', 'director': director.id, 'actors_id': [a.id for a in actors], **extra}
+
+@pytest.mark.django_db
+def test_bulk_create_movies(authenticated_client, director, actor):
+    authenticated_client.get('/api/movies/')
+    data = [bulk_movie('Bulk One', director, [actor]), bulk_movie('Bulk Two', director, [actor, actor])]
+
+    response = authenticated_client.post('/api/movies/bulk/', data, format='json')
+
+    assert response.status_code==201
+    assert response.data['created']==2
+    assert [r['title'] for r in response.data['results']]==['Bulk One', 'Bulk Two']
+    movie = Movie.objects.get(title='Bulk Two')
+    assert list(movie.actors.all())==[actor]
+    assert movie.genres==['Drama']
+    # searchable and visible in the (invalidated) cached list
+    assert [m['title'] for m in authenticated_client.get('/api/movies/?q=bulk one').data]==['Bulk One']
+    assert len(authenticated_client.get('/api/movies/').data)==2
+
+@pytest.mark.django_db
+def test_bulk_create_reports_item_errors(authenticated_client, movie, director, actor):
+    data = [
+        bulk_movie('New movie', director, [actor]),
+        bulk_movie('MOVIE TEST', director, [actor]),
+        bulk_movie('new movie', director, [actor]),
+        {**bulk_movie('Bad relations', director, [actor]), 'director': 999, 'actors_id': [actor.id, 998]},
+        bulk_movie('Bad rating', director, [actor], rating=11),
+    ]
+
+    response = authenticated_client.post('/api/movies/bulk/', data, format='json')
+    results = response.data['results']
+
+    assert response.status_code==207
+    assert results[0]['status']=='created'
+    assert results[1]['errors']=={'non_field_errors': ['Movie already exists']}
+    assert results[2]['errors']=={'non_field_errors': ['Movie is repeated in the request']}
+    assert set(results[3]['errors'])=={'director', 'actors_id'}
+    assert 'rating' in results[4]['errors']
+    assert Movie.objects.count()==2
+
+@pytest.mark.django_db
+def test_bulk_create_concurrent_duplicate(authenticated_client, director, actor):
+    def check_then_race(pending, results):
+        # another request creates the title between the check and the insert
+        valid = check_duplicates(pending, results)
+        if not Movie.objects.filter(title__iexact='Raced').exists():
+            Movie.objects.create(title='raced', year=2020, genres=['Drama'], rating=7, director=director)
+        return valid
+
+    data = [bulk_movie('Raced', director, [actor]), bulk_movie('Not raced', director, [actor])]
+    with mock.patch('movies.bulk.check_duplicates', side_effect=check_then_race):
+        response = authenticated_client.post('/api/movies/bulk/', data, format='json')
+    results = response.data['results']
+
+    assert results[0]['errors']=={'non_field_errors': ['Movie already exists']}
+    assert results[1]['status']=='created'
+
+@pytest.mark.django_db
+def test_bulk_create_concurrent_actor_delete(authenticated_client, director, actor):
+    other = Actor.objects.create(name='Deleted actor', country='US')
+
+    def check_then_delete(pending, results):
+        # another request deletes the actor between the check and the insert
+        valid = check_relations(pending, results)
+        Actor.objects.filter(pk=other.pk).delete()
+        return valid
+
+    data = [bulk_movie('Kept', director, [actor]), bulk_movie('Lost actor', director, [other])]
+    with mock.patch('movies.bulk.check_relations', side_effect=check_then_delete):
+        response = authenticated_client.post('/api/movies/bulk/', data, format='json')
+    results = response.data['results']
+
+    assert response.status_code==207
+    assert results[0]['status']=='created'
+    assert results[1]['errors']=={'actors_id': [f'Invalid pk "{other.pk}" - object does not exist.']}
+
+@pytest.mark.django_db
+def test_bulk_create_keeps_conflicting(authenticated_client, director, actor):
+    with mock.patch('movies.bulk.create_movies', side_effect=IntegrityError):
+        response = authenticated_client.post('/api/movies/bulk/', [bulk_movie('Conflict', director, [actor])], format='json')
+
+    assert response.status_code==400
+    assert response.data['results'][0]['errors']=={'non_field_errors': ['Conflicting concurrent changes, try again']}
+
+@pytest.mark.django_db
+@mock.patch('movies.bulk.fetch_movie_data', side_effect=ValueError('invalid JSON'))
+def test_bulk_create_unexpected_tmdb_error(mock_fetch, authenticated_client, director, actor):
+    data = [{'title': 'Broken lookup', 'director': director.id, 'actors_id': [actor.id]}, bulk_movie('Complete', director, [actor])]
+
+    response = authenticated_client.post('/api/movies/bulk/', data, format='json')
+
+    assert response.status_code==207
+    assert response.data['results'][0]['errors']=={'non_field_errors': ['Could not get the movie data from TMDB']}
+    assert response.data['results'][1]['status']=='created'
+
+@pytest.mark.django_db
+@mock.patch('movies.bulk.fetch_movie_data')
+def test_bulk_create_enriches_from_tmdb(mock_fetch, authenticated_client, director, actor):
+    def fetch(title):
+        if title == 'Unavailable':
+            raise TMDBUnavailable()
+        return {'year': '1999', 'genres': ['Action'], 'description': f'{title} from TMDB', 'rating': 8.7, 'poster_url': None}
+    mock_fetch.side_effect = fetch
+    data = [
+        {'title': 'Only title', 'director': director.id, 'actors_id': [actor.id]},
+        {'title': 'Unavailable', 'director': director.id, 'actors_id': [actor.id]},
+        bulk_movie('Complete', director, [actor]),
+    ]
+
+    response = authenticated_client.post('/api/movies/bulk/', data, format='json')
+
+    assert response.status_code==207
+    assert mock_fetch.call_count==2
+    movie = Movie.objects.get(title='Only title')
+    assert (movie.year, movie.genres, movie.rating)==(1999, ['Action'], 8.7)
+    assert response.data['results'][1]['status']=='error'
+
+@pytest.mark.django_db
+def test_bulk_create_query_count_is_constant(authenticated_client, director, actor):
+    with CaptureQueriesContext(connection) as few:
+        authenticated_client.post('/api/movies/bulk/', [bulk_movie(f'Few {i}', director, [actor]) for i in range(2)], format='json')
+
+    with CaptureQueriesContext(connection) as many:
+        authenticated_client.post('/api/movies/bulk/', [bulk_movie(f'Many {i}', director, [actor]) for i in range(50)], format='json')
+
+    assert Movie.objects.count()==52
+    assert len(many)==len(few)
+
+@pytest.mark.django_db
+def test_bulk_create_requires_a_list(authenticated_client):
+    assert authenticated_client.post('/api/movies/bulk/', {'title': 'x'}, format='json').status_code==400
+    assert authenticated_client.post('/api/movies/bulk/', [{}] * 501, format='json').status_code==400
+
+@pytest.mark.django_db
+def test_bulk_create_unauthorized(client, director, actor):
+    response = client.post('/api/movies/bulk/', [bulk_movie('Nope', director, [actor])], format='json')
+
+    assert response.status_code==401
+
+# EXPORT TESTS
+@pytest.mark.django_db
+def test_export_movies_ndjson(client, movie, director):
+    Movie.objects.create(title='Comedy', year=2020, genres=['Comedy'], rating=6, director=director)
+
+    response = client.get('/api/movies/export/')
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    assert response.status_code==200
+    assert response['Content-Type']=='application/x-ndjson'
+    assert [row['title'] for row in rows]==['Movie test', 'Comedy']
+    assert rows[0]['director_data']['name']=='Director Test'
+    assert rows[0]['actors_data'][0]['name']=='Actor Test'
+
+@pytest.mark.django_db
+def test_export_movies_csv_honors_filters(client, movie, director):
+    Movie.objects.create(title='Comedy', year=2020, genres=['Comedy'], rating=6, director=director)
+
+    response = client.get('/api/movies/export/?output=csv&genres=drama')
+    rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+
+    assert response['Content-Type']=='text/csv'
+    assert len(rows)==1
+    assert rows[0]['title']=='Movie test'
+    assert rows[0]['director']=='Director Test'
+    assert rows[0]['actors']=='Actor Test'
+    assert rows[0]['genres']=='Drama'
+
+@pytest.mark.django_db
+def test_export_movies_query_count_is_constant(client, movie, director):
+    with CaptureQueriesContext(connection) as one_row:
+        b''.join(client.get('/api/movies/export/').streaming_content)
+
+    for i in range(10):
+        Movie.objects.create(title=f'Export {i}', year=2020, director=director).actors.add(*Actor.objects.all())
+
+    with CaptureQueriesContext(connection) as many_rows:
+        content = b''.join(client.get('/api/movies/export/').streaming_content)
+
+    assert len(content.splitlines())==11
+    assert len(many_rows)==len(one_row)
+
+@pytest.mark.django_db
+def test_export_movies_invalid_output(client):
+    assert client.get('/api/movies/export/?output=xml').status_code==400
+
+# FULL-TEXT SEARCH TESTS
+@pytest.mark.django_db
+def test_full_text_search_ranks_title_first(client, director):
+    Movie.objects.create(title='Quiet evening', year=2020, description='A film about a submarine crew', director=director)
+    Movie.objects.create(title='Submarine', year=2020, description='Under the sea', director=director)
+    Movie.objects.create(title='Unrelated', year=2020, description='Nothing to see here', director=director)
+
+    response = client.get('/api/movies/?q=submarines')
+
+    assert response.status_code==200
+    assert [m['title'] for m in response.data]==['Submarine', 'Quiet evening']
+
+@pytest.mark.django_db
+def test_full_text_search_matches_cast(client, movie, actor):
+    assert [m['title'] for m in client.get('/api/movies/?q=actor').data]==['Movie test']
+
+    actor.name = 'Someone Else'
+    actor.save()
+
+    assert client.get('/api/movies/?q=someone').data[0]['title']=='Movie test'
+    assert client.get('/api/movies/?q=actor').data==[]
+
+@pytest.mark.django_db
+def test_full_text_search_paginated_by_rank(client, director):
+    for i in range(3):
+        Movie.objects.create(title=f'Space {i}', year=2020, description='space ' * i, director=director)
+
+    response = client.get('/api/movies/?q=space&page_size=2')
+    titles = [m['title'] for m in response.data['results']]
+    titles += [m['title'] for m in client.get(response.data['next']).data['results']]
+
+    assert titles==['Space 2', 'Space 1', 'Space 0']
+
+# CACHE TESTS
+@pytest.mark.django_db
+def test_movie_write_keeps_unrelated_cache_keys(authenticated_client, movie):
+    cache.set('unrelated-key', 'warm')
+    authenticated_client.patch(f'/api/movies/{movie.id}/', {'title': 'Renamed'}, format='json')
+
+    assert cache.get('unrelated-key')=='warm'
+
+@pytest.mark.django_db
+def test_movie_update_invalidates_cached_pages(authenticated_client, movie):
+    authenticated_client.get('/api/movies/')
+    authenticated_client.get(f'/api/movies/{movie.id}/')
+
+    authenticated_client.patch(f'/api/movies/{movie.id}/', {'title': 'Renamed'}, format='json')
+
+    assert authenticated_client.get('/api/movies/').data[0]['title']=='Renamed'
+    assert authenticated_client.get(f'/api/movies/{movie.id}/').data['title']=='Renamed'
+
+@pytest.mark.django_db
+def test_director_update_invalidates_movie_pages(authenticated_client, movie, director):
+    authenticated_client.get('/api/movies/')
+    authenticated_client.get(f'/api/movies/{movie.id}/')
+
+    authenticated_client.patch(f'/api/directors/{director.id}/', {'name': 'Renamed Director'}, format='json')
+
+    assert authenticated_client.get('/api/movies/').data[0]['director_data']['name']=='Renamed Director'
+    assert authenticated_client.get(f'/api/movies/{movie.id}/').data['director_data']['name']=='Renamed Director'
+
+@pytest.mark.django_db
+def test_actor_delete_invalidates_movie_pages(authenticated_client, movie, actor):
+    authenticated_client.get('/api/movies/')
+
+    authenticated_client.delete(f'/api/actors/{actor.id}/')
+
+    assert authenticated_client.get('/api/movies/').data[0]['actors_data']==[]
+
+@pytest.mark.django_db
+def test_cast_change_invalidates_actor_list(client, movie, actor):
+    assert client.get('/api/actors/').data[0]['total_movies']==1
+
+    movie.actors.clear()
+
+    assert client.get('/api/actors/').data[0]['total_movies']==0
+
+    actor.movies.add(movie)
+
+    assert client.get('/api/actors/').data[0]['movies_name']==['Movie test']
+
+@pytest.mark.django_db
+def test_movie_write_invalidates_director_list(client, movie, director):
+    assert client.get('/api/directors/').data[0]['total_movies']==1
+
+    Movie.objects.create(title='Second movie', year=2020, director=director)
+
+    assert client.get('/api/directors/').data[0]['movies_name']==['Movie test', 'Second movie']
+
 # DIRECTOR TESTS
 @pytest.mark.django_db
 def test_list_directors_empty(client):
@@ -171,6 +599,14 @@ def test_list_directors_with_results(client, director):
     assert response.data[0]['name']=='Director Test'
     assert response.data[0]['country']=='US'
 
+@pytest.mark.django_db
+def test_filter_directors_by_name(client, director):
+    Director.objects.create(name='Greta Gerwig', country='US')
+    response = client.get('/api/directors/?name=gerw')
+
+    assert response.status_code==200
+    assert [d['name'] for d in response.data]==['Greta Gerwig']
+
 @pytest.mark.django_db
 def test_create_director(authenticated_client):
     data = {'name': 'New Director', 'country': 'GB'}
@@ -217,6 +653,24 @@ def test_delete_director(authenticated_client, director):
     response = authenticated_client.get(f'/api/directors/{director_id}/')
     assert response.status_code==404
 
+@pytest.mark.django_db
+def test_list_directors_query_count_is_constant(client, movie):
+    with CaptureQueriesContext(connection) as one_row:
+        response = client.get('/api/directors/')
+
+    for i in range(5):
+        director = Director.objects.create(name=f'Director {i}', country='US')
+        Movie.objects.create(title=f'Directed {i}', year=2020, director=director)
+
+    with CaptureQueriesContext(connection) as many_rows:
+        response = client.get('/api/directors/')
+
+    directors = {director['name']: director for director in response.data}
+    assert len(directors)==6
+    assert directors['Director Test']['total_movies']==1
+    assert directors['Director Test']['movies_name']==['Movie test']
+    assert len(many_rows)==len(one_row)
+
 # ACTOR TESTS
 @pytest.mark.django_db
 def test_list_actors_empty(client):
@@ -280,6 +734,53 @@ def test_delete_actor(authenticated_client, actor):
     response = authenticated_client.get(f'/api/actors/{actor_id}/')
     assert response.status_code==404
 
+@pytest.mark.django_db
+def test_list_actors_query_count_is_constant(client, movie):
+    with CaptureQueriesContext(connection) as one_row:
+        response = client.get('/api/actors/')
+
+    for i in range(5):
+        actor = Actor.objects.create(name=f'Actor {i}', country='US')
+        actor.movies.add(movie)
+
+    with CaptureQueriesContext(connection) as many_rows:
+        response = client.get('/api/actors/')
+
+    assert len(response.data)==6
+    assert all(actor['total_movies']==1 for actor in response.data)
+    assert all(actor['movies_name']==['Movie test'] for actor in response.data)
+    assert len(many_rows)==len(one_row)
+
+@pytest.mark.django_db
+def test_directors_by_movie_count(client, movie, director):
+    prolific = Director.objects.create(name='Prolific', country='US')
+    for i in range(3):
+        Movie.objects.create(title=f'Prolific {i}', year=2020, director=prolific)
+
+    response = client.get('/api/directors/?ordering=-movie_count')
+    assert [(d['name'], d['total_movies']) for d in response.data]==[('Prolific', 3), ('Director Test', 1)]
+
+    response = client.get('/api/directors/?min_movies=2')
+    assert [d['name'] for d in response.data]==['Prolific']
+
+@pytest.mark.django_db
+def test_bulk_import_counts_movies(authenticated_client, director, actor):
+    data = [{'title': f'Counted {i}', 'year': 2020, 'genres': ['Drama'], 'rating': 7, 'description': 'd',
+             'poster_url': 'https://example.com/p.jpg', 'director': director.id, 'actors_id': [actor.id]} for i in range(2)]
+
+    authenticated_client.post('/api/movies/bulk/', data, format='json')
+
+    assert authenticated_client.get(f'/api/directors/{director.id}/').data['total_movies']==2
+    assert authenticated_client.get('/api/actors/?max_movies=2').data[0]['total_movies']==2
+
+@pytest.mark.django_db
+def test_filter_actors_by_name(client, actor):
+    Actor.objects.create(name='Tilda Swinton', country='GB')
+    response = client.get('/api/actors/?name=SWIN')
+
+    assert response.status_code==200
+    assert [a['name'] for a in response.data]==['Tilda Swinton']
+
 # PERMISSION TESTS
 @pytest.mark.django_db
 def test_create_movie_unauthorized(client, director, actor):
@@ -349,3 +850,305 @@ def test_delete_actor_unauthorized(client, actor):
     assert response.status_code==401
 
 
+
+# PAGINATION TESTS
+@pytest.mark.django_db
+def test_list_movies_cursor_pagination(client, director):
+    for i in range(5):
+        Movie.objects.create(title=f'Paginated {i}', year=2020, genres=['Drama'], rating=i + 1, director=director)
+
+    response = client.get('/api/movies/?page_size=2')
+
+    assert response.status_code==200
+    assert [m['title'] for m in response.data['results']]==['Paginated 4', 'Paginated 3']
+    assert response.data['previous'] is None
+
+    titles = [m['title'] for m in response.data['results']]
+    next_url = response.data['next']
+    while next_url:
+        response = client.get(next_url)
+        titles += [m['title'] for m in response.data['results']]
+        next_url = response.data['next']
+
+    assert titles==[f'Paginated {i}' for i in range(4, -1, -1)]
+
+    # going back from the last page returns the previous one
+    response = client.get(response.data['previous'])
+    assert [m['title'] for m in response.data['results']]==['Paginated 2', 'Paginated 1']
+
+@pytest.mark.django_db
+def test_list_movies_cursor_pagination_by_rating(client, director):
+    Movie.objects.create(title='No rating', year=2020, director=director)
+    for rating in [7, 9, 7, 8]:
+        Movie.objects.create(title=f'Rated {rating} {Movie.objects.count()}', year=2020, rating=rating, director=director)
+
+    response = client.get('/api/movies/?page_size=3&ordering=-rating')
+    first_page = response.data['results']
+    response = client.get(response.data['next'])
+    second_page = response.data['results']
+
+    assert [m['rating'] for m in first_page]==[9, 8, 7]
+    assert [m['rating'] for m in second_page]==[7, None]
+    assert response.data['next'] is None
+
+@pytest.mark.django_db
+@mock.patch.object(MovieKeysetPagination, 'max_page_size', 2)
+def test_list_movies_page_size_is_bounded(client, director):
+    for i in range(3):
+        Movie.objects.create(title=f'Bounded {i}', year=2020, director=director)
+
+    response = client.get('/api/movies/?page_size=1000')
+
+    assert response.status_code==200
+    assert len(response.data['results'])==2
+    assert 'page_size=2' in response.data['next']
+
+@pytest.mark.django_db
+def test_list_movies_invalid_cursor(client, movie):
+    response = client.get('/api/movies/?cursor=not-a-cursor')
+
+    assert response.status_code==404
+
+@pytest.mark.django_db
+# the id, the id of a rating cursor and its rating
+@pytest.mark.parametrize('ordering, index', [('', 1), ('-rating', 1), ('-rating', 0)])
+def test_list_movies_cursor_with_boolean(client, director, ordering, index):
+    for i in range(3):
+        Movie.objects.create(title=f'Cursor {i}', year=2020, rating=7, director=director)
+    next_url = client.get(f'/api/movies/?page_size=1&ordering={ordering}').data['next']
+    cursor = parse_qs(urlparse(next_url).query)['cursor'][0]
+
+    payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    payload['p'][index] = True
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    assert client.get(f'/api/movies/?page_size=1&ordering={ordering}&cursor={cursor}').status_code==404
+
+# CONDITIONAL GET TESTS
+@pytest.mark.django_db
+def test_list_movies_not_modified(client, movie):
+    response = client.get('/api/movies/')
+    etag = response['ETag']
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get('/api/movies/', HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code==304
+    assert response['ETag']==etag
+    assert not response.content
+    # only the validators aggregate
+    assert len(queries)==1
+
+@pytest.mark.django_db
+def test_list_movies_etag_changes_on_write(client, movie):
+    etag = client.get('/api/movies/')['ETag']
+
+    movie.title = 'Renamed'
+    movie.save()
+    response = client.get('/api/movies/', HTTP_IF_NONE_MATCH=etag)
+
+    assert response.status_code==200
+    assert response['ETag']!=etag
+    etag = response['ETag']
+
+    Movie.objects.create(title='Deleted', year=2020, director=movie.director).delete()
+
+    assert client.get('/api/movies/', HTTP_IF_NONE_MATCH=etag).status_code==200
+
+@pytest.mark.django_db
+def test_list_movies_etag_changes_on_write_without_signals(client, movie):
+    etag = client.get('/api/movies/')['ETag']
+
+    # bulk_create doesn't send post_save, so the generations stay the same
+    Movie.objects.bulk_create([Movie(title='Bulk', year=2020, director=movie.director)])
+
+    assert client.get('/api/movies/', HTTP_IF_NONE_MATCH=etag).status_code==200
+
+@pytest.mark.django_db
+def test_list_movies_etag_depends_on_query(client, movie):
+    etag = client.get('/api/movies/')['ETag']
+
+    assert client.get('/api/movies/?genres=drama', HTTP_IF_NONE_MATCH=etag).status_code==200
+
+@pytest.mark.django_db
+def test_movie_detail_if_modified_since(client, movie):
+    response = client.get(f'/api/movies/{movie.id}/')
+    last_modified = response['Last-Modified']
+
+    assert client.get(f'/api/movies/{movie.id}/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code==304
+    assert client.get(f'/api/movies/{movie.id}/', HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT').status_code==200
+
+@pytest.mark.django_db
+def test_movie_detail_etag_changes_with_embedded_director(client, movie, director):
+    etag = client.get(f'/api/movies/{movie.id}/')['ETag']
+
+    director.name = 'Renamed Director'
+    director.save()
+
+    assert client.get(f'/api/movies/{movie.id}/', HTTP_IF_NONE_MATCH=etag).status_code==200
+
+@pytest.mark.django_db
+def test_expanded_movie_detail_changes_with_other_movies(client, movie, director):
+    url = f'/api/movies/{movie.id}/?expand=director'
+    response = client.get(url)
+    etag = response['ETag']
+    assert response.data['director_data']['total_movies']==1
+
+    Movie.objects.create(title='Another movie', year=2020, rating=7, director=director)
+
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code==200
+    assert response.data['director_data']['total_movies']==2
+    assert 'Another movie' in response.data['director_data']['movies_name']
+
+@pytest.mark.django_db
+def test_director_detail_etag_changes_with_cast(client, movie, director, actor):
+    director_etag = client.get(f'/api/directors/{director.id}/')['ETag']
+    actor_etag = client.get(f'/api/actors/{actor.id}/')['ETag']
+
+    assert client.get(f'/api/directors/{director.id}/', HTTP_IF_NONE_MATCH=director_etag).status_code==304
+
+    movie.actors.clear()
+    movie.delete()
+
+    assert client.get(f'/api/directors/{director.id}/', HTTP_IF_NONE_MATCH=director_etag).status_code==200
+    assert client.get(f'/api/actors/{actor.id}/', HTTP_IF_NONE_MATCH=actor_etag).status_code==200
+
+@pytest.mark.django_db
+def test_conditional_get_missing_object(client):
+    response = client.get('/api/movies/999/', HTTP_IF_NONE_MATCH='"anything"')
+
+    assert response.status_code==404
+    assert 'ETag' not in response
+
+# STATS TESTS
+@pytest.mark.django_db
+def test_catalog_stats(client, movie, director, actor):
+    Movie.objects.create(title='Old', year=1994, genres=['Drama', 'Crime'], rating=6.5, director=director)
+    Movie.objects.create(title='Older', year=1991, genres=['Crime'], director=Director.objects.create(name='Other'))
+    refresh_catalog_stats()
+
+    response = client.get('/api/stats/?top=1')
+
+    assert response.status_code==200
+    assert response.data['totals']=={'movies': 3, 'directors': 2, 'actors': 1, 'avg_rating': 7.5}
+    assert [(g['key'], g['movies']) for g in response.data['genres']]==[('Crime', 2), ('Drama', 2)]
+    assert [(y['key'], y['movies']) for y in response.data['years']]==[('1991', 1), ('1994', 1), ('2025', 1)]
+    assert [(d['label'], d['movies']) for d in response.data['decades']]==[('1990s', 2), ('2020s', 1)]
+    assert response.data['top_directors']==[
+        {'key': str(director.id), 'label': 'Director Test', 'movies': 2, 'avg_rating': 7.5}
+    ]
+    assert response.data['top_actors'][0]['movies']==1
+
+@pytest.mark.django_db
+def test_catalog_stats_is_one_query(client, movie):
+    with CaptureQueriesContext(connection) as queries:
+        client.get('/api/stats/')
+
+    assert len(queries)==1
+
+@pytest.mark.django_db
+def test_catalog_stats_invalid_top(client):
+    assert client.get('/api/stats/?top=many').status_code==400
+
+@pytest.mark.django_db
+def test_writes_schedule_one_stats_refresh(settings, django_capture_on_commit_callbacks, director):
+    settings.CATALOG_STATS_REFRESH_DELAY = 30
+
+    with mock.patch('movies.stats.threading.Timer') as timer:
+        with django_capture_on_commit_callbacks(execute=True):
+            Movie.objects.create(title='One', year=2020, director=director)
+            Movie.objects.create(title='Two', year=2020, director=director)
+
+    timer.assert_called_once()
+    assert timer.call_args.args[0]==30
+
+# SERVER TIMING TESTS
+def server_timing(response):
+    return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+@pytest.mark.django_db
+def test_server_timing_header(settings, client, movie):
+    settings.SERVER_TIMING = 'all'
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get('/api/movies/')
+
+    timing = server_timing(response)
+    assert response.status_code==200
+    assert {'db', 'cache', 'serialize', 'render', 'app', 'total'} <= set(timing)
+    assert f'desc="{len(queries)} queries"' in timing['db']
+
+    # a cached page has no serializer or renderer work left, and only the validators aggregate
+    timing = server_timing(client.get('/api/movies/'))
+    assert 'desc="1 queries"' in timing['db']
+    assert 'serialize' not in timing
+
+@pytest.mark.django_db
+def test_server_timing_only_for_staff(settings, client, user):
+    settings.SERVER_TIMING = 'staff'
+    assert 'Server-Timing' not in client.get('/api/movies/')
+
+    user.is_staff = True
+    user.save()
+    client.force_authenticate(user=user)
+    assert 'Server-Timing' in client.get('/api/movies/')
+
+    settings.SERVER_TIMING = 'off'
+    assert 'Server-Timing' not in client.get('/api/movies/')
+
+@pytest.mark.django_db
+def test_request_log_line(client, movie):
+    with mock.patch('movies.timing.logger') as logger:
+        client.get('/api/movies/?page_size=1')
+
+    message = logger.info.call_args.args[0]
+    assert message.startswith('GET /api/movies/?page_size=1 200 ')
+    assert 'db=' in message and 'q ' in message
+
+# SLOW QUERY TESTS
+@pytest.fixture
+def record_every_query(settings):
+    settings.SLOW_QUERY_MS = 0.001
+    settings.SLOW_QUERY_EXPLAIN_RATE = 1
+
+@pytest.mark.django_db
+def test_slow_queries_are_recorded(record_every_query, client, movie):
+    client.get(f'/api/movies/{movie.id}/')
+
+    entries = slow_queries.recent()
+    assert entries
+    assert all(entry['view']=='movie-detail' and entry['path']==f'/api/movies/{movie.id}/' for entry in entries)
+    selects = [entry for entry in entries if entry['sql'].startswith('SELECT')]
+    assert all('Execution Time' in entry['plan'] for entry in selects)
+    assert str(movie.id) in selects[-1]['params']
+
+@pytest.mark.django_db
+def test_slow_queries_buffer_is_bounded(record_every_query, settings, client, movie):
+    settings.SLOW_QUERY_BUFFER_SIZE = 3
+    client.get('/api/movies/')
+    client.get('/api/directors/')
+
+    assert len(slow_queries.recent())==3
+    assert slow_queries.recent(1)[0]['view']=='directors'
+
+@pytest.mark.django_db
+def test_slow_queries_endpoint(record_every_query, client, user, movie):
+    client.get('/api/movies/')
+    client.force_authenticate(user=user)
+    assert client.get('/api/slow-queries/').status_code==403
+
+    user.is_staff = True
+    user.save()
+    response = client.get('/api/slow-queries/?limit=2')
+    assert response.status_code==200
+    assert len(response.data)==2
+
+    assert client.delete('/api/slow-queries/').status_code==204
+    assert slow_queries.recent()==[]
+
+@pytest.mark.django_db
+def test_fast_queries_are_not_recorded(client, movie):
+    client.get('/api/movies/')
+
+    assert slow_queries.recent()==[]
@@ -0,0 +1,77 @@
+import pytest
+from unittest import mock
+import requests
+from prometheus_client import REGISTRY
+from movies.services import TMDBClient, TMDBUnavailable
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+@pytest.mark.django_db
+def test_request_metrics(client, movie):
+    labels = {'view': 'movies', 'method': 'GET', 'status': '200'}
+    requests_before = sample('movies_http_request_duration_seconds_count', **labels)
+    misses = sample('movies_page_cache_requests_total', page='movies_list', result='miss')
+    hits = sample('movies_page_cache_requests_total', page='movies_list', result='hit')
+
+    client.get('/api/movies/')
+    client.get('/api/movies/')
+
+    assert sample('movies_http_request_duration_seconds_count', **labels)==requests_before + 2
+    assert sample('movies_page_cache_requests_total', page='movies_list', result='miss')==misses + 1
+    assert sample('movies_page_cache_requests_total', page='movies_list', result='hit')==hits + 1
+    # the cached response ran no query
+    assert sample('movies_http_request_db_queries_bucket', view='movies', le='0.0') >= 1
+
+@pytest.mark.django_db
+def test_auth_failure_metrics(client):
+    invalid = sample('movies_auth_failures_total', reason='token_not_valid')
+    login = sample('movies_auth_failures_total', reason='wrong_credentials')
+
+    client.get('/api/movies/', HTTP_AUTHORIZATION='Bearer not-a-token')
+    client.post('/api/auth/login/', {'username': 'nobody', 'password': 'wrong'}, format='json')
+
+    assert sample('movies_auth_failures_total', reason='token_not_valid')==invalid + 1
+    assert sample('movies_auth_failures_total', reason='wrong_credentials')==login + 1
+
+def test_tmdb_metrics():
+    client = TMDBClient(api_key='key', max_retries=1, retry_backoff=0)
+    client.session = mock.Mock(**{'get.side_effect': requests.Timeout()})
+    errors = sample('movies_tmdb_errors_total', endpoint='/search/movie', reason='Timeout')
+    calls = sample('movies_tmdb_request_duration_seconds_count', endpoint='/search/movie')
+
+    with pytest.raises(TMDBUnavailable):
+        client.get('/search/movie', query='Heat')
+
+    assert sample('movies_tmdb_errors_total', endpoint='/search/movie', reason='Timeout')==errors + 2
+    assert sample('movies_tmdb_request_duration_seconds_count', endpoint='/search/movie')==calls + 1
+
+@pytest.mark.django_db
+def test_metrics_endpoint(settings, client):
+    settings.DEBUG = True
+    client.get('/api/movies/')
+    response = client.get('/metrics/')
+
+    assert response.status_code==200
+    assert b'movies_http_request_duration_seconds_bucket{' in response.content
+
+    settings.METRICS_TOKEN = 'secret'
+    assert client.get('/metrics/').status_code==403
+    assert client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code==200
+
+def test_metrics_endpoint_is_closed_by_default_in_production(settings, client):
+    settings.DEBUG = False
+
+    assert client.get('/metrics/').status_code==403
+
+def test_metrics_endpoint_allowed_ips(settings, client):
+    settings.DEBUG = False
+    settings.METRICS_ALLOWED_IPS = ['10.0.0.0/8']
+
+    assert client.get('/metrics/', REMOTE_ADDR='10.1.2.3').status_code==200
+    assert client.get('/metrics/', REMOTE_ADDR='203.0.113.7').status_code==403
+
+    # with a token too, both are required
+    settings.METRICS_TOKEN = 'secret'
+    assert client.get('/metrics/', REMOTE_ADDR='10.1.2.3').status_code==403
+    assert client.get('/metrics/', REMOTE_ADDR='10.1.2.3', HTTP_AUTHORIZATION='Bearer secret').status_code==200
@@ -1,7 +1,10 @@
 import pytest
+from importlib import import_module
 from rest_framework.test import APIClient
+from django.apps import apps
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.db.utils import DataError, IntegrityError
 from datetime import datetime
 from ..models import Movie, Director, Actor
@@ -18,6 +21,37 @@ def test_create_director(director):
     assert director.name=='Director Test'
     assert director.country=='US'
 
+@pytest.mark.django_db
+def test_movie_genres_are_normalized(director):
+    movie = Movie.objects.create(title='Genres', year=2020, genres=[' science  fiction', 'DRAMA', 'drama', ''], director=director)
+    movie.refresh_from_db()
+
+    assert movie.genres==['Science Fiction', 'Drama']
+
+@pytest.mark.django_db
+def test_movie_genres_keep_inner_capitals(director):
+    movie = Movie.objects.create(title='Genres', year=2020, genres=['tv MOVIE', 'TV Movie', 'sci-fi'], director=director)
+
+    assert movie.genres==['TV Movie', 'Sci-fi']
+
+@pytest.mark.django_db
+def test_timestamps(movie, director, actor):
+    updated_at = movie.updated_at
+    movie.rating = 9
+    movie.save()
+
+    assert movie.updated_at > updated_at
+    assert director.created_at and director.updated_at
+    assert actor.created_at and actor.updated_at
+
+@pytest.mark.django_db
+def test_cast_change_touches_movie(movie, actor):
+    updated_at = movie.updated_at
+    movie.actors.remove(actor)
+    movie.refresh_from_db()
+
+    assert movie.updated_at > updated_at
+
 @pytest.mark.django_db
 def test_create_actor(actor):
     assert actor.name=='Actor Test'
@@ -50,20 +84,26 @@ def test_wrong_iso_country():
 @pytest.mark.django_db
 def test_duplicate_actor(actor):
     with pytest.raises(ValidationError):
-        duplicate_actor = Actor.objects.create(name='Actor Test', country='US')
-        duplicate_actor.full_clean()
+        Actor(name='Actor Test', country='US').full_clean()
+
+    with pytest.raises(IntegrityError):
+        Actor.objects.create(name='actor test', country='US')
 
 @pytest.mark.django_db
 def test_duplicate_director(director):
     with pytest.raises(ValidationError):
-        duplicate_director = Director.objects.create(name='Director Test', country='US')
-        duplicate_director.full_clean()
+        Director(name='Director Test', country='US').full_clean()
+
+    with pytest.raises(IntegrityError):
+        Director.objects.create(name='DIRECTOR TEST', country='US')
 
 @pytest.mark.django_db
 def test_duplicate_movie_title(movie, director):
     with pytest.raises(ValidationError):
-        duplicate_title = Movie.objects.create(title='Movie test', year=2025, genres=['Drama'], rating=8.5, director=director)
-        duplicate_title.full_clean()
+        Movie(title='Movie test', year=2025, genres=['Drama'], rating=8.5, director=director).full_clean()
+
+    with pytest.raises(IntegrityError):
+        Movie.objects.create(title='Movie test', year=2025, genres=['Drama'], rating=8.5, director=director)
 
 @pytest.mark.django_db
 def test_future_movie_year(director):
@@ -151,9 +191,73 @@ def test_multiple_total_movies(movie, director):
 
     assert director.total_movies==3
 
+@pytest.mark.django_db
+def test_movie_count_follows_writes(movie, director, actor):
+    other_director = Director.objects.create(name='Other Director', country='US')
+    other_actor = Actor.objects.create(name='Other Actor', country='US')
+    movie_2 = Movie.objects.create(title='Movie test 2', year=2025, director=director)
+    movie_2.actors.add(actor, other_actor)
+    movie_2.actors.add(actor)
+    movie.actors.remove(other_actor)
+
+    def counts():
+        return [model.objects.get(pk=pk).movie_count for model, pk in
+                [(Director, director.pk), (Director, other_director.pk), (Actor, actor.pk), (Actor, other_actor.pk)]]
+
+    assert counts()==[2, 0, 2, 1]
+
+    movie_2.director = other_director
+    movie_2.save()
+    movie.actors.clear()
+    other_actor.movies.add(movie)
+
+    assert counts()==[1, 1, 1, 2]
+
+    movie_2.delete()
+    actor.movies.set([])
+
+    assert counts()==[1, 0, 0, 1]
+
+@pytest.mark.django_db
+def test_stale_instance_keeps_movie_count(movie, director):
+    stale = Director.objects.get(pk=director.pk)
+    Movie.objects.create(title='Movie test 2', year=2025, director=director)
+
+    stale.name = 'Renamed'
+    stale.save()
+    stale.refresh_from_db()
+
+    assert stale.name=='Renamed'
+    assert stale.movie_count==2
+
+@pytest.mark.django_db
+def test_recount_movies(movie, director, actor):
+    Director.objects.update(movie_count=7)
+    Actor.objects.update(movie_count=7)
+
+    assert Director.objects.recount_movies()==1
+    Actor.objects.recount_movies()
+
+    assert Director.objects.get().movie_count==1
+    assert Actor.objects.get().movie_count==1
+
 @pytest.mark.django_db
 def test_duplicate_movie_title_insensitive(movie, director):
-    with pytest.raises(ValidationError):
-        duplicate_title = Movie.objects.create(title='movie test', year=2025, genres=['Drama'], director=director)
+    with pytest.raises(ValidationError) as error:
+        Movie(title='MOVIE TEST', year=2025, genres=['Drama'], rating=8.5, director=director).full_clean()
+    assert error.value.messages==['Movie already exists']
+
+    with pytest.raises(IntegrityError):
+        Movie.objects.create(title='movie test', year=2025, genres=['Drama'], director=director)
 
-        duplicate_title.full_clean()
\ No newline at end of file
+@pytest.mark.django_db
+def test_unique_names_migration_lists_duplicates(director):
+    migration = import_module('movies.migrations.0009_unique_names')
+    # DDL is transactional on PostgreSQL, the constraint comes back with the test's rollback
+    with connection.schema_editor() as editor:
+        editor.remove_constraint(Director, next(c for c in Director._meta.constraints if c.name == 'director_name_unique'))
+    other = Director.objects.create(name='DIRECTOR TEST', country='US')
+
+    with pytest.raises(RuntimeError) as error:
+        migration.check_case_insensitive_duplicates(apps, None)
+    assert f"Director {director.id}: 'Director Test', {other.id}: 'DIRECTOR TEST'" in str(error.value)
@@ -0,0 +1,43 @@
+import io
+import json
+import pytest
+from datetime import datetime, timezone
+from decimal import Decimal
+from django_countries.fields import Country
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from movies.renderers import ORJSONRenderer, ORJSONParser
+
+def test_orjson_renderer_matches_stdlib():
+    data = {
+        'title': 'Movie test', 'rating': Decimal('8.5'), 'country': Country('US'), 'genres': ('Drama',),
+        'created_at': datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc), 'title_es': 'Película', 1: None,
+    }
+
+    rendered = json.loads(ORJSONRenderer().render(data))
+
+    assert rendered['rating']==8.5
+    assert rendered['country']=='US'
+    assert rendered['created_at']=='2025-01-02T03:04:05Z'
+    assert rendered==json.loads(JSONRenderer().render({**data, 'country': 'US'}))
+
+def test_orjson_renderer_indent():
+    assert ORJSONRenderer().render({'a': 1}, 'application/json; indent=4')==b'{\n  "a": 1\n}'
+    assert ORJSONRenderer().render(None)==b''
+
+def test_orjson_parser():
+    assert ORJSONParser().parse(io.BytesIO(b'{"title": "Pel\xc3\xadcula"}'))=={'title': 'Película'}
+
+    with pytest.raises(ParseError):
+        ORJSONParser().parse(io.BytesIO(b'{"title": NaN}'))
+
+@pytest.mark.django_db
+def test_api_uses_orjson(client, authenticated_client, movie):
+    response = client.get(f'/api/movies/{movie.id}/')
+
+    assert isinstance(response.accepted_renderer, ORJSONRenderer)
+    assert json.loads(response.content)['director_data']['country']=='US'
+
+    response = authenticated_client.post('/api/movies/', '{"title": ', content_type='application/json')
+
+    assert response.status_code==400
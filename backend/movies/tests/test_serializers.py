@@ -2,7 +2,7 @@ import pytest
 from unittest import mock
 from rest_framework.exceptions import ValidationError
 from ..serializers import DirectorSerializer, ActorSerializer, MovieSerializer
-from ..models import Movie, Actor
+from ..models import Movie, Actor, Director
 
 @pytest.mark.django_db
 def test_valid_director_data():
@@ -66,17 +66,56 @@ def test_create_movie_from_tmdb(director, actor):
 
 @pytest.mark.django_db
 def test_duplicate_director_name(director_serializer):
-    with pytest.raises(ValidationError):
-        data = {'name': 'Director Test', 'country': 'US'}
+    with pytest.raises(ValidationError) as error:
+        data = {'name': 'director test', 'country': 'US'}
         serializer = DirectorSerializer(data=data)
         serializer.is_valid(raise_exception=True)
+        serializer.save()
+    assert error.value.detail=={'non_field_errors': ['Director already exists']}
 
 @pytest.mark.django_db
 def test_duplicate_actor_name(actor_serializer):
-    with pytest.raises(ValidationError):
-        data = {'name': 'Actor Test', 'country': 'US'}
+    with pytest.raises(ValidationError) as error:
+        data = {'name': 'ACTOR TEST', 'country': 'US'}
         serializer = ActorSerializer(data=data)
         serializer.is_valid(raise_exception=True)
+        serializer.save()
+    assert error.value.detail=={'non_field_errors': ['Actor already exists']}
+
+@pytest.mark.django_db
+@mock.patch('movies.serializers.fetch_movie_data')
+def test_duplicate_movie_title_skips_tmdb(mock_fetch, movie_serializer, director, actor):
+    serializer = MovieSerializer(data={'title': 'MOVIE TEST', 'director': director.id, 'actors_id': [actor.id]})
+
+    assert not serializer.is_valid()
+    assert serializer.errors=={'non_field_errors': ['Movie already exists']}
+    mock_fetch.assert_not_called()
+
+@pytest.mark.django_db
+def test_duplicate_complete_movie_left_to_constraint(movie_serializer, director, actor, django_assert_num_queries):
+    data = {'title': 'MOVIE TEST', 'year': 2020, 'genres': ['Drama'], 'rating': 7, 'description': 'Duplicate',
+            'poster_url': 'http://example.com/duplicate.jpg', 'director': director.id, 'actors_id': [actor.id]}
+    serializer = MovieSerializer(data=data)
+
+    # the director and actor lookups only, no title check
+    with django_assert_num_queries(2):
+        assert serializer.is_valid()
+    with pytest.raises(ValidationError) as error:
+        serializer.save()
+    assert error.value.detail=={'non_field_errors': ['Movie already exists']}
+
+@pytest.mark.django_db
+def test_duplicate_movie_title_created_after_validation(director, actor):
+    data = {'title': 'Raced', 'year': 2020, 'genres': ['Drama'], 'rating': 7, 'description': 'Raced',
+            'poster_url': 'http://example.com/raced.jpg', 'director': director.id, 'actors_id': [actor.id]}
+    serializer = MovieSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    Movie.objects.create(title='raced', year=2020, director=director)
+
+    # the unique constraint still catches it
+    with pytest.raises(ValidationError) as error:
+        serializer.save()
+    assert error.value.detail=={'non_field_errors': ['Movie already exists']}
 
 @pytest.mark.django_db
 def test_duplicate_movie_title(movie_serializer, director, actor):
@@ -94,6 +133,20 @@ def test_duplicate_movie_title(movie_serializer, director, actor):
 
         serializer = MovieSerializer(data=data)
         serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+@pytest.mark.django_db
+def test_rename_to_existing_director_name(director_serializer):
+    other = Director.objects.create(name='Other Director', country='US')
+    serializer = DirectorSerializer(other, data={'name': 'DIRECTOR TEST'}, partial=True)
+    assert serializer.is_valid()
+
+    with pytest.raises(ValidationError) as error:
+        serializer.save()
+    assert error.value.detail=={'non_field_errors': ['Director already exists']}
+
+    other.refresh_from_db()
+    assert other.name=='Other Director'
 
 @pytest.mark.django_db
 def test_future_movie_year(director, actor):
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import urlparse
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from ..services import AsyncTMDBClient, TMDBCache, TMDBClient, TMDBRejected, TMDBUnavailable, retry_after
+
+class StubTMDB(ThreadingHTTPServer):
+    """
+    Local TMDB stand-in. `routes` maps a path to a list of (status, body, delay, *extra (header, value) pairs) answers,
+    the last one repeats
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.routes = {}
+        self.requests = []
+        self.connections = set()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.server.requests.append(path)
+        self.server.connections.add(self.client_address)
+
+        answers = self.server.routes.get(path, [(404, {}, 0)])
+        status, body, delay, *headers = answers.pop(0) if len(answers) > 1 else answers[0]
+        time.sleep(delay)
+
+        if isinstance(body, str):
+            # malformed JSON
+            payload = body.encode()
+            length = len(payload)
+        elif isinstance(body, bytes):
+            # a body cut short: announces more than it sends, then the connection is closed
+            payload = body
+            length = len(payload) + 100
+            self.close_connection = True
+        else:
+            payload = json.dumps(body).encode()
+            length = len(payload)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(length))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+GENRES = (200, {'genres': [{'id': 18, 'name': 'Drama'}]}, 0)
+SEARCH = (200, {'results': [{'title': 'Oppenheimer', 'release_date': '2023-07-19', 'genre_ids': [18], 'vote_average': 8.1}]}, 0)
+
+@pytest.fixture
+def tmdb_server():
+    server = StubTMDB()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def tmdb_client(tmdb_server):
+    return TMDBClient('key', base_url=tmdb_server.url, read_timeout=0.5, retry_backoff=0.01,
+                      circuit_failures=2, circuit_reset=60)
+
+@pytest.fixture
+def tmdb_cache():
+    return TMDBCache(stats_flush_interval=0)
+
+@pytest.fixture
+def cached_tmdb_client(tmdb_server, tmdb_cache):
+    return TMDBClient('key', base_url=tmdb_server.url, read_timeout=0.5, retry_backoff=0.01, cache=tmdb_cache)
+
+@pytest.fixture
+def async_tmdb_client(tmdb_client):
+    return AsyncTMDBClient(tmdb_client)
+
+def test_fetch_movie_data_reuses_connection(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+
+    first = tmdb_client.fetch_movie_data('Oppenheimer')
+    tmdb_client.fetch_movie_data('Oppenheimer')
+
+    assert first['year']=='2023'
+    assert first['genres']==['Drama']
+    # without a cache every lookup calls TMDB, all through the same keep-alive connection
+    assert tmdb_server.requests==['/search/movie', '/genre/movie/list', '/search/movie', '/genre/movie/list']
+    assert len(tmdb_server.connections)==1
+
+def test_retries_server_errors(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(503, {}, 0), (502, {}, 0), SEARCH], '/genre/movie/list': [GENRES]}
+
+    data = tmdb_client.fetch_movie_data('Oppenheimer')
+
+    assert data['title']=='Oppenheimer'
+    assert tmdb_server.requests.count('/search/movie')==3
+
+def test_read_timeout_raises_unavailable(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(200, {}, 1)]}
+    tmdb_client.max_retries = 0
+
+    start = time.monotonic()
+    with pytest.raises(TMDBUnavailable):
+        tmdb_client.fetch_movie_data('Slow')
+
+    assert time.monotonic() - start < 1
+
+def test_client_errors_are_not_retried(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(401, {}, 0)]}
+
+    with pytest.raises(TMDBRejected) as error:
+        tmdb_client.fetch_movie_data('Oppenheimer')
+
+    assert error.value.status_code==502
+    assert tmdb_server.requests==['/search/movie']
+    assert not tmdb_client.breaker.is_open
+
+def test_rate_limit_waits_for_retry_after(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(429, {}, 0, ('Retry-After', '1')), SEARCH], '/genre/movie/list': [GENRES]}
+
+    start = time.monotonic()
+    assert tmdb_client.fetch_movie_data('Oppenheimer')['title']=='Oppenheimer'
+
+    # not the 0.01s backoff
+    assert time.monotonic() - start >= 1
+    assert tmdb_server.requests.count('/search/movie')==2
+
+def test_rate_limit_longer_than_max_retry_after_is_not_retried(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(429, {}, 0, ('Retry-After', '120'))]}
+
+    with pytest.raises(TMDBUnavailable):
+        tmdb_client.fetch_movie_data('Oppenheimer')
+
+    assert tmdb_server.requests==['/search/movie']
+
+def test_retry_after_formats():
+    in_a_minute = datetime.now(timezone.utc) + timedelta(seconds=60)
+
+    assert retry_after({'Retry-After': '3'})==3
+    assert 55 < retry_after({'Retry-After': format_datetime(in_a_minute, usegmt=True)}) <= 60
+    assert retry_after({'Retry-After': 'soon'}) is None
+    assert retry_after({}) is None
+
+def test_circuit_breaker_fails_fast(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(500, {}, 0)]}
+
+    for i in range(2):
+        with pytest.raises(TMDBUnavailable):
+            tmdb_client.fetch_movie_data('Down')
+
+    calls = len(tmdb_server.requests)
+    with pytest.raises(TMDBUnavailable):
+        tmdb_client.fetch_movie_data('Down')
+
+    assert tmdb_client.breaker.is_open
+    assert len(tmdb_server.requests)==calls
+
+def test_circuit_breaker_closes_after_trial_call(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(500, {}, 0)]}
+    tmdb_client.breaker.reset_timeout = 0
+    for i in range(2):
+        with pytest.raises(TMDBUnavailable):
+            tmdb_client.fetch_movie_data('Down')
+
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+
+    assert tmdb_client.fetch_movie_data('Oppenheimer')['title']=='Oppenheimer'
+    assert not tmdb_client.breaker.is_open
+
+@pytest.mark.parametrize('body', ['{"results": [', b'{"results": [{"title": "Oppen'])
+def test_broken_body_during_trial_call_reopens_the_circuit(tmdb_server, tmdb_client, body):
+    tmdb_server.routes = {'/search/movie': [(500, {}, 0)]}
+    tmdb_client.breaker.reset_timeout = 0
+    for i in range(2):
+        with pytest.raises(TMDBUnavailable):
+            tmdb_client.fetch_movie_data('Down')
+
+    tmdb_server.routes = {'/search/movie': [(200, body, 0)]}
+    with pytest.raises(TMDBUnavailable):
+        tmdb_client.fetch_movie_data('Oppenheimer')
+
+    # the trial is over, the next call gets its own
+    assert not tmdb_client.breaker.trial
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+    assert tmdb_client.fetch_movie_data('Oppenheimer')['title']=='Oppenheimer'
+
+def test_concurrent_identical_lookups_are_coalesced(tmdb_server, tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(200, SEARCH[1], 0.2)], '/genre/movie/list': [GENRES]}
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(tmdb_client.fetch_movie_data('Oppenheimer'))) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results)==5
+    assert all(result['title']=='Oppenheimer' for result in results)
+    assert tmdb_server.requests.count('/search/movie')==1
+
+def test_cached_search_skips_tmdb(tmdb_server, cached_tmdb_client, tmdb_cache):
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+
+    cached_tmdb_client.fetch_movie_data('Oppenheimer')
+    data = cached_tmdb_client.fetch_movie_data('  OPPENHEIMER ')
+
+    assert data['genres']==['Drama']
+    assert tmdb_server.requests==['/search/movie', '/genre/movie/list']
+    assert tmdb_cache.get_stats()=={'local_hits': 1, 'shared_hits': 0, 'misses': 2, 'negative_hits': 0}
+
+def test_cache_is_shared_between_workers(tmdb_server, cached_tmdb_client, tmdb_cache):
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+    cached_tmdb_client.fetch_movie_data('Oppenheimer')
+
+    # another worker: same Redis, empty local tier
+    other_worker = TMDBClient('key', base_url=tmdb_server.url, cache=TMDBCache(stats_flush_interval=0))
+    data = other_worker.fetch_movie_data('Oppenheimer')
+
+    assert data['title']=='Oppenheimer'
+    assert len(tmdb_server.requests)==2
+    assert tmdb_cache.get_stats()['shared_hits']==1
+
+def test_no_results_are_cached(tmdb_server, cached_tmdb_client, tmdb_cache):
+    tmdb_server.routes = {'/search/movie': [(200, {'results': []}, 0)]}
+
+    assert cached_tmdb_client.fetch_movie_data('Unknown')=={}
+    assert cached_tmdb_client.fetch_movie_data('Unknown')=={}
+
+    assert tmdb_server.requests==['/search/movie']
+    assert tmdb_cache.get_stats()['negative_hits']==1
+
+def test_errors_are_not_cached(tmdb_server, cached_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(401, {}, 0), SEARCH], '/genre/movie/list': [GENRES]}
+
+    with pytest.raises(TMDBRejected):
+        cached_tmdb_client.fetch_movie_data('Oppenheimer')
+
+    assert cached_tmdb_client.fetch_movie_data('Oppenheimer')['title']=='Oppenheimer'
+
+def test_tmdb_cache_stats_command(tmdb_server, cached_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+    cached_tmdb_client.fetch_movie_data('Oppenheimer')
+    cached_tmdb_client.fetch_movie_data('Oppenheimer')
+    out = StringIO()
+
+    call_command('tmdb_cache_stats', '--reset', stdout=out)
+
+    assert 'Hit ratio: 33.3% (1 of 3 lookups did not call TMDB)' in out.getvalue()
+    assert TMDBCache().get_stats()['misses']==0
+
+def test_async_fetch_movie_data(tmdb_server, async_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+
+    async def fetch_twice():
+        await async_tmdb_client.fetch_movie_data('Oppenheimer')
+        return await async_tmdb_client.fetch_movie_data('Oppenheimer')
+
+    data = async_to_sync(fetch_twice)()
+
+    assert data['year']=='2023'
+    assert data['genres']==['Drama']
+    assert len(tmdb_server.requests)==4
+    assert len(tmdb_server.connections)==1
+
+def test_async_retries_and_shares_the_circuit_breaker(tmdb_server, tmdb_client, async_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(503, {}, 0), SEARCH], '/genre/movie/list': [GENRES]}
+    assert async_to_sync(async_tmdb_client.fetch_movie_data)('Oppenheimer')['title']=='Oppenheimer'
+
+    tmdb_server.routes = {'/search/movie': [(500, {}, 0)]}
+    for i in range(2):
+        with pytest.raises(TMDBUnavailable):
+            async_to_sync(async_tmdb_client.fetch_movie_data)('Down')
+
+    # the sync client of the same process stops calling TMDB too
+    assert tmdb_client.breaker.is_open
+    with pytest.raises(TMDBUnavailable):
+        tmdb_client.fetch_movie_data('Down')
+
+def test_async_rate_limit_waits_for_retry_after(tmdb_server, async_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(429, {}, 0, ('Retry-After', '1')), SEARCH], '/genre/movie/list': [GENRES]}
+
+    start = time.monotonic()
+    assert async_to_sync(async_tmdb_client.fetch_movie_data)('Oppenheimer')['title']=='Oppenheimer'
+
+    assert time.monotonic() - start >= 1
+    assert tmdb_server.requests.count('/search/movie')==2
+
+def test_async_client_errors_are_not_retried(tmdb_server, tmdb_client, async_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(404, {}, 0)]}
+
+    with pytest.raises(TMDBRejected):
+        async_to_sync(async_tmdb_client.fetch_movie_data)('Oppenheimer')
+
+    assert tmdb_server.requests==['/search/movie']
+    assert not tmdb_client.breaker.is_open
+
+@pytest.mark.parametrize('body', [
+    ('{"results": [', 0),
+    (b'{"results": [{"title": "Oppen', 0),
+    # can't be decoded
+    ('{"results": []}', 0, ('Content-Encoding', 'gzip')),
+])
+def test_async_broken_body_during_trial_call_reopens_the_circuit(tmdb_server, tmdb_client, async_tmdb_client, body):
+    tmdb_server.routes = {'/search/movie': [(500, {}, 0)]}
+    tmdb_client.breaker.reset_timeout = 0
+    for i in range(2):
+        with pytest.raises(TMDBUnavailable):
+            async_to_sync(async_tmdb_client.fetch_movie_data)('Down')
+
+    tmdb_server.routes = {'/search/movie': [(200, *body)]}
+    with pytest.raises(TMDBUnavailable):
+        async_to_sync(async_tmdb_client.fetch_movie_data)('Oppenheimer')
+
+    assert not tmdb_client.breaker.trial
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+    assert async_to_sync(async_tmdb_client.fetch_movie_data)('Oppenheimer')['title']=='Oppenheimer'
+
+def test_async_cancelled_trial_call_reopens_the_circuit(tmdb_server, tmdb_client, async_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(500, {}, 0)]}
+    tmdb_client.breaker.reset_timeout = 0
+    for i in range(2):
+        with pytest.raises(TMDBUnavailable):
+            async_to_sync(async_tmdb_client.fetch_movie_data)('Down')
+
+    tmdb_server.routes = {'/search/movie': [(200, SEARCH[1], 0.3)]}
+    with pytest.raises(asyncio.TimeoutError):
+        async_to_sync(asyncio.wait_for)(async_tmdb_client._request('/search/movie', {'query': 'Slow'}), 0.05)
+
+    assert not tmdb_client.breaker.trial
+
+def test_async_concurrent_identical_lookups_are_coalesced(tmdb_server, async_tmdb_client):
+    tmdb_server.routes = {'/search/movie': [(200, SEARCH[1], 0.2)], '/genre/movie/list': [GENRES]}
+
+    async def fetch_all():
+        return await asyncio.gather(*(async_tmdb_client.fetch_movie_data('Oppenheimer') for i in range(5)))
+
+    results = async_to_sync(fetch_all)()
+
+    assert all(result['title']=='Oppenheimer' for result in results)
+    assert tmdb_server.requests.count('/search/movie')==1
+
+def test_async_lookups_share_the_cache(tmdb_server, cached_tmdb_client, tmdb_cache):
+    tmdb_server.routes = {'/search/movie': [SEARCH], '/genre/movie/list': [GENRES]}
+    cached_tmdb_client.fetch_movie_data('Oppenheimer')
+
+    data = async_to_sync(AsyncTMDBClient(cached_tmdb_client).fetch_movie_data)('oppenheimer')
+
+    assert data['genres']==['Drama']
+    assert tmdb_server.requests==['/search/movie', '/genre/movie/list']
+    assert tmdb_cache.get_stats()['local_hits']==1
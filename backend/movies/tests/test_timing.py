@@ -0,0 +1,34 @@
+from unittest import mock
+from movies.services import TMDBClient
+from movies.timing import RequestTimer, _current, phase
+
+def test_nested_phases_add_up():
+    # clock readings: start, serialize starts, db starts, db ends, serialize ends, stop
+    with mock.patch('movies.timing.time.perf_counter', side_effect=[0, 1, 2, 5, 6, 10]):
+        timer = RequestTimer()
+        with timer.phase('serialize'):
+            with timer.phase('db'):
+                pass
+        timer.stop()
+
+    # the db time is not counted again as serialize time
+    assert timer.phases['db']==3
+    assert timer.phases['serialize']==2
+    assert timer.phases['app']==5
+    assert timer.total==10
+
+def test_phase_outside_a_request():
+    with phase('db'):
+        pass
+
+def test_tmdb_phase():
+    client = TMDBClient(api_key='key', cache=None)
+    client.session = mock.Mock(**{'get.return_value.status_code': 200, 'get.return_value.json.return_value': {}})
+    timer = RequestTimer()
+    token = _current.set(timer)
+    try:
+        client.get('/search/movie', query='Heat')
+    finally:
+        _current.reset(token)
+
+    assert timer.phases['tmdb'] > 0
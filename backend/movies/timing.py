@@ -0,0 +1,182 @@
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('movies.requests')
+
+# phases of a request, in the order they are reported. app is whatever no phase covers (routing, permissions,
+# filters, pagination, middleware)
+PHASES = ('db', 'cache', 'serialize', 'tmdb', 'render', 'app')
+
+_current = ContextVar('request_timer', default=None)
+
+class RequestTimer:
+    """
+    Time spent by one request in each phase. Phases nest and each one records its own time without the phases inside
+    it (a query run while serializing counts as db, not serialize), so the phases add up to the total.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        # [start, time of the nested phases] of the open phases
+        self.stack = []
+
+    @contextmanager
+    def phase(self, name):
+        frame = [time.perf_counter(), 0.0]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.phases[name] += elapsed - frame[1]
+            if self.stack:
+                self.stack[-1][1] += elapsed
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        self.queries += 1
+        with self.phase('db'):
+            return execute(sql, params, many, context)
+
+    def stop(self):
+        self.total = time.perf_counter() - self.start
+        self.phases['app'] = max(self.total - sum(self.phases.values()), 0.0)
+
+    def server_timing(self):
+        """Server-Timing header value, in milliseconds: db;dur=12.1;desc="4 queries", ..., total;dur=20.3"""
+        entries = []
+        for name, seconds in self.phases.items():
+            if seconds or name in ('db', 'app'):
+                entry = f'{name};dur={seconds * 1000:.1f}'
+                if name == 'db':
+                    entry += f';desc="{self.queries} queries"'
+                entries.append(entry)
+        entries.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(entries)
+
+    def summary(self):
+        """Log form: 20.3ms (db=12.1ms/4q cache=0.4ms app=7.8ms)"""
+        phases = ' '.join(
+            f'{name}={seconds * 1000:.1f}ms' + (f'/{self.queries}q' if name == 'db' else '')
+            for name, seconds in self.phases.items() if seconds or name == 'db'
+        )
+        return f'{self.total * 1000:.1f}ms ({phases})'
+
+def current_timer():
+    """RequestTimer of the request being handled, None outside ServerTimingMiddleware"""
+    return _current.get()
+
+def phase(name):
+    """
+    Context manager timing a block as `name` for the current request. Outside a request, or in threads the request
+    starts (e.g. the TMDB lookups of a bulk import), nothing is measured.
+    """
+    timer = _current.get()
+    if timer is None:
+        return nullcontext()
+    return timer.phase(name)
+
+def timed(name):
+    """Decorator version of phase(), for functions and coroutine functions"""
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with phase(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@asynccontextmanager
+async def async_execute_wrapper(wrapper):
+    """
+    connection.execute_wrapper() for async middleware. Connections are per thread and the queries of an async request
+    run in the thread of its sync_to_async calls (one per request, see asgiref's ThreadSensitiveContext), so the
+    wrapper is installed on the connection of that thread.
+    """
+    def install():
+        connection.execute_wrappers.append(wrapper)
+
+    def uninstall():
+        connection.execute_wrappers.remove(wrapper)
+
+    await sync_to_async(install)()
+    try:
+        yield
+    finally:
+        await sync_to_async(uninstall)()
+
+class ServerTimingMiddleware:
+    """
+    Measures every request: total time, db time and query count (execute wrapper), and the phases marked with
+    phase()/timed() along the hot path (page cache, serializers, TMDB, renderer). The result goes to the
+    movies.requests log line of the request and, depending on SERVER_TIMING, to a Server-Timing header that browser
+    dev tools show in the network tab: 'all' for every response, 'staff' for staff users only, 'off' for none.
+
+    Goes first in MIDDLEWARE so the total covers the other middlewares too. Runs sync or async, whichever the rest
+    of the stack is.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            with connection.execute_wrapper(timer.execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            timer.stop()
+
+        return self.finish(request, response, timer, self.show_header(request))
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            async with async_execute_wrapper(timer.execute_wrapper):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+            timer.stop()
+
+        # the user of a session cookie is loaded lazily, with a query
+        return self.finish(request, response, timer, await sync_to_async(self.show_header)(request))
+
+    def finish(self, request, response, timer, show_header):
+        if show_header:
+            response['Server-Timing'] = timer.server_timing()
+
+        logger.info(f'{request.method} {request.get_full_path()} {response.status_code} {timer.summary()}')
+        return response
+
+    def show_header(self, request):
+        mode = settings.SERVER_TIMING
+        if mode == 'staff':
+            # DRF sets request.user once it has authenticated the token
+            user = getattr(request, 'user', None)
+            return bool(user and user.is_staff)
+        return mode == 'all'
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.urls import path
-from .views import MovieListCreateView, MovieDetailView, DirectorListCreateView, DirectorDetailView, ActorListCreateView, ActorDetailView
+from .async_views import ASYNC_VIEWS
+from .views import MovieListCreateView, MovieDetailView, MovieBulkCreateView, MovieExportView, DirectorListCreateView, DirectorDetailView, ActorListCreateView, ActorDetailView, CatalogStatsView, SlowQueriesView
+
+def as_view(view):
+    # the ASGI profile serves the read views with their async versions, see movies.async_views
+    if settings.ASYNC_VIEWS:
+        view = ASYNC_VIEWS.get(view, view)
+    return view.as_view()
 
 urlpatterns = [
-    path('movies/', MovieListCreateView.as_view(), name='movies'),
-    path('movies/<int:pk>/', MovieDetailView.as_view(), name='movie-detail'),
-    path('directors/', DirectorListCreateView.as_view(), name='directors'),
-    path('directors/<int:pk>/', DirectorDetailView.as_view(), name='director-detail'),
-    path('actors/', ActorListCreateView.as_view(), name='actors'),
-    path('actors/<int:pk>/', ActorDetailView.as_view(), name='actor-detail')
-]
\ No newline at end of file
+    path('movies/', as_view(MovieListCreateView), name='movies'),
+    path('movies/export/', MovieExportView.as_view(), name='movies-export'),
+    path('movies/bulk/', MovieBulkCreateView.as_view(), name='movies-bulk'),
+    path('movies/<int:pk>/', as_view(MovieDetailView), name='movie-detail'),
+    path('directors/', as_view(DirectorListCreateView), name='directors'),
+    path('directors/<int:pk>/', as_view(DirectorDetailView), name='director-detail'),
+    path('actors/', as_view(ActorListCreateView), name='actors'),
+    path('actors/<int:pk>/', as_view(ActorDetailView), name='actor-detail'),
+    path('stats/', CatalogStatsView.as_view(), name='stats'),
+    path('slow-queries/', SlowQueriesView.as_view(), name='slow-queries'),
+]
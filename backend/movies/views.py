@@ -1,65 +1,263 @@
 import logging
+from django.conf import settings
+from django.db.models import Prefetch
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from rest_framework import generics
 from rest_framework import permissions
+from rest_framework import status
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.core.cache import cache
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
+from .bulk import import_movies
+from .export import EXPORT_FORMATS, async_lines, csv_lines, in_transaction, ndjson_lines
 from .models import Movie, Director, Actor
-from .serializers import MovieSerializer, DirectorSerializer, ActorSerializer
-from .filters import MovieFilter
+from .serializers import (
+    MovieSerializer, MovieBulkItemSerializer, DirectorSerializer, ActorSerializer, CatalogStatsSerializer,
+    SlowQuerySerializer,
+)
+from .filters import MovieFilter, DirectorFilter, ActorFilter, MovieFullTextSearchFilter
+from .pagination import MovieKeysetPagination
+from .stats import catalog_stats
+from . import slow_queries
+from .cache import cache_page_by_generation, movie_namespace
+from .conditional import ConditionalGetMixin, conditional_get
 
 logger = logging.getLogger(__name__)
 
-class MovieListCreateView(generics.ListCreateAPIView):
+# Namespaces each cached page depends on. The generations are bumped from movies.signals on every write.
+# Movie payloads embed directors and actors, and director/actor payloads embed movie titles and counts.
+MOVIE_LIST_NAMESPACES = ('movies', 'directors', 'actors')
+DIRECTOR_LIST_NAMESPACES = ('directors', 'movies')
+ACTOR_LIST_NAMESPACES = ('actors', 'movies')
+
+def movie_detail_namespaces(request, pk, **kwargs):
+    namespaces = (movie_namespace(pk), 'directors', 'actors')
+    # expanded directors and actors embed the names and count of their movies, which change with the other movies
+    expand = {value.strip() for value in request.GET.get('expand', '').split(',')}
+    if expand & set(MovieExpandMixin.expandable):
+        return namespaces + ('movies',)
+    return namespaces
+
+class MovieExpandMixin:
+    """
+    Handles the `fields` and `expand` query params of the movie views (e.g. ?fields=id,title,rating&expand=director).
+    `fields` trims the representation and the columns and relations that are fetched for it. Expanded relations are
+    serialized with their full serializer, fed by a single annotated prefetch per relation, and are always returned.
+    """
+    expandable = ('director', 'actors')
+    # readable fields of MovieSerializer, the relations are the ones that need a join or a prefetch
+    sparse_fields = ('id', 'title', 'year', 'genres', 'rating', 'description', 'poster_url', 'created_at', 'updated_at',
+                     'director_data', 'actors_data')
+    relation_fields = {'director': 'director_data', 'actors': 'actors_data'}
+
+    def get_expand(self):
+        values = self.request.query_params.get('expand', '')
+        return {value.strip() for value in values.split(',') if value.strip() in self.expandable}
+
+    def get_sparse_fields(self):
+        """Requested readable fields, None when all of them are. Writes always work with (and return) every field"""
+        values = self.request.query_params.get('fields', '')
+        if not values.strip() or self.request.method not in permissions.SAFE_METHODS:
+            return None
+
+        fields = {value.strip() for value in values.split(',') if value.strip()}
+        unknown = fields - set(self.sparse_fields)
+        if unknown:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}. '
+                                             f'Available: {", ".join(self.sparse_fields)}'})
+
+        return fields | {'id'} | {self.relation_fields[relation] for relation in self.get_expand()}
+
+    def get_queryset(self):
+        expand = self.get_expand()
+        fields = self.get_sparse_fields()
+
+        if fields is None:
+            # the search document is only used by the database
+            queryset = Movie.objects.defer('search_vector')
+        else:
+            columns = [field for field in fields if field not in self.relation_fields.values()]
+            if 'director_data' in fields:
+                columns.append('director')
+            queryset = Movie.objects.only(*columns)
+
+        if fields is None or 'director_data' in fields:
+            if 'director' in expand:
+                queryset = queryset.prefetch_related(Prefetch('director', queryset=Director.objects.with_movie_stats()))
+            else:
+                queryset = queryset.select_related('director')
+
+        if fields is None or 'actors_data' in fields:
+            if 'actors' in expand:
+                queryset = queryset.prefetch_related(Prefetch('actors', queryset=Actor.objects.with_movie_stats()))
+            else:
+                queryset = queryset.prefetch_related('actors')
+
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        context['fields'] = self.get_sparse_fields()
+        return context
+
+EXPAND_PARAMETER = OpenApiParameter(
+    'expand', str, description='Comma separated relations to return with their full representation: director, actors'
+)
+FIELDS_PARAMETER = OpenApiParameter(
+    'fields', str, description='Comma separated fields to return (e.g. id,title,year,rating,poster_url), all by default'
+)
+
+@extend_schema(parameters=[FIELDS_PARAMETER, EXPAND_PARAMETER])
+class MovieListCreateView(ConditionalGetMixin, MovieExpandMixin, generics.ListCreateAPIView):
     """Allows anyone to list movies and only authenticated users to create, update and delete"""
     serializer_class = MovieSerializer
-    queryset = Movie.objects.select_related('director').prefetch_related('actors').all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filterset_class = MovieFilter
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, MovieFullTextSearchFilter]
+    pagination_class = MovieKeysetPagination
     search_fields = ['title', 'description', 'year', 'director__name', 'actors__name']
+    conditional_namespaces = MOVIE_LIST_NAMESPACES
 
-    @method_decorator(cache_page(60 * 5, key_prefix='movies_list'))
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'movies_list', MOVIE_LIST_NAMESPACES))
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        cache.clear()
-        logger.debug('Cache cleared after movie creation')
         movie = serializer.save()
         logger.info(f"Movie created: '{movie.title}' by user [{self.request.user}]")
 
-class MovieDetailView(generics.RetrieveUpdateDestroyAPIView):
+@extend_schema(parameters=[FIELDS_PARAMETER, EXPAND_PARAMETER])
+class MovieDetailView(ConditionalGetMixin, MovieExpandMixin, generics.RetrieveUpdateDestroyAPIView):
     """Allows anyone to see movie details and only authenticated users to update and delete"""
     serializer_class = MovieSerializer
-    queryset = Movie.objects.select_related('director').prefetch_related('actors').all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    conditional_namespaces = staticmethod(movie_detail_namespaces)
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'movie_detail', movie_detail_namespaces))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_update(self, serializer):
-        cache.clear()
         super().perform_update(serializer)
         logger.info(f"Movie updated: '{serializer.instance.title}' by user [{self.request.user}]")
 
     def perform_destroy(self, instance):
-        cache.clear()
         super().perform_destroy(instance)
         logger.info(f"Movie deleted: '{instance.title}' by {self.request.user}")
 
-class DirectorListCreateView(generics.ListCreateAPIView):
+class MovieBulkCreateView(generics.GenericAPIView):
+    """Allows authenticated users to create many movies in one request. Returns the result of every movie"""
+    serializer_class = MovieBulkItemSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    max_items = 500
+
+    @extend_schema(
+        request=MovieBulkItemSerializer(many=True),
+        responses={
+            201: OpenApiResponse(description='Every movie was created'),
+            207: OpenApiResponse(description='Some movies were created, see the errors of the others'),
+            400: OpenApiResponse(description='No movie was created'),
+        }
+    )
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError('Expected a non empty list of movies')
+
+        if len(items) > self.max_items:
+            raise ValidationError(f'At most {self.max_items} movies can be created per request')
+
+        results = import_movies(items, max_workers=settings.TMDB_BULK_CONCURRENCY)
+        created = sum(1 for result in results if result['status'] == 'created')
+        logger.info(f"Bulk import: {created} of {len(results)} movies created by user [{request.user}]")
+
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({'created': created, 'failed': len(results) - created, 'results': results}, status=response_status)
+
+class MovieExportView(generics.GenericAPIView):
+    """
+    Streams the whole catalog (or the filtered part of it) as NDJSON or CSV. Movies are read with a server side cursor
+    in chunks, each chunk with its own director join and actors prefetch, so memory doesn't grow with the catalog.
+    """
+    serializer_class = MovieSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filterset_class = MovieFilter
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, MovieFullTextSearchFilter]
+    output_query_param = 'output'
+    chunk_size = 500
+
+    def get_queryset(self):
+        return Movie.objects.defer('search_vector').select_related('director').prefetch_related('actors').order_by('id')
+
+    @extend_schema(
+        parameters=[OpenApiParameter('output', str, enum=list(EXPORT_FORMATS), description='Export format, ndjson by default')],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR, (200, 'text/csv'): OpenApiTypes.STR},
+    )
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get(self.output_query_param, 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({self.output_query_param: f'Must be one of: {", ".join(EXPORT_FORMATS)}'})
+
+        movies = self.filter_queryset(self.get_queryset()).iterator(chunk_size=self.chunk_size)
+        if output == 'csv':
+            lines = csv_lines(movies)
+        else:
+            lines = ndjson_lines(movies, self.get_serializer())
+
+        lines = in_transaction(lines)
+        if isinstance(request._request, ASGIRequest):
+            lines = async_lines(lines)
+
+        content_type, filename = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        logger.info(f"Movie export ({output}) started by user [{request.user}]")
+        return response
+
+class DirectorListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     """Allows anyone to list directors and only authenticated users to create"""
     serializer_class = DirectorSerializer
-    queryset = Director.objects.all()
+    queryset = Director.objects.with_movie_stats()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filterset_class = DirectorFilter
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, OrderingFilter]
+    # ?ordering=-movie_count lists the most prolific first
+    ordering_fields = ['movie_count', 'name', 'id']
+    conditional_namespaces = DIRECTOR_LIST_NAMESPACES
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'directors_list', DIRECTOR_LIST_NAMESPACES))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         director = serializer.save()
         logger.info(f"Director created: '{director.name}' by user [{self.request.user}]")
 
-class DirectorDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DirectorDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Allows anyone to see director details and only authenticated users to update and delete"""
     serializer_class = DirectorSerializer
-    queryset = Director.objects.all()
+    queryset = Director.objects.with_movie_stats()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    conditional_namespaces = DIRECTOR_LIST_NAMESPACES
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_destroy(self, instance):
         super().perform_destroy(instance)
@@ -73,21 +271,35 @@ class DirectorDetailView(generics.RetrieveUpdateDestroyAPIView):
     request=ActorSerializer,
     responses=ActorSerializer
 )
-class ActorListCreateView(generics.ListCreateAPIView):
+class ActorListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     """Allows anyone to list actors and only authenticated users to create"""
     serializer_class = ActorSerializer
-    queryset = Actor.objects.all()
+    queryset = Actor.objects.with_movie_stats()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    filterset_class = ActorFilter
+    filter_backends = [*api_settings.DEFAULT_FILTER_BACKENDS, OrderingFilter]
+    ordering_fields = ['movie_count', 'name', 'id']
+    conditional_namespaces = ACTOR_LIST_NAMESPACES
+
+    @conditional_get
+    @method_decorator(cache_page_by_generation(60 * 5, 'actors_list', ACTOR_LIST_NAMESPACES))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         actor = serializer.save()
         logger.info(f"Actor created: '{actor.name}' by user [{self.request.user}]")
 
-class ActorDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ActorDetailView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     """Allows anyone to see actor details and only authenticated user to update and delete"""
     serializer_class = ActorSerializer
-    queryset = Actor.objects.all()
+    queryset = Actor.objects.with_movie_stats()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    conditional_namespaces = ACTOR_LIST_NAMESPACES
+
+    @conditional_get
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     def perform_destroy(self, instance):
         super().perform_destroy(instance)
@@ -95,4 +307,45 @@ class ActorDetailView(generics.RetrieveUpdateDestroyAPIView):
 
     def perform_update(self, serializer):
         super().perform_update(serializer)
-        logger.info(f"Actor updated: '{serializer.instance.name}' by {self.request.user}")
\ No newline at end of file
+        logger.info(f"Actor updated: '{serializer.instance.name}' by {self.request.user}")
+
+class CatalogStatsView(generics.GenericAPIView):
+    """
+    Catalog aggregates: totals, movies and average rating per genre, year and decade, and the directors and actors
+    with the most movies. Read from a materialized view that is refreshed shortly after the writes, not live.
+    """
+    serializer_class = CatalogStatsSerializer
+    permission_classes = [permissions.AllowAny]
+    top_query_param = 'top'
+    max_top = 100
+
+    @extend_schema(parameters=[
+        OpenApiParameter('top', int, description='Number of top directors and actors, 10 by default (at most 100)')
+    ])
+    def get(self, request, *args, **kwargs):
+        try:
+            top = min(int(request.query_params.get(self.top_query_param, 10)), self.max_top)
+        except ValueError:
+            raise ValidationError({self.top_query_param: 'Must be an integer'})
+
+        return Response(self.get_serializer(catalog_stats(top=max(top, 0))).data)
+
+class SlowQueriesView(generics.GenericAPIView):
+    """Staff only: the latest slow queries recorded by movies.slow_queries, newest first. DELETE empties the buffer"""
+    serializer_class = SlowQuerySerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = None
+
+    @extend_schema(parameters=[OpenApiParameter('limit', int, description='Number of entries, all of them by default')])
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', 0))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+
+        return Response(self.get_serializer(slow_queries.recent(max(limit, 0)), many=True).data)
+
+    def delete(self, request, *args, **kwargs):
+        slow_queries.clear()
+        logger.info(f"Slow queries cleared by user [{request.user}]")
+        return Response(status=status.HTTP_204_NO_CONTENT)
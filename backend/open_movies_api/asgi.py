@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'open_movies_api.settings')
+# the read views have async versions, see movies.async_views
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
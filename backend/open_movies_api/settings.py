@@ -36,9 +36,46 @@ SECRET_KEY = env('SECRET_KEY')
 
 TMDB_API_KEY = env('TMDB_API_KEY')
 
+# TMDB client (movies.services.TMDBClient)
+TMDB_BASE_URL = env('TMDB_BASE_URL', default='https://api.themoviedb.org/3')
+TMDB_CONNECT_TIMEOUT = env.float('TMDB_CONNECT_TIMEOUT', default=3.05)
+TMDB_READ_TIMEOUT = env.float('TMDB_READ_TIMEOUT', default=5.0)
+TMDB_MAX_RETRIES = env.int('TMDB_MAX_RETRIES', default=2)
+TMDB_RETRY_BACKOFF = env.float('TMDB_RETRY_BACKOFF', default=0.3)
+# longest Retry-After of a 429 waited for before a retry, TMDB is reported unavailable when it asks for more
+TMDB_MAX_RETRY_AFTER = env.float('TMDB_MAX_RETRY_AFTER', default=5.0)
+TMDB_CIRCUIT_FAILURES = env.int('TMDB_CIRCUIT_FAILURES', default=5)
+TMDB_CIRCUIT_RESET = env.float('TMDB_CIRCUIT_RESET', default=30.0)
+# concurrent TMDB lookups of a bulk movie import
+TMDB_BULK_CONCURRENCY = env.int('TMDB_BULK_CONCURRENCY', default=8)
+# seconds between a write and the refresh of the catalog stats (movies.stats), 0 to only refresh with refresh_stats
+CATALOG_STATS_REFRESH_DELAY = env.int('CATALOG_STATS_REFRESH_DELAY', default=60)
+# TMDB response cache (movies.services.TMDBCache), in seconds
+TMDB_SEARCH_CACHE_TTL = env.int('TMDB_SEARCH_CACHE_TTL', default=60 * 60 * 24)
+TMDB_GENRES_CACHE_TTL = env.int('TMDB_GENRES_CACHE_TTL', default=60 * 60 * 24)
+TMDB_NEGATIVE_CACHE_TTL = env.int('TMDB_NEGATIVE_CACHE_TTL', default=60 * 10)
+TMDB_LOCAL_CACHE_TTL = env.int('TMDB_LOCAL_CACHE_TTL', default=60)
+TMDB_LOCAL_CACHE_SIZE = env.int('TMDB_LOCAL_CACHE_SIZE', default=256)
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = env.bool('DEBUG', default=False)
 
+# Server-Timing header with the db/cache/serialize/tmdb/render time of each response (movies.timing):
+# 'all' responses, 'staff' users only or 'off'. The timings are logged by movies.requests either way
+SERVER_TIMING = env('SERVER_TIMING', default='all' if DEBUG else 'staff')
+# queries slower than this (ms) are kept with their view and parameters (movies.slow_queries), 0 turns it off.
+# A fraction of the slow SELECTs also get an EXPLAIN ANALYZE plan, which runs them once more
+SLOW_QUERY_MS = env.int('SLOW_QUERY_MS', default=500)
+SLOW_QUERY_EXPLAIN_RATE = env.float('SLOW_QUERY_EXPLAIN_RATE', default=0.1)
+SLOW_QUERY_BUFFER_SIZE = env.int('SLOW_QUERY_BUFFER_SIZE', default=200)
+# serve the movie, director and actor lists and details with their async views (movies.async_views). On by default
+# under ASGI (open_movies_api/asgi.py), under WSGI every async view would run in an event loop of its own
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+# /metrics access: the bearer token Prometheus has to send and/or the addresses and networks (CIDR) it can scrape
+# from. With neither, /metrics is only served when DEBUG is on
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=[])
+
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=[])
 
 # Application definition
@@ -50,6 +87,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'drf_spectacular',
@@ -61,9 +99,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its total covers the rest of the stack
+    'movies.timing.ServerTimingMiddleware',
+    'movies.metrics.MetricsMiddleware',
+    'movies.slow_queries.SlowQueryMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, runs async under ASGI
+    'movies.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +124,8 @@ CORS_ALLOWED_ORIGINS = env.list('CORS_ALLOWED_ORIGINS', default=[
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
+    # scraped over the private network, a token has to go over HTTPS
+    SECURE_REDIRECT_EXEMPT = [r'^metrics/$'] if METRICS_ALLOWED_IPS and not METRICS_TOKEN else []
     SECURE_HSTS_SECONDS = 31536000
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
@@ -161,15 +206,24 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Django REST Framework Configuration
+# JSON renderer/parser of the API: orjson (fast) or stdlib (DRF's own)
+API_JSON_BACKEND = env('API_JSON_BACKEND', default='orjson')
+API_JSON_CLASSES = {
+    'orjson': ('movies.renderers.ORJSONRenderer', 'movies.renderers.ORJSONParser'),
+    'stdlib': ('rest_framework.renderers.JSONRenderer', 'rest_framework.parsers.JSONParser'),
+}
+API_JSON_RENDERER, API_JSON_PARSER = API_JSON_CLASSES[API_JSON_BACKEND]
+
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        API_JSON_RENDERER,
+        # the browsable API is only for development
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        API_JSON_PARSER,
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -241,6 +295,16 @@ LOGGING = {
             'handlers': ['file', 'console'],
             'propagate': False
         },
+        'movies.requests': {
+            'level': env('DEBUG_LOG_LEVEL'),
+            'handlers': ['file', 'console'],
+            'propagate': False
+        },
+        'movies.slow_queries': {
+            'level': 'WARNING',
+            'handlers': ['file', 'console'],
+            'propagate': False
+        },
         'movies.auth_views': {
             'level': env('DEBUG_LOG_LEVEL'),
             'handlers': ['file', 'console'],